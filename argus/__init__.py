@@ -2,7 +2,7 @@
 
 from .argus import Argus, register_library_type, VERSION_STORE, TICK_STORE, CHUNK_STORE
 from .store._ndarray_store import NdarrayStore
-from .store._pandas_ndarray_store import PandasDataFrameStore, PandasSeriesStore
+from .store._pandas_ndarray_store import PandasDataFrameStore, PandasSeriesStore, PandasColumnarDataFrameStore
 from .store.version_store import register_versioned_storage, register_version
 
 try:
@@ -21,6 +21,7 @@ else:
     __version_parts__ = int_parts
     __version_numerical__ = num_version
 
+register_versioned_storage(PandasColumnarDataFrameStore)
 register_versioned_storage(PandasDataFrameStore)
 register_versioned_storage(PandasSeriesStore)
 register_versioned_storage(NdarrayStore)
@@ -1,6 +1,13 @@
 import logging
+import multiprocessing
+import threading
+import time
+from collections import deque, OrderedDict
+from functools import lru_cache, partial
 from multiprocessing.pool import ThreadPool
 
+import numpy as np
+
 try:
     from lz4.block import compress as lz4_compress, decompress as lz4_decompress
 
@@ -8,6 +15,11 @@ try:
 except ImportError as e:
     from lz4 import compress as lz4_compress, compressHC as lz4_compressHC, decompress as lz4_decompress
 
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
 # ENABLE_PARALLEL mutated in global_scope. Do not remove.
 from ._config import (
     LZ4_HIGH_COMPRESSION,
@@ -15,13 +27,23 @@ from ._config import (
     LZ4_N_PARALLEL,
     LZ4_MINSZ_PARALLEL,
     BENCHMARK_MODE,
-    ENABLE_PARALLEL
+    ENABLE_PARALLEL,
+    ARGUS_ADAPTIVE_CODECS,
+    ARGUS_ADAPTIVE_MIN_THROUGHPUT,
+    ARGUS_ADAPTIVE_SAMPLE_SIZE,
+    ARGUS_COMPRESSION_BACKEND,
+    ARGUS_COMPRESSION_PROCESSES,
 )  # noqa # pylint: disable=unused-import
 
 logger = logging.getLogger(__name__)
 
 _compress_thread_pool = None
+_compress_process_pool = None
+# Marks the threads running a parallel_map job, whose compression must not be dispatched to the pool again
+_pool_worker = threading.local()
 ENABLE_PARALLEL = ENABLE_PARALLEL
+COMPRESSION_BACKENDS = ("thread", "process")
+COMPRESSION_BACKEND = ARGUS_COMPRESSION_BACKEND
 
 
 def enable_parallel_lz4(mode):
@@ -63,7 +85,344 @@ def set_compression_pool_size(pool_size):
     _compress_thread_pool = ThreadPool(pool_size)
 
 
-def compress_array(str_list, withHC=LZ4_HIGH_COMPRESSION):
+def _get_compress_thread_pool():
+    global _compress_thread_pool
+    if _compress_thread_pool is None:
+        _compress_thread_pool = ThreadPool(LZ4_WORKERS)
+    return _compress_thread_pool
+
+
+def _in_pool_worker(func, arg):
+    _pool_worker.active = True
+    try:
+        return func(arg)
+    finally:
+        _pool_worker.active = False
+
+
+def parallel_map(func, items):
+    """
+    Map func over items in the compression thread pool (serially when parallel compression is disabled).
+    The compression done by func runs in its worker thread, rather than being dispatched to the pool again.
+    """
+    if not ENABLE_PARALLEL or len(items) < 2 or getattr(_pool_worker, "active", False):
+        return [func(x) for x in items]
+    return _get_compress_thread_pool().map(partial(_in_pool_worker, func), items)
+
+
+def parallel_imap(func, items, window=None, pool=None):
+    """
+    Lazily map func over the iterable items in the compression thread pool (or the given pool), in order.
+    At most window jobs (default: twice the pool size) are in flight, so only that many items and results
+    are held in memory at once and items can be produced while the earlier ones are being processed.
+    """
+    if pool is None:
+        if not ENABLE_PARALLEL or getattr(_pool_worker, "active", False):
+            for item in items:
+                yield func(item)
+            return
+        pool = _get_compress_thread_pool()
+    window = window or 2 * pool._processes
+    pending = deque()
+    for item in items:
+        pending.append(pool.apply_async(_in_pool_worker, (func, item)))
+        if len(pending) >= window:
+            yield pending.popleft().get()
+    while pending:
+        yield pending.popleft().get()
+
+
+def read_ahead(func, items, depth, pool):
+    """
+    Lazily map func over the iterable items in pool, in order. func is applied to up to depth items ahead of the
+    result being consumed (as each result is consumed, with depth < 1). The items not started yet are skipped once
+    the consumer stops iterating.
+    """
+    if depth < 1:
+        for item in items:
+            yield func(item)
+        return
+    stop = threading.Event()
+
+    def _apply(item):
+        return None if stop.is_set() else func(item)
+
+    pending = deque()
+    try:
+        for item in items:
+            pending.append(pool.apply_async(_apply, (item,)))
+            if len(pending) > depth:
+                yield pending.popleft().get()
+        while pending:
+            yield pending.popleft().get()
+    finally:
+        # the consumer is gone (or done): leave the items queued for it
+        stop.set()
+
+
+def set_compression_backend(backend, pool_size=None):
+    """
+    Set how NdarrayStore writes compress their segments (see ARGUS_COMPRESSION_BACKEND)
+
+    Parameters
+    ----------
+        backend: `str`
+            "thread": compress in the thread pool. "process": slice, compress and checksum the segments in a pool
+            of worker processes.
+        pool_size: `int` or `None`
+            The size of the process pool, defaults to ARGUS_COMPRESSION_PROCESSES. An existing pool is shut down
+            (after its jobs have finished) when the size changes.
+    """
+    if backend not in COMPRESSION_BACKENDS:
+        raise ValueError(f"Unknown compression backend {backend!r}, expected one of {COMPRESSION_BACKENDS}")
+
+    global COMPRESSION_BACKEND, ARGUS_COMPRESSION_PROCESSES, _compress_process_pool
+    if pool_size is not None:
+        pool_size = int(pool_size)
+        if pool_size < 1:
+            raise ValueError(f"The compression process pool size cannot be of size {pool_size}")
+        if pool_size != ARGUS_COMPRESSION_PROCESSES and _compress_process_pool is not None:
+            _compress_process_pool.close()
+            _compress_process_pool.join()
+            _compress_process_pool = None
+        ARGUS_COMPRESSION_PROCESSES = pool_size
+    COMPRESSION_BACKEND = backend
+    logger.info(f"Setting the compression backend to {backend}")
+
+
+def _get_compress_process_pool():
+    global _compress_process_pool
+    if _compress_process_pool is None:
+        # Not forked: the parent may be running threads (e.g. the compression thread pool)
+        _compress_process_pool = multiprocessing.get_context("spawn").Pool(ARGUS_COMPRESSION_PROCESSES)
+    return _compress_process_pool
+
+
+# ---------------------------
+# Codecs
+# ---------------------------
+# A codec spec is "<name>[:<level>][+shuffle]", e.g. "lz4", "lz4hc:12" or "zstd:9+shuffle". The spec is stored alongside
+# the data it compressed. The shuffle filter transposes the bytes of fixed size elements (so that all the first bytes
+# come first, then all the second bytes, ...) before compressing; the element size is not part of the spec, it is the
+# itemsize of the dtype the data is stored with.
+SHUFFLE = "shuffle"
+
+_CODECS = {}
+
+
+def register_codec(name, compressor, decompressor):
+    """
+    Register a codec which can then be used in codec specs
+
+    Parameters
+    ----------
+        name: `str`
+            The name of the codec
+        compressor: `callable`
+            compressor(data, level) -> bytes. level is None when the spec doesn't give one.
+        decompressor: `callable`
+            decompressor(data) -> bytes
+    """
+    if not name or ":" in name or "+" in name:
+        raise ValueError(f"Invalid codec name: {name!r}")
+    _CODECS[name] = (compressor, decompressor)
+    _parse_codec.cache_clear()
+
+
+@lru_cache(maxsize=None)
+def _parse_codec(codec):
+    name, _, filter_ = codec.partition("+")
+    name, _, level = name.partition(":")
+    if name not in _CODECS:
+        hint = " (requires the zstandard package)" if name == "zstd" else ""
+        raise ValueError(f"Unknown compression codec {name!r}{hint}")
+    if filter_ not in ("", SHUFFLE):
+        raise ValueError(f"Unknown compression filter {filter_!r}")
+    return name, int(level) if level else None, filter_ == SHUFFLE
+
+
+def check_codec(codec):
+    """
+    Validate a codec spec, raising ValueError if it isn't usable here
+
+    Parameters
+    ----------
+        codec: `str`
+            The codec spec, e.g. "zstd:9+shuffle", or "auto[:<MB/s>]" for adaptive compression
+
+    Returns
+    -------
+    `str`
+    The codec spec.
+    """
+    if not isinstance(codec, str):
+        raise ValueError(f"Codec spec must be a string, got {codec!r}")
+    if is_adaptive(codec):
+        _adaptive_target(codec)
+    else:
+        _parse_codec(codec)
+    return codec
+
+
+def _shuffle(data, typesize):
+    arr = np.frombuffer(data, dtype=np.uint8)
+    n = len(arr) - len(arr) % typesize
+    return arr[:n].reshape(-1, typesize).T.tobytes() + arr[n:].tobytes()
+
+
+def _unshuffle(data, typesize):
+    arr = np.frombuffer(data, dtype=np.uint8)
+    n = len(arr) - len(arr) % typesize
+    return arr[:n].reshape(typesize, -1).T.tobytes() + arr[n:].tobytes()
+
+
+def _lz4hc_compress(data, level):
+    if level is None:
+        return lz4_compressHC(data)
+    return lz4_compress(data, mode="high_compression", compression=level)
+
+
+register_codec("lz4", lambda data, level: lz4_compress(data), lz4_decompress)
+register_codec("lz4hc", _lz4hc_compress, lz4_decompress)
+if zstandard is not None:
+    # The (de)compression contexts are not thread-safe, so make one per call
+    register_codec(
+        "zstd",
+        lambda data, level: zstandard.ZstdCompressor(level=3 if level is None else level).compress(data),
+        lambda data: zstandard.ZstdDecompressor().decompress(data),
+    )
+
+
+# ---------------------------
+# Adaptive compression
+# ---------------------------
+ADAPTIVE = "auto"
+
+_DEFAULT_ADAPTIVE_CODECS = (
+    "lz4",
+    "lz4+shuffle",
+    "lz4hc:4+shuffle",
+    "lz4hc:9",
+    "lz4hc:9+shuffle",
+    "zstd:1+shuffle",
+    "zstd:3",
+    "zstd:3+shuffle",
+    "zstd:9+shuffle",
+    "zstd:15+shuffle",
+)
+
+# Decisions of select_codec, by caller supplied key
+_adaptive_choices = OrderedDict()
+_ADAPTIVE_CHOICES_SIZE = 4096
+
+
+def is_adaptive(codec):
+    """
+    Whether the codec spec asks for adaptive compression, i.e. the codec is to be chosen with select_codec
+    """
+    return isinstance(codec, str) and codec.partition(":")[0] == ADAPTIVE
+
+
+def _adaptive_target(codec):
+    """The minimum throughput (MB/s per core) of the adaptive codec spec"""
+    target = codec.partition(":")[2]
+    try:
+        return float(target) if target else float(ARGUS_ADAPTIVE_MIN_THROUGHPUT)
+    except ValueError:
+        raise ValueError(f"Invalid adaptive compression target {target!r} in {codec!r}")
+
+
+def _adaptive_candidates():
+    codecs = ARGUS_ADAPTIVE_CODECS.split(",") if ARGUS_ADAPTIVE_CODECS else _DEFAULT_ADAPTIVE_CODECS
+    return [c.strip() for c in codecs if c.strip().partition("+")[0].partition(":")[0] in _CODECS]
+
+
+def _measure(codec, samples, min_time=0.002, max_runs=10):
+    """Compressed size and compression throughput (MB/s) of codec on the samples"""
+    nbytes = sum(len(data) for data, _ in samples)
+    runs, elapsed = 0, 0.0
+    while runs == 0 or (elapsed < min_time and runs < max_runs):
+        start = time.perf_counter()
+        size = sum(len(compress(data, codec, typesize)) for data, typesize in samples)
+        elapsed += time.perf_counter() - start
+        runs += 1
+    return size, nbytes * runs / max(elapsed, 1e-9) / 1e6
+
+
+def array_samples(arrays):
+    """
+    Samples of the leading rows of the arrays, for select_codec. Arrays with objects are skipped.
+
+    Parameters
+    ----------
+        arrays: `list[numpy.ndarray]`
+            The arrays (e.g. columns) of the data which is going to be compressed.
+
+    Returns
+    -------
+    `list[tuple[bytes, int]]`
+    (data, typesize) of each sample.
+    """
+    arrays = [a for a in arrays if not a.dtype.hasobject and len(a)]
+    row_size = sum(a[:1].nbytes for a in arrays)
+    if not row_size:
+        return []
+    rows = max(1, ARGUS_ADAPTIVE_SAMPLE_SIZE // row_size)
+    return [(np.ascontiguousarray(a[:rows]).tobytes(), a.dtype.itemsize) for a in arrays]
+
+
+def select_codec(codec, samples, key=None):
+    """
+    Resolve an adaptive codec spec: measure the ratio and throughput of the candidate codecs on samples of the data,
+    and pick the best ratio among the codecs that meet the throughput target (the fastest if none does).
+
+    Parameters
+    ----------
+        codec: `str` or `None`
+            The codec spec. Anything but an adaptive spec is returned unchanged.
+        samples: `list[tuple[bytes, int]]` or `callable`
+            (data, typesize) samples, see array_samples. May be a function returning them, which is
+            only called when the codecs need to be measured.
+        key: hashable or `None`
+            Cache the decision under this key (e.g. library, symbol and dtype), so it's only measured once.
+
+    Returns
+    -------
+    `tuple[str, dict]`
+    The codec spec to use (None for the default LZ4), and the measurements it was chosen on
+    (None unless adaptive).
+    """
+    if not is_adaptive(codec):
+        return codec, None
+    if key is not None and (key, codec) in _adaptive_choices:
+        _adaptive_choices.move_to_end((key, codec))
+        return _adaptive_choices[(key, codec)]
+
+    target = _adaptive_target(codec)
+    samples = samples() if callable(samples) else samples
+    nbytes = sum(len(data) for data, _ in samples)
+    if not nbytes:
+        return None, None
+
+    results = []
+    for candidate in _adaptive_candidates():
+        size, throughput = _measure(candidate, samples)
+        results.append((candidate, nbytes / max(size, 1), throughput))
+    if not results:
+        raise ValueError(f"No usable codecs for adaptive compression in {ARGUS_ADAPTIVE_CODECS!r}")
+    eligible = [r for r in results if r[2] >= target] or [max(results, key=lambda r: r[2])]
+    chosen, ratio, throughput = max(eligible, key=lambda r: r[1])
+    stats = {"codec": chosen, "adaptive": codec, "ratio": round(ratio, 3), "throughput": round(throughput, 1)}
+    logger.debug(f"Adaptive compression chose {chosen} for {key}: {stats}")
+
+    if key is not None:
+        _adaptive_choices[(key, codec)] = chosen, stats
+        while len(_adaptive_choices) > _ADAPTIVE_CHOICES_SIZE:
+            _adaptive_choices.popitem(last=False)
+    return chosen, stats
+
+
+def compress_array(str_list, withHC=LZ4_HIGH_COMPRESSION, codec=None, typesize=1):
     """
     Compress an array of strings
 
@@ -72,41 +431,64 @@ def compress_array(str_list, withHC=LZ4_HIGH_COMPRESSION):
         str_list: `list[str]`
             The input list of strings which need to be compressed.
         withHC: `bool`
-            This flag controls whether lz4HC will be used.
+            This flag controls whether lz4HC will be used. Ignored if a codec is given.
+        codec: `str` or `None`
+            The codec spec to compress with, defaults to LZ4 (see `withHC`).
+        typesize: `int` or `list[int]`
+            The element size used by the shuffle filter, or one per string.
 
     Returns
     -------
     `list[str`
     The list of the compressed strings.
     """
-    global _compress_thread_pool
-
     if not str_list:
         return str_list
 
-    do_compress = lz4_compressHC if withHC else lz4_compress
+    # The typesizes only matter to the codecs: LZ4 doesn't shuffle
+    paired = codec is not None and isinstance(typesize, (list, tuple))
+    if paired:
+        str_list = list(zip(str_list, typesize))
+        do_compress = lambda args: compress(args[0], codec, args[1])
+    elif codec is not None:
+        do_compress = partial(compress, codec=codec, typesize=typesize)
+    else:
+        do_compress = lz4_compressHC if withHC else lz4_compress
 
     def can_parallelize_strlist(strlist):
-        return len(strlist) > LZ4_N_PARALLEL and len(strlist[0]) > LZ4_MINSZ_PARALLEL
+        first = strlist[0][0] if paired else strlist[0]
+        return len(strlist) > LZ4_N_PARALLEL and len(first) > LZ4_MINSZ_PARALLEL
 
-    use_parallel = (ENABLE_PARALLEL and withHC) or can_parallelize_strlist(str_list)
+    use_parallel = (ENABLE_PARALLEL and (withHC or codec is not None)) or can_parallelize_strlist(str_list)
 
-    if BENCHMARK_MODE or use_parallel:
-        if _compress_thread_pool is None:
-            _compress_thread_pool = ThreadPool(LZ4_WORKERS)
-        return _compress_thread_pool.map(do_compress, str_list)
+    if (BENCHMARK_MODE or use_parallel) and not getattr(_pool_worker, "active", False):
+        return _get_compress_thread_pool().map(do_compress, str_list)
 
     return [do_compress(s) for s in str_list]
 
 
-def compress(_str):
+def compress(_str, codec=None, typesize=1):
     """
     Compress a string
 
     By default LZ4 mode is standard in interactive mode,
     and high compresion in applications/scripts
+
+    Parameters
+    ----------
+        _str: `bytes`
+            The data to compress.
+        codec: `str` or `None`
+            The codec spec to compress with, defaults to LZ4.
+        typesize: `int`
+            The element size used by the shuffle filter.
     """
-    return lz4_compress(_str)
+    if codec is None:
+        return lz4_compress(_str)
+    name, level, shuffle = _parse_codec(codec)
+    if shuffle and typesize > 1:
+        _str = _shuffle(_str, typesize)
+    return _CODECS[name][0](_str, level)
 
 
 def compressHC(_str):
@@ -123,25 +505,105 @@ def compressHC_array(str_list):
     return compress_array(str_list, withHC=True)
 
 
-def decompress(_str):
+def decompress(_str, codec=None, typesize=1):
     """
     Decompress a string
+
+    Parameters
+    ----------
+        _str: `bytes`
+            The compressed data.
+        codec: `str` or `None`
+            The codec spec the data was compressed with, defaults to LZ4.
+        typesize: `int`
+            The element size used by the shuffle filter.
     """
-    return lz4_decompress(_str)
+    if codec is None:
+        return lz4_decompress(_str)
+    name, _, shuffle = _parse_codec(codec)
+    data = _CODECS[name][1](_str)
+    if shuffle and typesize > 1:
+        data = _unshuffle(data, typesize)
+    return data
 
 
-def decompress_array(str_list):
+def decompress_array(str_list, codec=None, typesize=1):
     """
     Decompress a list of strings
     """
-    global _compress_thread_pool
-
     if not str_list:
         return str_list
 
-    if not ENABLE_PARALLEL or len(str_list) <= LZ4_N_PARALLEL:
-        return [lz4_decompress(chunk) for chunk in str_list]
+    do_decompress = lz4_decompress if codec is None else partial(decompress, codec=codec, typesize=typesize)
 
-    if _compress_thread_pool is None:
-        _compress_thread_pool = ThreadPool(LZ4_WORKERS)
-    return _compress_thread_pool.map(lz4_decompress, str_list)
+    if not ENABLE_PARALLEL or len(str_list) <= LZ4_N_PARALLEL or getattr(_pool_worker, "active", False):
+        return [do_decompress(chunk) for chunk in str_list]
+
+    return _get_compress_thread_pool().map(do_decompress, str_list)
+
+
+def _decompress_chunk_into(dest, _str, compressed, codec, decompressor):
+    if not compressed:
+        data = _str
+    elif codec is None:
+        data = decompressor(_str)
+    else:
+        data = decompressor(_str, codec, dest.dtype.itemsize)
+    if len(data) != dest.nbytes:
+        raise ValueError(f"Chunk has {len(data)} bytes, expected {dest.nbytes}")
+    dest[...] = np.frombuffer(data, dtype=dest.dtype).reshape(dest.shape)
+
+
+def decompress_into(chunks, n_chunks=None, decompressor=None):
+    """
+    Decompress a stream of chunks straight into their slots of preallocated output arrays.
+
+    The chunks iterable is consumed lazily, and at most a few chunks per worker are kept in flight,
+    so the compressed data never needs to be held in memory all at once.
+
+    Parameters
+    ----------
+        chunks: `iterable[tuple[numpy.ndarray, bytes, bool, str]]`
+            (dest, data, compressed, codec) for each chunk. dest is the writable array (or view, possibly strided)
+            the decompressed bytes are copied into, compressed is False for chunks which are stored raw, and codec
+            is the codec spec of the chunk (None for LZ4). The itemsize of dest is the element size for the shuffle
+            filter.
+        n_chunks: `int` or `None`
+            Hint for the number of chunks, used to decide whether to decompress in parallel.
+        decompressor: `callable` or `None`
+            Function used to decompress a single chunk, defaults to `decompress`.
+
+    Returns
+    -------
+    `int`
+    The number of chunks decompressed.
+    """
+    decompressor = decompressor or decompress
+    use_parallel = (
+        ENABLE_PARALLEL and (n_chunks is None or n_chunks > LZ4_N_PARALLEL) and not getattr(_pool_worker, "active", False)
+    )
+
+    if not use_parallel:
+        count = 0
+        for dest, _str, compressed, codec in chunks:
+            _decompress_chunk_into(dest, _str, compressed, codec, decompressor)
+            count += 1
+        return count
+
+    pool = _get_compress_thread_pool()
+    max_in_flight = 2 * int(LZ4_WORKERS)
+    pending = deque()
+    count = 0
+    try:
+        for dest, _str, compressed, codec in chunks:
+            pending.append(pool.apply_async(_decompress_chunk_into, (dest, _str, compressed, codec, decompressor)))
+            count += 1
+            if len(pending) >= max_in_flight:
+                pending.popleft().get()
+        while pending:
+            pending.popleft().get()
+    finally:
+        # Never leave workers writing into the buffers after we return (e.g. on error)
+        for result in pending:
+            result.wait()
+    return count
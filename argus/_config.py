@@ -12,12 +12,71 @@ logger = logging.getLogger(__name__)
 # Controls is the write handler can only match handlers for the specific data type. No fallback to pickling if True.
 STRICT_WRITE_HANDLER_MATCH = bool(os.environ.get("STRICT_WRITE_HANDLER_MATCH"))
 
+# Default for libraries without the COLUMNAR_SEGMENTS metadata: write DataFrames with the column-oriented segment layout
+ARGUS_COLUMNAR_SEGMENTS = bool(os.environ.get("ARGUS_COLUMNAR_SEGMENTS"))
+
+# Each VersionStore keeps up to ARGUS_VERSION_CACHE_SIZE of the version documents it reads in an LRU cache
+# (0, the default, disables it). A cached document is used as is for ARGUS_VERSION_CACHE_TTL seconds, then only once
+# a covered index query has checked that it's still the latest version (or still exists). Writes through the
+# VersionStore invalidate its cached documents.
+ARGUS_VERSION_CACHE_SIZE = int(os.environ.get("ARGUS_VERSION_CACHE_SIZE", 0))
+ARGUS_VERSION_CACHE_TTL = float(os.environ.get("ARGUS_VERSION_CACHE_TTL", 1))
+
+# Writes and appends leave the pruning of the previous versions to a background thread (rather than pruning them before
+# inserting the new version). It coalesces the requests for a symbol, and prunes up to ARGUS_PRUNE_BATCH_SYMBOLS symbols
+# of a library at a time, also in VersionStore.prune_all.
+ARGUS_ASYNC_PRUNE = bool(os.environ.get("ARGUS_ASYNC_PRUNE"))
+ARGUS_PRUNE_BATCH_SYMBOLS = int(os.environ.get("ARGUS_PRUNE_BATCH_SYMBOLS", 100))
+
 # -----------------------------
 # NdArrayStore configuration
 # -----------------------------
 # Extra sanity checks for corruption during appends. Introduces a 5-7% performance hit (off by default)
 CHECK_CORRUPTION_ON_APPEND = bool(os.environ.get("CHECK_CORRUPTION_ON_APPEND"))
 
+# Writes send the compressed segments to MongoDB in bulk writes of about ARGUS_WRITE_BATCH_SIZE bytes while the next
+# segments are being compressed, with at most ARGUS_WRITE_IN_FLIGHT bulk writes in flight (0 sends them synchronously).
+# A write holds at most about ARGUS_WRITE_IN_FLIGHT + 1 batches of compressed data.
+ARGUS_WRITE_BATCH_SIZE = int(float(os.environ.get("ARGUS_WRITE_BATCH_SIZE", 16 * 1024 ** 2)))  # 16 MB
+ARGUS_WRITE_IN_FLIGHT = int(os.environ.get("ARGUS_WRITE_IN_FLIGHT", 2))
+
+# Pandas objects at least this large (in memory) are written and appended incrementally: serialized, compressed and
+# written a chunk at a time, so only a few chunks are held in memory rather than whole serialized copies of the data
+ARGUS_STREAMING_WRITE_MIN_SIZE = int(float(os.environ.get("ARGUS_STREAMING_WRITE_MIN_SIZE", 256 * 1024 ** 2)))  # 256 MB
+
+# Reads keep the segments they fetch in a content-addressed cache, under the ARGUS_SEGMENT_CACHE_DIR directory on local
+# disk, and read the segments found there from it rather than from MongoDB. Unset (the default) disables the cache.
+# The least recently used segments are evicted once the cache takes more than ARGUS_SEGMENT_CACHE_SIZE bytes.
+ARGUS_SEGMENT_CACHE_DIR = os.environ.get("ARGUS_SEGMENT_CACHE_DIR")
+ARGUS_SEGMENT_CACHE_SIZE = int(float(os.environ.get("ARGUS_SEGMENT_CACHE_SIZE", 10 * 1024 ** 3)))  # 10 GB
+
+# VersionStore.batch_read fetches the segments of this many symbols at a time, in one query (per segment layout/data)
+ARGUS_BATCH_READ_SYMBOLS = int(os.environ.get("ARGUS_BATCH_READ_SYMBOLS", 100))
+
+# VersionStore.iterator yields batches of whole segments, of at least this many rows (but the last batch)
+ARGUS_ITERATOR_ROWS_PER_BATCH = int(os.environ.get("ARGUS_ITERATOR_ROWS_PER_BATCH", 100000))
+# ... and fetches and decompresses this many batches ahead of the one being consumed, in background threads
+ARGUS_ITERATOR_READ_AHEAD = int(os.environ.get("ARGUS_ITERATOR_READ_AHEAD", 1))
+
+# -----------------------------
+# ChunkStore configuration
+# -----------------------------
+# ChunkStore reads fetch the metadata of the chunks in one query, in a pool of this many background threads, while the
+# segments are read
+ARGUS_CHUNKSTORE_READ_THREADS = int(os.environ.get("ARGUS_CHUNKSTORE_READ_THREADS", 4))
+
+# Default for libraries without the COLUMNAR_CHUNKS metadata: write each column of a chunk to its own segments, so reads
+# of some of the columns only fetch theirs
+ARGUS_CHUNKSTORE_COLUMNAR = bool(os.environ.get("ARGUS_CHUNKSTORE_COLUMNAR"))
+
+# ChunkStore appends of data after the end of a chunk's data write it as a new part of the chunk (rather than reading
+# and rewriting the chunk), until the chunk has this many parts
+ARGUS_CHUNKSTORE_MAX_PARTS = int(os.environ.get("ARGUS_CHUNKSTORE_MAX_PARTS", 16))
+
+# ChunkStore.iterator and reverse_iterator fetch and deserialize up to this many chunks ahead of the one being consumed,
+# in a background thread (0 reads them as they are consumed)
+ARGUS_CHUNKSTORE_READ_AHEAD = int(os.environ.get("ARGUS_CHUNKSTORE_READ_AHEAD", 2))
+
 # -----------------------------
 # Serialization configuration
 # -----------------------------
@@ -64,13 +123,32 @@ LZ4_HIGH_COMPRESSION = bool(os.environ.get("LZ4_HIGH_COMPRESSION"))
 #     argus/benchmarks/lz4_tuning/README.txt
 # The size of the compression thread pool.
 # Rule of thumb: use 2 for non HC (VersionStore/NDarrayStore/PandasStore, and 8 for HC (TickStore).
-LZ4_WORKERS = os.environ.get("LZ4_WORKERS", 2)
+LZ4_WORKERS = int(os.environ.get("LZ4_WORKERS", 2))
 
 # The minimum required number of chunks to use parallel compression
-LZ4_N_PARALLEL = os.environ.get("LZ4_N_PARALLEL", 16)
+LZ4_N_PARALLEL = int(os.environ.get("LZ4_N_PARALLEL", 16))
 
 # Minimum data size to use parallel compression
-LZ4_MINSZ_PARALLEL = os.environ.get("LZ4_MINSZ_PARALLEL", 0.5 * 1024 ** 2)  # 0.5 MB
+LZ4_MINSZ_PARALLEL = int(float(os.environ.get("LZ4_MINSZ_PARALLEL", 0.5 * 1024 ** 2)))  # 0.5 MB
+
+# How NdarrayStore writes compress their segments: "thread" uses the LZ4_WORKERS thread pool for the compression only,
+# "process" slices, compresses and checksums each segment in a pool of worker processes, which read the data from
+# shared memory. The process backend also spreads the work which holds the GIL, so large writes scale with the cores.
+ARGUS_COMPRESSION_BACKEND = os.environ.get("ARGUS_COMPRESSION_BACKEND", "thread")
+
+# The size of the compression process pool (defaults to the number of CPUs)
+ARGUS_COMPRESSION_PROCESSES = int(os.environ.get("ARGUS_COMPRESSION_PROCESSES", 0)) or os.cpu_count()
+
+# Default codec spec (see argus._compression) for libraries without the COMPRESSION metadata, e.g. "zstd:9+shuffle".
+# Unset means plain LZ4. "auto" (or "auto:<MB/s>") enables adaptive compression, see below.
+ARGUS_COMPRESSION = os.environ.get("ARGUS_COMPRESSION")
+
+# Adaptive compression probes the candidate codecs (comma separated specs, defaults to a built-in list of LZ4, LZ4HC
+# and zstd settings) on a sample from the start of a write, and picks the best ratio among those which compress at
+# least ARGUS_ADAPTIVE_MIN_THROUGHPUT MB/s on one core (the fastest if none does). The choice is kept for the symbol.
+ARGUS_ADAPTIVE_CODECS = os.environ.get("ARGUS_ADAPTIVE_CODECS")
+ARGUS_ADAPTIVE_MIN_THROUGHPUT = float(os.environ.get("ARGUS_ADAPTIVE_MIN_THROUGHPUT", 500))
+ARGUS_ADAPTIVE_SAMPLE_SIZE = int(os.environ.get("ARGUS_ADAPTIVE_SAMPLE_SIZE", 1024 ** 2))  # 1 MB
 
 # Enable this when you run the benchmark_lz4.py
 BENCHMARK_MODE = False
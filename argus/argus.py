@@ -11,7 +11,8 @@ from pymongo.errors import OperationFailure, AutoReconnect
 from six import string_types
 
 from ._cache import Cache
-from ._config import ENABLE_CACHE
+from ._compression import check_codec
+from ._config import ENABLE_CACHE, ARGUS_COMPRESSION
 from ._util import indent
 from .auth import authenticate, get_auth
 from .chunkstore import chunkstore
@@ -500,9 +501,11 @@ class ArgusLibraryBinding:
     DB_PREFIX = Argus.DB_PREFIX
     TYPE_FIELD = "TYPE"
     QUOTA = "QUOTA"
+    COMPRESSION = "COMPRESSION"
 
     quota = None
     quota_countdown = 0
+    compression = None
 
     @classmethod
     def _parse_db_lib(cls, library):
@@ -660,6 +663,25 @@ class ArgusLibraryBinding:
         except Exception as e:
             logger.warning(f"Encountered an exception while calculating quota statistics: {str(e)}")
 
+    def set_compression(self, codec):
+        """
+        Set the codec new data in this library is compressed with, e.g. "lz4", "lz4hc:12", "zstd:9+shuffle"
+        (see argus._compression). Existing data keeps the codec it was written with.
+
+        None resets the library to the default (the ARGUS_COMPRESSION environment variable, or LZ4)
+        """
+        self.set_library_metadata(ArgusLibraryBinding.COMPRESSION, codec)
+
+    def get_compression(self):
+        """
+        Get the codec spec new data in this library is compressed with, None for the default LZ4.
+        """
+        if self.compression is None:
+            self.compression = (
+                self.get_library_metadata(ArgusLibraryBinding.COMPRESSION) or ARGUS_COMPRESSION or ""
+            )
+        return self.compression or None
+
     def get_library_type(self):
         return self.get_library_metadata(ArgusLibraryBinding.TYPE_FIELD)
 
@@ -676,6 +698,10 @@ class ArgusLibraryBinding:
 
     @mongo_retry
     def set_library_metadata(self, field, value):
+        if field == ArgusLibraryBinding.COMPRESSION:
+            if value is not None:
+                check_codec(value)
+            self.compression = None
         self._library_coll[self.argus.METADATA_COLL].update_one(
             {"_id": self.argus.METADATA_DOC_ID}, {"$set": {field: value}}, upsert=True
         )
@@ -1,19 +1,29 @@
 import hashlib
 import logging
 from collections import defaultdict
+from datetime import timedelta
 from itertools import groupby
+from multiprocessing.pool import ThreadPool
 
+import numpy as np
 import pymongo
 from bson.binary import Binary
-from pandas import DataFrame, Series
+from pandas import DataFrame, Series, Timestamp
 from pymongo.errors import OperationFailure
 
 from .date_chunker import DateChunker, START, END
 from .passthrough_chunker import PassthroughChunker
+from .._compression import array_samples, is_adaptive, read_ahead, select_codec
+from .._config import (
+    ARGUS_CHUNKSTORE_COLUMNAR,
+    ARGUS_CHUNKSTORE_MAX_PARTS,
+    ARGUS_CHUNKSTORE_READ_AHEAD,
+    ARGUS_CHUNKSTORE_READ_THREADS,
+)
 from .._util import indent, mongo_count, enable_sharding
 from ..decorators import mongo_retry
 from ..exceptions import NoDataFoundException
-from ..serialization.numpy_arrays import FrametoArraySerializer, DATA, METADATA, COLUMNS
+from ..serialization.numpy_arrays import FrametoArraySerializer, DATA, METADATA, COLUMNS, CODEC, INDEX, LENGTHS, TYPE
 
 logger = logging.getLogger(__name__)
 
@@ -28,6 +38,11 @@ LEN = "l"
 SERIALIZER = "se"
 CHUNKER = "ch"
 USERMETA = "u"
+COMPRESSION = "cp"
+COLUMN = "cl"
+INDEX_COLUMN = "ic"
+PARTS = "pa"
+LAST_DATE = "ld"
 
 MAX_CHUNK_SIZE = 15 * 1024 * 1024
 
@@ -35,10 +50,158 @@ SER_MAP = {FrametoArraySerializer.TYPE: FrametoArraySerializer()}
 
 CHUNKER_MAP = {DateChunker.TYPE: DateChunker(), PassthroughChunker.TYPE: PassthroughChunker()}
 
+_metadata_reader_pool = None
+_chunk_reader_pool = None
+
+
+def _get_metadata_reader_pool():
+    global _metadata_reader_pool
+    if _metadata_reader_pool is None:
+        _metadata_reader_pool = ThreadPool(ARGUS_CHUNKSTORE_READ_THREADS)
+    return _metadata_reader_pool
+
+
+def _get_chunk_reader_pool():
+    global _chunk_reader_pool
+    if _chunk_reader_pool is None:
+        _chunk_reader_pool = ThreadPool(max(ARGUS_CHUNKSTORE_READ_AHEAD, 1))
+    return _chunk_reader_pool
+
+
+def _segments(data, columnar):
+    """
+    The (data, column) of each segment of a serialized chunk. With the columnar layout, each segment holds (a piece
+    of) a single column, so that reads of some of the columns only fetch their segments. Otherwise column is None.
+
+    Either way, the data of the segments joined in order is the data of the chunk.
+    """
+    meta = data[METADATA]
+    if not columnar or not meta.get(COLUMNS):
+        for i in range(int(len(data[DATA]) / MAX_CHUNK_SIZE + 1)):
+            yield data[DATA][i * MAX_CHUNK_SIZE: (i + 1) * MAX_CHUNK_SIZE], None
+        return
+    for column in meta[COLUMNS]:
+        start, end = meta[LENGTHS][column]
+        for i in range(start, end + 1, MAX_CHUNK_SIZE) or [start]:
+            yield data[DATA][i: min(i + MAX_CHUNK_SIZE, end + 1)], column
+
+
+def _segment_update(chunk, column, index):
+    """The update of the segment document chunk, holding (a piece of) column, or of all the columns if it is None"""
+    if column is None:
+        # the chunk may have been written with the columnar layout before
+        return {"$set": chunk, "$unset": {COLUMN: "", INDEX_COLUMN: ""}}
+    chunk[COLUMN] = column
+    chunk[INDEX_COLUMN] = column in index
+    return {"$set": chunk}
+
+
+def _column_lengths(segments):
+    """The LENGTHS (see FrameConverter) of the columns in the joined data of columnar segments"""
+    lengths = {}
+    start = 0
+    for segment in segments:
+        end = start + len(segment[DATA])
+        lengths[segment[COLUMN]] = (lengths.get(segment[COLUMN], (start,))[0], end - 1)
+        start = end
+    return lengths
+
+
+def _chunk_docs(segments, mdata, columns=None):
+    """
+    The serialized documents (see FrametoArraySerializer) of a chunk, from its segments and its metadata document.
+    A chunk appended to in place holds a document for each of its parts (see ChunkStore.append).
+    """
+    if mdata is None:
+        return [{DATA: b"".join([doc[DATA] for doc in segments]), METADATA: None}]
+    parts = [(0, mdata)] + [(part[SEGMENT], part[METADATA]) for part in mdata.get(PARTS, [])]
+    docs = []
+    for i, (first, meta) in enumerate(parts):
+        end = parts[i + 1][0] if i + 1 < len(parts) else None
+        part = [doc for doc in segments if doc[SEGMENT] >= first and (end is None or doc[SEGMENT] < end)]
+        if not part:
+            continue
+        # when len(part) == 1, this is essentially a no-op
+        # otherwise, take all segments and reassemble the data to one chunk
+        doc = {DATA: b"".join([doc[DATA] for doc in part]), METADATA: meta}
+        if columns and COLUMN in part[0]:
+            doc[METADATA] = dict(meta, **{LENGTHS: _column_lengths(part)})
+        docs.append(doc)
+    return docs
+
+
+def _naive_datetime(date):
+    date = Timestamp(date)
+    return (date.tz_convert(None) if date.tz is not None else date).to_pydatetime(warn=False)
+
+
+def _last_date(record):
+    """The last date of the chunk record, when it is indexed by date first"""
+    if record.index.names[0] != "date" or not len(record):
+        return None
+    return _naive_datetime(record.index.get_level_values(0).max())
+
+
+def _appendable(meta, record):
+    """
+    Whether record can be appended to the chunk of meta as a new part of it, rather than by rewriting the chunk:
+    the parts read back concatenated must be the chunk and record combined (see FrametoArraySerializer.combine).
+    """
+    names = list(record.index.names)
+    if (
+        isinstance(record, Series)
+        or len(meta.get(PARTS, [])) + 1 >= ARGUS_CHUNKSTORE_MAX_PARTS
+        or meta.get(TYPE) != "dataframe"
+        or meta.get(INDEX) != (None if names == [None] else names)
+    ):
+        return False
+    if names == [None]:
+        return True
+    # combine sorts by the index, so record must come after the data of the chunk (whose last date has been
+    # truncated to milliseconds by MongoDB)
+    if names[0] != "date" or LAST_DATE not in meta:
+        return False
+    return _naive_datetime(record.index.get_level_values(0).min()) >= meta[LAST_DATE] + timedelta(milliseconds=1)
+
+
+def _chunks_spec(symbol, chunk_metas):
+    """The query for the chunks of symbol with the metadata documents in the lists chunk_metas"""
+    return {SYMBOL: symbol, "$or": [{START: m[START], END: m[END]} for metas in chunk_metas for m in metas]}
+
+
+def _columns_spec(spec, columns):
+    """The query for the segments matching spec, of columns (and of the index) only when they are columnar"""
+    if not columns:
+        return spec
+    return {
+        "$and": [spec, {"$or": [{COLUMN: {"$in": columns}}, {INDEX_COLUMN: True}, {COLUMN: {"$exists": False}}]}]
+    }
+
+
+def _with_metadata(chunks, mdata, reverse=False):
+    """
+    Pair each (start, segments) of chunks with the metadata document for it (or None) from mdata, both sorted by
+    start (descending if reverse)
+    """
+    mdata = iter(mdata)
+    meta = next(mdata, None)
+    for start, segments in chunks:
+        while meta is not None and (meta[START] > start if reverse else meta[START] < start):
+            meta = next(mdata, None)
+        yield segments, meta if meta is not None and meta[START] == start else None
+
+
+def _read_metadata(mdata, spec):
+    """The chunk metadata documents matching spec, by (symbol, start, end)"""
+    return {(doc[SYMBOL], doc[START], doc[END]): doc for doc in mdata.find(spec)}
+
 
 class ChunkStore:
     @classmethod
     def initialize_library(cls, argus_lib, hashed=True, **kwargs):
+        if "columnar_chunks" in kwargs:
+            argus_lib.set_library_metadata("COLUMNAR_CHUNKS", bool(kwargs.pop("columnar_chunks")))
+
         ChunkStore(argus_lib)._ensure_index()
 
         logger.info("Trying to enable sharding...")
@@ -85,6 +248,7 @@ class ChunkStore:
 
         # Do we allow reading from secondaries
         self._allow_secondary = self._argus_lib.argus._allow_secondary
+        self._columnar = None
         self._reset()
 
     @mongo_retry
@@ -95,6 +259,13 @@ class ChunkStore:
         self._mdata = self._collection.metadata
         self._audit = self._collection.audit
 
+    @property
+    def _with_columnar_chunks(self):
+        if self._columnar is None:
+            columnar_meta = self._argus_lib.get_library_metadata("COLUMNAR_CHUNKS")
+            self._columnar = ARGUS_CHUNKSTORE_COLUMNAR if columnar_meta is None else columnar_meta
+        return self._columnar
+
     def __getstate__(self):
         return {"argus_lib": self._argus_lib}
 
@@ -149,7 +320,7 @@ class ChunkStore:
                 # update symbol metadata (rows and chunk count)
                 sym = self._get_symbol_info(symbol)
                 sym[LEN] -= row_adjust
-                sym[CHUNK_COUNT] = mongo_count(self._collection, filter={SYMBOL: symbol})
+                sym[CHUNK_COUNT] = mongo_count(self._collection, filter={SYMBOL: symbol, SEGMENT: 0})
                 self._symbols.replace_one({SYMBOL: symbol}, sym)
 
         else:
@@ -238,7 +409,9 @@ class ChunkStore:
             perform chunk level filtering on the data (see filter in _chunker)
             only applicable when chunk_range is specified
         kwargs: ?
-            values passed to the serializer. Varies by serializer
+            values passed to the serializer. Varies by serializer. With columns,
+            only the segments of those columns are fetched from chunks written
+            with the columnar layout (see initialize_library's columnar_chunks)
 
         Returns
         -------
@@ -259,20 +432,9 @@ class ChunkStore:
         if chunk_range is not None:
             spec.update(chunker.to_mongo(chunk_range))
 
-        by_start_segment = [(SYMBOL, pymongo.ASCENDING), (START, pymongo.ASCENDING), (SEGMENT, pymongo.ASCENDING)]
-        segment_cursor = self._collection.find(spec, sort=by_start_segment)
-
         chunks = defaultdict(list)
-        for _, segments in groupby(segment_cursor, key=lambda x: (x[START], x[SYMBOL])):
-            segments = list(segments)
-            mdata = self._mdata.find_one(
-                {SYMBOL: segments[0][SYMBOL], START: segments[0][START], END: segments[0][END]}
-            )
-
-            # when len(segments) == 1, this is essentially a no-op
-            # otherwise, take all segments and reassemble the data to one chunk
-            chunk_data = b"".join([doc[DATA] for doc in segments])
-            chunks[segments[0][SYMBOL]].append({DATA: chunk_data, METADATA: mdata})
+        for (chunk_symbol, _, _), (docs, _) in self._read_chunks(spec, kwargs.get("columns")).items():
+            chunks[chunk_symbol].extend(docs)
 
         skip_filter = not filter_data or chunk_range is None
 
@@ -290,6 +452,44 @@ class ChunkStore:
                 else chunker.filter(deser(chunks[symbol[0]], **kwargs), chunk_range)
             )
 
+    def _overlapping_chunks(self, symbol, chunker, records):
+        """
+        The metadata documents of the chunks of symbol overlapping each of records (see Chunker.to_chunks), fetched
+        in one query. Records starting after the end of the last chunk, as appends usually do, need no query.
+        """
+        last = self._collection.find_one(
+            {SYMBOL: symbol, SEGMENT: 0}, projection={END: True}, sort=[(END, pymongo.DESCENDING)]
+        )
+        ranges = [
+            chunker.to_mongo(chunker.to_range(start, end))
+            for start, end, _, _ in records
+            if last is not None and not start > last[END]
+        ]
+        if not ranges:
+            return [[] for _ in records]
+        metas = list(self._mdata.find({SYMBOL: symbol, "$or": ranges}))
+        return [[m for m in metas if not (m[START] > end or m[END] < start)] for start, end, _, _ in records]
+
+    def _read_chunks(self, spec, columns=None):
+        """
+        The serialized documents of the chunks matching spec, and the number of segments read for them,
+        by (symbol, start, end). With columns, only the segments of those columns (and of the index) are
+        fetched from the chunks written with the columnar layout.
+        """
+        # The metadata of all the chunks is fetched in one query, while the segments are read
+        mdata = _get_metadata_reader_pool().apply_async(_read_metadata, (self._mdata, spec))
+
+        by_start_segment = [(SYMBOL, pymongo.ASCENDING), (START, pymongo.ASCENDING), (SEGMENT, pymongo.ASCENDING)]
+        segment_cursor = self._collection.find(_columns_spec(spec, columns), sort=by_start_segment)
+
+        read = []
+        for _, segments in groupby(segment_cursor, key=lambda x: (x[START], x[SYMBOL])):
+            segments = list(segments)
+            read.append(((segments[0][SYMBOL], segments[0][START], segments[0][END]), segments))
+
+        mdata = mdata.get()
+        return {key: (_chunk_docs(segments, mdata.get(key), columns), len(segments)) for key, segments in read}
+
     def read_audit_log(self, symbol=None):
         """
         Reads the audit log
@@ -307,6 +507,19 @@ class ChunkStore:
             return [x for x in self._audit.find({"symbol": symbol}, {"_id": False})]
         return [x for x in self._audit.find({}, {"_id": False})]
 
+    def _select_codec(self, sym, item):
+        """
+        The codec to compress item with. With adaptive compression, the codec chosen for the symbol is recorded
+        in (and then reused from) its symbol document.
+        """
+        codec = self._argus_lib.get_compression()
+        if not is_adaptive(codec):
+            return codec, None
+        if sym and sym.get(COMPRESSION, {}).get("adaptive") == codec:
+            return sym[COMPRESSION]["codec"], sym[COMPRESSION]
+        frame = item.to_frame() if isinstance(item, Series) else item
+        return select_codec(codec, lambda: array_samples([np.asarray(frame[c]) for c in frame]))
+
     def write(self, symbol, item, metadata=None, chunker=DateChunker(), audit=None, **kwargs):
         """
         Writes data from item to symbol in the database
@@ -348,6 +561,9 @@ class ChunkStore:
         doc[USERMETA] = metadata
 
         sym = self._get_symbol_info(symbol)
+        codec, choice = self._select_codec(sym, item)
+        if choice:
+            doc[COMPRESSION] = choice
         if sym:
             previous_shas = set(
                 [
@@ -364,13 +580,15 @@ class ChunkStore:
 
         for start, end, chunk_size, record in chunker.to_chunks(item, **kwargs):
             chunk_count += 1
-            data = self.serializer.serialize(record)
+            data = self.serializer.serialize(record, codec=codec)
             doc[CHUNK_SIZE] = chunk_size
             doc[METADATA] = {"columns": data[METADATA][COLUMNS] if COLUMNS in data[METADATA] else ""}
             meta = data[METADATA]
+            if _last_date(record) is not None:
+                meta[LAST_DATE] = _last_date(record)
 
-            for i in range(int(len(data[DATA]) / MAX_CHUNK_SIZE + 1)):
-                chunk = {DATA: Binary(data[DATA][i * MAX_CHUNK_SIZE: (i + 1) * MAX_CHUNK_SIZE])}
+            for i, (segment, column) in enumerate(_segments(data, self._with_columnar_chunks)):
+                chunk = {DATA: Binary(segment)}
                 chunk[SEGMENT] = i
                 chunk[START] = meta[START] = start
                 chunk[END] = meta[END] = end
@@ -384,7 +602,7 @@ class ChunkStore:
                     ops.append(
                         pymongo.UpdateOne(
                             {SYMBOL: symbol, START: start, END: end, SEGMENT: chunk[SEGMENT]},
-                            {"$set": chunk},
+                            _segment_update(chunk, column, meta.get(INDEX, [])),
                             upsert=True,
                         )
                     )
@@ -432,39 +650,83 @@ class ChunkStore:
         ops = []
         meta_ops = []
         chunker = CHUNKER_MAP[sym[CHUNKER]]
+        codec, choice = self._select_codec(sym, item)
+        if choice:
+            sym[COMPRESSION] = choice
 
         appended = 0
         new_chunks = 0
-        for start, end, _, record in chunker.to_chunks(item, chunk_size=sym[CHUNK_SIZE]):
-            # read out matching chunks
-            df = self.read(symbol, chunk_range=chunker.to_range(start, end), filter_data=False)
-            # assuming they exist, update them and store the original chunk
-            # range for later use
-            if len(df) > 0:
-                record = combine_method(df, record)
-                if record is None or record.equals(df):
-                    continue
-
-                sym[APPEND_COUNT] += len(record) - len(df)
-                appended += len(record) - len(df)
-                sym[LEN] += len(record) - len(df)
-            else:
-                sym[CHUNK_COUNT] += 1
-                new_chunks += 1
+        records = list(chunker.to_chunks(item, chunk_size=sym[CHUNK_SIZE]))
+        chunk_metas = self._overlapping_chunks(symbol, chunker, records)
+        # appends after the end of a chunk's data are written as a new part of the chunk, the others rewrite it
+        in_place = [
+            combine_method == SER_MAP[sym[SERIALIZER]].combine and len(metas) == 1 and _appendable(metas[0], record)
+            for metas, (_, _, _, record) in zip(chunk_metas, records)
+        ]
+        rewritten = [metas for metas, part in zip(chunk_metas, in_place) if metas and not part]
+        existing = self._read_chunks(_chunks_spec(symbol, rewritten)) if rewritten else {}
+        if any(in_place):
+            # the number of segments of the chunks, which the new parts are numbered from
+            parts = [metas for metas, part in zip(chunk_metas, in_place) if part]
+            part_segments = self._collection.find(_chunks_spec(symbol, parts), projection={START: True, "_id": False})
+            part_starts = [doc[START] for doc in part_segments]
+
+        for (start, end, _, record), metas, part in zip(records, chunk_metas, in_place):
+            if part:
+                sym[APPEND_COUNT] += len(record)
+                appended += len(record)
                 sym[LEN] += len(record)
-
-            data = SER_MAP[sym[SERIALIZER]].serialize(record)
-            meta = data[METADATA]
-
-            chunk_count = int(len(data[DATA]) / MAX_CHUNK_SIZE + 1)
-            seg_count = mongo_count(self._collection, filter={SYMBOL: symbol, START: start, END: end})
-            # remove old segments for this chunk in case we now have less
-            # segments than we did before
-            if seg_count > chunk_count:
-                self._collection.delete_many({SYMBOL: symbol, START: start, END: end, SEGMENT: {"$gte": chunk_count}})
-
-            for i in range(chunk_count):
-                chunk = {DATA: Binary(data[DATA][i * MAX_CHUNK_SIZE: (i + 1) * MAX_CHUNK_SIZE])}
+                data = SER_MAP[sym[SERIALIZER]].serialize(record, codec=codec)
+                meta = data[METADATA]
+                first = part_starts.count(metas[0][START])
+                segments = enumerate(_segments(data, self._with_columnar_chunks), first)
+                meta_update = {"$push": {PARTS: {SEGMENT: first, METADATA: meta}}}
+                if _last_date(record) is not None:
+                    meta_update["$set"] = {LAST_DATE: _last_date(record)}
+                meta_ops.append(pymongo.UpdateOne({"_id": metas[0]["_id"]}, meta_update))
+            else:
+                keys = [(symbol, m[START], m[END]) for m in metas]
+                docs = [doc for key in keys if key in existing for doc in existing[key][0]]
+                df = SER_MAP[sym[SERIALIZER]].deserialize(docs)
+                # assuming they exist, update them and store the original chunk
+                # range for later use
+                if len(df) > 0:
+                    record = combine_method(df, record)
+                    if record is None or record.equals(df):
+                        continue
+
+                    sym[APPEND_COUNT] += len(record) - len(df)
+                    appended += len(record) - len(df)
+                    sym[LEN] += len(record) - len(df)
+                else:
+                    sym[CHUNK_COUNT] += 1
+                    new_chunks += 1
+                    sym[LEN] += len(record)
+
+                data = SER_MAP[sym[SERIALIZER]].serialize(record, codec=codec)
+                meta = data[METADATA]
+                segments = list(_segments(data, self._with_columnar_chunks))
+                chunk_count = len(segments)
+                seg_count = sum(existing[key][1] for key in keys if key in existing)
+                # remove old segments for this chunk in case we now have less
+                # segments than we did before
+                if seg_count > chunk_count:
+                    self._collection.delete_many(
+                        {SYMBOL: symbol, START: start, END: end, SEGMENT: {"$gte": chunk_count}}
+                    )
+                segments = enumerate(segments)
+                if _last_date(record) is not None:
+                    meta[LAST_DATE] = _last_date(record)
+                meta_update = {"$set": meta}
+                # the chunk may have been written with a codec, or appended to in place, before
+                meta_update["$unset"] = {PARTS: ""}
+                for key in [CODEC, LAST_DATE]:
+                    if key not in meta:
+                        meta_update["$unset"][key] = ""
+                meta_ops.append(pymongo.UpdateOne({SYMBOL: symbol, START: start, END: end}, meta_update, upsert=True))
+
+            for i, (segment, column) in segments:
+                chunk = {DATA: Binary(segment)}
                 chunk[SEGMENT] = i
                 chunk[START] = start
                 chunk[END] = end
@@ -474,12 +736,11 @@ class ChunkStore:
                 chunk[SHA] = sha
                 ops.append(
                     pymongo.UpdateOne(
-                        {SYMBOL: symbol, START: start, END: end, SEGMENT: chunk[SEGMENT]}, {"$set": chunk}, upsert=True
+                        {SYMBOL: symbol, START: start, END: end, SEGMENT: chunk[SEGMENT]},
+                        _segment_update(chunk, column, meta.get(INDEX, [])),
+                        upsert=True,
                     )
                 )
-                meta_ops.append(
-                    pymongo.UpdateOne({SYMBOL: symbol, START: start, END: end}, {"$set": meta}, upsert=True)
-                )
         if ops:
             self._collection.bulk_write(ops, ordered=False)
             self._mdata.bulk_write(meta_ops, ordered=False)
@@ -602,6 +863,8 @@ class ChunkStore:
         ret["chunker"] = sym[CHUNKER]
         ret["chunk_size"] = sym[CHUNK_SIZE] if CHUNK_SIZE in sym else 0
         ret["serializer"] = sym[SERIALIZER]
+        if COMPRESSION in sym:
+            ret["compression"] = sym[COMPRESSION]
         return ret
 
     def read_metadata(self, symbol):
@@ -673,9 +936,40 @@ class ChunkStore:
         ):
             yield (c.chunk_to_str(x[START]), c.chunk_to_str(x[END]))
 
+    def _iterator(self, symbol, chunk_range=None, reverse=False, **kwargs):
+        sym = self._get_symbol_info(symbol)
+        if not sym:
+            raise NoDataFoundException("Symbol does not exist.")
+
+        spec = {SYMBOL: symbol}
+        if chunk_range is not None:
+            spec.update(CHUNKER_MAP[sym[CHUNKER]].to_mongo(chunk_range))
+        deser = SER_MAP[sym[SERIALIZER]].deserialize
+        columns = kwargs.get("columns")
+
+        def _chunks():
+            # Whole chunks in order, from one cursor over the segments (read backwards in reverse, to use the index)
+            direction = pymongo.DESCENDING if reverse else pymongo.ASCENDING
+            segment_cursor = self._collection.find(
+                _columns_spec(spec, columns), sort=[(START, direction), (SEGMENT, direction)]
+            )
+            chunks = groupby(segment_cursor, key=lambda x: x[START])
+            mdata = self._mdata.find(spec, sort=[(START, direction)])
+            for segments, meta in _with_metadata(chunks, mdata, reverse):
+                yield sorted(segments, key=lambda x: x[SEGMENT]), meta
+
+        def _deserialize(chunk):
+            segments, meta = chunk
+            return deser(_chunk_docs(segments, meta, columns), **kwargs)
+
+        # The chunks are fetched as they are read ahead, and deserialized in the chunk reader threads
+        return read_ahead(_deserialize, _chunks(), ARGUS_CHUNKSTORE_READ_AHEAD, _get_chunk_reader_pool())
+
     def iterator(self, symbol, chunk_range=None, **kwargs):
         """
-        Returns a generator that accesses each chunk in ascending order
+        Returns a generator that accesses each chunk in ascending order. The chunks are
+        read from a single query, up to ARGUS_CHUNKSTORE_READ_AHEAD chunks ahead of the
+        one being consumed
 
         Parameters
         ----------
@@ -683,23 +977,20 @@ class ChunkStore:
             the symbol for the given item in the DB
         chunk_range: None, or a range object
             allows you to subset the chunks by range
+        kwargs:
+            values passed to the serializer, as in read
 
         Returns
         -------
         generator
         """
-        sym = self._get_symbol_info(symbol)
-        if not sym:
-            raise NoDataFoundException("Symbol does not exist.")
-
-        c = CHUNKER_MAP[sym[CHUNKER]]
-
-        for chunk in list(self.get_chunk_ranges(symbol, chunk_range=chunk_range)):
-            yield self.read(symbol, chunk_range=c.to_range(chunk[0], chunk[1]), **kwargs)
+        yield from self._iterator(symbol, chunk_range=chunk_range, **kwargs)
 
     def reverse_iterator(self, symbol, chunk_range=None, **kwargs):
         """
-        Returns a generator that accesses each chunk in descending order
+        Returns a generator that accesses each chunk in descending order. The chunks are
+        read from a single query, up to ARGUS_CHUNKSTORE_READ_AHEAD chunks ahead of the
+        one being consumed
 
         Parameters
         ----------
@@ -707,19 +998,14 @@ class ChunkStore:
             the symbol for the given item in the DB
         chunk_range: None, or a range object
             allows you to subset the chunks by range
+        kwargs:
+            values passed to the serializer, as in read
 
         Returns
         -------
         generator
         """
-        sym = self._get_symbol_info(symbol)
-        if not sym:
-            raise NoDataFoundException("Symbol does not exist.")
-
-        c = CHUNKER_MAP[sym[CHUNKER]]
-
-        for chunk in list(self.get_chunk_ranges(symbol, chunk_range=chunk_range, reverse=True)):
-            yield self.read(symbol, chunk_range=c.to_range(chunk[0], chunk[1]), **kwargs)
+        yield from self._iterator(symbol, chunk_range=chunk_range, reverse=True, **kwargs)
 
     def stats(self):
         """
@@ -34,6 +34,15 @@ class UnsupportedPickleStoreVersion(ArgusException):
     pass
 
 
+class FullReadRequiredException(ArgusException):
+    """
+    An incremental read (with from_version) isn't possible, as the version read doesn't extend from_version with
+    appends: the symbol needs to be read in full.
+    """
+
+    pass
+
+
 class DataIntegrityException(ArgusException):
     """
     Base class for data integrity issues.
@@ -237,6 +237,13 @@ def library(argus, library_name):
     return argus.get_library(library_name)
 
 
+@pytest.fixture(scope="function")
+def columnar_library(argus, library_name):
+    # A library writing DataFrames with the column-oriented segment layout
+    argus.initialize_library(library_name, m.VERSION_STORE, segment="month", columnar_segments=True)
+    return argus.get_library(library_name)
+
+
 @pytest.fixture(scope="function")
 def bitemporal_library(argus, library_name):
     argus.initialize_library(library_name, m.VERSION_STORE, segment="month")
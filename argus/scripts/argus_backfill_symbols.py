@@ -0,0 +1,40 @@
+import argparse
+import logging
+
+from .utils import do_db_auth, setup_logging
+from ..argus import Argus, ArgusLibraryBinding
+from ..hooks import get_mongodb_uri
+
+logger = logging.getLogger(__name__)
+
+
+def main():
+    usage = """
+    Build the symbols collection of Argus VersionStore libraries created before it existed,
+    so that list_symbols and has_symbol don't need to scan all the versions.
+    """
+    setup_logging()
+
+    parser = argparse.ArgumentParser(usage=usage)
+    parser.add_argument("--host", default="localhost", help="Hostname, or clustername. Default: localhost")
+    parser.add_argument(
+        "--library", nargs="+", required=True, help="The name of the library. e.g. 'argus_jblackburn.lib'"
+    )
+
+    opts = parser.parse_args()
+
+    store = Argus(get_mongodb_uri(opts.host))
+
+    for lib in opts.library:
+        database_name, _ = ArgusLibraryBinding._parse_db_lib(lib)
+        do_db_auth(opts.host, store._conn, database_name)
+
+        logger.info(f"Backfilling the symbols of: {lib} on mongo {opts.host}")
+        library = store[lib]
+        library._ensure_index()
+        library._backfill_symbols()
+        logger.info(f"Symbols:  {len(library.list_symbols()):10}")
+
+
+if __name__ == "__main__":
+    main()
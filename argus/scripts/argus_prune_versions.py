@@ -12,12 +12,11 @@ from ..hooks import get_mongodb_uri
 logger = logging.getLogger(__name__)
 
 
-def prune_versions(lib, symbols, keep_mins):
+def prune_versions(lib, symbols, keep_mins, workers=1):
     logger.info("Fixing snapshot pointers")
     lib._cleanup_orphaned_versions(dry_run=False)
-    for symbol in symbols:
-        logger.info(f"Pruning {symbol}")
-        lib._prune_previous_versions(symbol, keep_mins=keep_mins)
+    logger.info(f"Pruning {len(symbols)} symbols")
+    lib.prune_all(keep_mins=keep_mins, workers=workers, symbols=symbols)
 
 
 def main():
@@ -36,6 +35,7 @@ def main():
     parser.add_option("--library", help="The name of the library. e.g. 'argus_jblackburn.library'")
     parser.add_option("--symbols", help="The symbols to prune - comma separated (default all)")
     parser.add_option("--keep-mins", default=10, help="Ensure there's a version at least keep-mins old. Default:10")
+    parser.add_option("--workers", default=1, type="int", help="Prune this many batches of symbols at once. Default:1")
 
     (opts, _) = parser.parse_args()
 
@@ -58,7 +58,7 @@ def main():
         symbols = lib.list_symbols(all_symbols=True)
         logger.info(f"Found {len(symbols)} symbols")
 
-    prune_versions(lib, symbols, opts.keep_mins)
+    prune_versions(lib, symbols, opts.keep_mins, workers=opts.workers)
     logger.info("Done")
 
 
@@ -1,4 +1,5 @@
 import logging
+from functools import partial
 
 import numpy as np
 import numpy.ma as ma
@@ -6,14 +7,12 @@ import pandas as pd
 from bson import Binary, SON
 
 from ._serializer import Serializer
-from .._compression import compress, decompress, compress_array
+from .._compression import compress, decompress, compress_array, parallel_map
 
 from pandas.api.types import infer_dtype
 from pandas._libs.writers import max_len_string_array
 
 if int(pd.__version__.split(".")[1]) > 22:
-    from functools import partial
-
     pd.concat = partial(pd.concat, sort=False)
 
 DATA = "d"
@@ -24,6 +23,7 @@ COLUMNS = "c"
 INDEX = "i"
 METADATA = "md"
 LENGTHS = "ln"
+CODEC = "cd"
 
 
 class FrameConverter:
@@ -37,6 +37,7 @@ class FrameConverter:
                       INDEX: [idx1, idx2, ...]               list of str
                       TYPE: 'series' or 'dataframe'
                       LENGTHS: {col1: len, col2: len, ...}   dict of str: int
+                      CODEC: 'zstd:9+shuffle'                codec spec, only when not the default LZ4
                     }
           DATA: BINARY(....)      Compressed columns concatenated together
         }
@@ -79,7 +80,7 @@ class FrameConverter:
         else:
             raise ValueError(f"Cannot store arrays with {type_} dtype")
 
-    def docify(self, df):
+    def docify(self, df, codec=None):
         """
         Convert a Pandas DataFrame to SON.
 
@@ -87,6 +88,8 @@ class FrameConverter:
         ----------
         df:  DataFrame
             The Pandas DataFrame to encode
+        codec: str or None
+            The codec spec to compress the columns with (see argus._compression), defaults to LZ4
         """
         dtypes = {}
         masks = {}
@@ -96,21 +99,23 @@ class FrameConverter:
         start = 0
 
         arrays = []
+        typesizes = []
         for c in df:
             try:
                 columns.append(str(c))
                 arr, mask = self._convert_types(df[c].values)
                 dtypes[str(c)] = arr.dtype.str
                 if mask is not None:
-                    masks[str(c)] = Binary(compress(mask.tostring()))
+                    masks[str(c)] = Binary(compress(mask.tostring(), codec))
                 arrays.append(arr.tostring())
+                typesizes.append(arr.dtype.itemsize)
             except Exception as e:
                 typ = infer_dtype(df[c], skipna=False)
                 msg = f"Column '{str(c)}' type is {typ}"
                 logging.warning(msg)
                 raise e
 
-        arrays = compress_array(arrays)
+        arrays = compress_array(arrays, codec=codec, typesize=typesizes) if codec else compress_array(arrays)
         for index, c in enumerate(df):
             d = Binary(arrays[index])
             lengths[str(c)] = (start, start + len(d) - 1)
@@ -119,6 +124,8 @@ class FrameConverter:
 
         doc = SON({DATA: data, METADATA: {}})
         doc[METADATA] = {COLUMNS: columns, MASK: masks, LENGTHS: lengths, DTYPE: dtypes}
+        if codec:
+            doc[METADATA][CODEC] = codec
 
         return doc
 
@@ -127,6 +134,7 @@ class FrameConverter:
         Decode a Pymongo SON object into an Pandas DataFrame
         """
         cols = columns or doc[METADATA][COLUMNS]
+        codec = doc[METADATA].get(CODEC)
         data = {}
 
         for col in cols:
@@ -135,12 +143,17 @@ class FrameConverter:
             if col not in doc[METADATA][LENGTHS]:
                 d = np.array(np.nan)
             else:
-                d = decompress(doc[DATA][doc[METADATA][LENGTHS][col][0]: doc[METADATA][LENGTHS][col][1] + 1])
+                dtype = np.dtype(doc[METADATA][DTYPE][col])
+                d = decompress(
+                    doc[DATA][doc[METADATA][LENGTHS][col][0]: doc[METADATA][LENGTHS][col][1] + 1],
+                    codec,
+                    dtype.itemsize,
+                )
                 # d is ready-only but that's not an issue since DataFrame will copy the data anyway.
-                d = np.frombuffer(d, doc[METADATA][DTYPE][col])
+                d = np.frombuffer(d, dtype)
 
                 if MASK in doc[METADATA] and col in doc[METADATA][MASK]:
-                    mask_data = decompress(doc[METADATA][MASK][col])
+                    mask_data = decompress(doc[METADATA][MASK][col], codec)
                     mask = np.frombuffer(mask_data, "bool")
                     d = ma.masked_array(d, mask)
             data[col] = d
@@ -148,6 +161,60 @@ class FrameConverter:
         # Copy into
         return pd.DataFrame(data, columns=cols, copy=True)[cols]
 
+    def objify_many(self, docs, columns=None):
+        """
+        Decode a list of Pymongo SON objects into one Pandas DataFrame (with a RangeIndex), as the concatenation
+        of their objify. The columns of all the objects are decompressed in the compression thread pool, and each
+        column is copied into one contiguous array.
+
+        Returns None when the objects don't share the columns, or their columns don't share a dtype (pd.concat
+        would have to align or upcast them).
+        """
+        cols = columns or docs[0][METADATA][COLUMNS]
+        if not cols:
+            return None
+        dtypes = {}
+        for col in cols:
+            col_dtypes = set()
+            for doc in docs:
+                meta = doc[METADATA]
+                if col not in meta[LENGTHS] or (not columns and meta[COLUMNS] != cols):
+                    return None
+                col_dtypes.add(np.dtype(meta[DTYPE][col]))
+            kinds = {dtype.kind for dtype in col_dtypes}
+            if len(col_dtypes) > 1 and kinds not in ({"U"}, {"S"}):
+                return None
+            dtypes[col] = np.result_type(*col_dtypes)
+
+        def _decompress(item):
+            doc, col, mask = item
+            meta = doc[METADATA]
+            if mask:
+                return decompress(meta[MASK][col], meta.get(CODEC))
+            dtype = np.dtype(meta[DTYPE][col])
+            start, end = meta[LENGTHS][col]
+            return decompress(doc[DATA][start: end + 1], meta.get(CODEC), dtype.itemsize)
+
+        items = [(doc, col, False) for col in cols for doc in docs]
+        items += [(doc, col, True) for col in cols for doc in docs if col in doc[METADATA].get(MASK, {})]
+        decompressed = iter(parallel_map(_decompress, items))
+
+        data = {}
+        rows = None
+        for col in cols:
+            arrays = [np.frombuffer(next(decompressed), doc[METADATA][DTYPE][col]) for doc in docs]
+            rows = rows or [len(a) for a in arrays]
+            data[col] = np.concatenate(arrays).astype(dtypes[col], copy=False)
+        for col in cols:
+            masked = [col in doc[METADATA].get(MASK, {}) for doc in docs]
+            if any(masked):
+                masks = [
+                    np.frombuffer(next(decompressed), "bool") if m else np.zeros(n, "bool")
+                    for m, n in zip(masked, rows)
+                ]
+                data[col] = ma.masked_array(data[col], np.concatenate(masks))
+        return pd.DataFrame(data, columns=cols)[cols]
+
 
 class FrametoArraySerializer(Serializer):
     TYPE = "FrameToArray"
@@ -155,7 +222,7 @@ class FrametoArraySerializer(Serializer):
     def __init__(self):
         self.converter = FrameConverter()
 
-    def serialize(self, df):
+    def serialize(self, df, codec=None):
         if isinstance(df, pd.Series):
             dtype = "series"
             df = df.to_frame()
@@ -168,11 +235,11 @@ class FrametoArraySerializer(Serializer):
         if df.index.names != [None]:
             index = df.index.names
             df = df.reset_index()
-            ret = self.converter.docify(df)
+            ret = self.converter.docify(df, codec)
             ret[METADATA][INDEX] = index
             ret[METADATA][TYPE] = dtype
             return ret
-        ret = self.converter.docify(df)
+        ret = self.converter.docify(df, codec)
         ret[METADATA][TYPE] = dtype
         return ret
 
@@ -207,7 +274,10 @@ class FrametoArraySerializer(Serializer):
         if not isinstance(data, list):
             df = self.converter.objify(data, columns)
         else:
-            df = pd.concat([self.converter.objify(d, columns) for d in data], ignore_index=not index)
+            df = self.converter.objify_many(data, columns)
+            if df is None:
+                objify = partial(self.converter.objify, columns=columns)
+                df = pd.concat(parallel_map(objify, data), ignore_index=not index)
 
         if index:
             df = df.set_index(meta[INDEX])
@@ -58,6 +58,55 @@ def _multi_index_to_records(index, empty_index):
     return ix_vals, index_names, index_tz
 
 
+def _field_view(recarr, name):
+    # Views of a read-only buffer would leave pandas objects the user cannot modify in place
+    arr = recarr[name]
+    return arr if recarr.flags.writeable else np.copy(arr)
+
+
+def _columns_data(recarr, columns):
+    """
+    Data for the DataFrame constructor which, where pandas allows it, shares the memory of recarr.
+
+    If the columns are of the same dtype and laid out next to each other in the records they are returned as a single
+    2D strided view, which pandas takes as one block without copying. Otherwise a dict of per-column views is returned.
+    A read-only recarr is returned as is, and pandas copies it.
+    """
+    if not recarr.flags.writeable or not len(columns):
+        return recarr[columns]
+    dtypes = [recarr.dtype.fields[c][0] for c in columns]
+    offsets = [recarr.dtype.fields[c][1] for c in columns]
+    col_dtype = dtypes[0]
+    if (
+        col_dtype.shape == ()
+        and all(d == col_dtype for d in dtypes)
+        and offsets == list(range(offsets[0], offsets[0] + len(columns) * col_dtype.itemsize, col_dtype.itemsize))
+    ):
+        return np.lib.stride_tricks.as_strided(
+            recarr[columns[0]], shape=(len(recarr), len(columns)), strides=(recarr.strides[0], col_dtype.itemsize)
+        )
+    return {c: recarr[c] for c in columns}
+
+
+def _select_columns(all_columns, multi_column, columns):
+    """
+    Restrict the stored columns, and the levels of a multi-column, to the requested ones in the requested order.
+    """
+    columns = [str(c) for c in columns]
+    if len(columns) > len(set(columns)):
+        raise ArgusException("Duplicate columns specified, cannot de-serialize")
+    missing = [c for c in columns if c not in all_columns]
+    if missing:
+        raise ArgusException(f"Columns {missing} not found, available columns are {list(all_columns)}")
+    if multi_column is not None:
+        positions = [all_columns.index(c) for c in columns]
+        multi_column = {
+            "names": multi_column["names"],
+            "values": [[level[i] for i in positions] for level in multi_column["values"]],
+        }
+    return columns, multi_column
+
+
 class PandasSerializer:
     def _index_to_records(self, df):
         metadata = {}
@@ -85,7 +134,7 @@ class PandasSerializer:
         index = recarr.dtype.metadata["index"]
 
         if len(index) == 1:
-            rtn = Index(np.copy(recarr[str(index[0])]), name=index[0])
+            rtn = Index(_field_view(recarr, str(index[0])), name=index[0])
             if isinstance(rtn, DatetimeIndex) and "index_tz" in recarr.dtype.metadata:
                 rtn = rtn.tz_localize("UTC").tz_convert(recarr.dtype.metadata["index_tz"])
         else:
@@ -93,7 +142,7 @@ class PandasSerializer:
             index_tz = recarr.dtype.metadata.get("index_tz", [])
             for level_no, index_name in enumerate(index):
                 # build each index level separately to ensure we end up with the right index dtype
-                level = Index(np.copy(recarr[str(index_name)]))
+                level = Index(_field_view(recarr, str(index_name)))
                 if level_no < len(index_tz):
                     tz = index_tz[level_no]
                     if tz is not None:
@@ -280,10 +329,22 @@ class DataFrameSerializer(PandasSerializer):
         else:
             return columns, column_vals, None
 
-    def deserialize(self, item, force_bytes_to_unicode=False):
+    def deserialize(self, item, force_bytes_to_unicode=False, columns=None):
+        """
+        Parameters
+        ----------
+        item: `numpy.recarray`
+            The records, as written by `serialize`.
+        force_bytes_to_unicode: `bool`
+            Convert bytes columns, index and column names to unicode strings.
+        columns: `list` or `None`
+            Only build these columns of the DataFrame. Default, None, builds them all.
+        """
         index = self._index_from_records(item)
         column_fields = [x for x in item.dtype.names if x not in item.dtype.metadata["index"]]
         multi_column = item.dtype.metadata.get("multi_column")
+        if columns is not None:
+            column_fields, multi_column = _select_columns(column_fields, multi_column, columns)
         if len(item) == 0:
             rdata = item[column_fields] if len(column_fields) > 0 else None
             if multi_column is not None:
@@ -292,8 +353,8 @@ class DataFrameSerializer(PandasSerializer):
             else:
                 return DataFrame(rdata, index=index)
 
-        columns = item.dtype.metadata["columns"]
-        df = DataFrame(data=item[column_fields], index=index, columns=columns)
+        columns = item.dtype.metadata["columns"] if columns is None else column_fields
+        df = DataFrame(data=_columns_data(item, columns), index=index, columns=columns, copy=False)
 
         if multi_column is not None:
             df.columns = MultiIndex.from_arrays(multi_column["values"], names=multi_column["names"])
@@ -1,5 +1,12 @@
 import hashlib
+import itertools
 import logging
+import threading
+from collections import deque
+from contextlib import contextmanager
+from functools import partial
+from multiprocessing import shared_memory
+from multiprocessing.pool import ThreadPool
 from operator import itemgetter
 
 import numpy as np
@@ -7,8 +14,10 @@ import pymongo
 from bson.binary import Binary
 from pymongo.errors import OperationFailure, DuplicateKeyError, BulkWriteError
 
-from ._version_store_utils import checksum, version_base_or_id, _fast_check_corruption
-from .._compression import compress_array, decompress
+from ._segment_cache import get_segment_cache
+from ._version_store_utils import checksum, tree_checksum, version_base_or_id, _fast_check_corruption
+from .. import _compression
+from .._compression import compress_array, decompress, decompress_into, array_samples, is_adaptive, select_codec
 # CHECK_CORRUPTION_ON_APPEND used in global scope, do not remove.
 from .._config import (
     FW_POINTERS_CONFIG_KEY,
@@ -16,11 +25,16 @@ from .._config import (
     ARGUS_FORWARD_POINTERS_CFG,
     ARGUS_FORWARD_POINTERS_RECONCILE,
     CHECK_CORRUPTION_ON_APPEND,
+    ARGUS_WRITE_BATCH_SIZE,
+    ARGUS_WRITE_IN_FLIGHT,
+    ARGUS_BATCH_READ_SYMBOLS,
+    ARGUS_ITERATOR_ROWS_PER_BATCH,
+    ARGUS_ITERATOR_READ_AHEAD,
     FwPointersCfg,
 )  # noqa # pylint: disable=unused-import
 from .._util import mongo_count, get_fwptr_config
 from ..decorators import mongo_retry
-from ..exceptions import UnhandledDtypeException, DataIntegrityException
+from ..exceptions import UnhandledDtypeException, DataIntegrityException, ArgusException
 
 CHECK_CORRUPTION_ON_APPEND = CHECK_CORRUPTION_ON_APPEND
 logger = logging.getLogger(__name__)
@@ -28,6 +42,204 @@ logger = logging.getLogger(__name__)
 _CHUNK_SIZE = 2 * 1024 * 1024 - 2048  # ~2 MB (a bit less for usePowerOf2Sizes)
 _APPEND_SIZE = 1 * 1024 * 1024  # 1MB
 _APPEND_COUNT = 60  # 1 hour of 1 min data
+_segment_writer_pool = None
+_segment_reader_pool = None
+_batched_writes = threading.local()
+
+
+def _rows_per_chunk(item):
+    # chunk and store the data by (uncompressed) size
+    # increasing the rows per chunk by 1 because the value maybe 0
+    # Doesn't make much difference in the general case
+    # Will fail if row_size is greater than MAX_DOC_SIZE
+    row_size = int(item.dtype.itemsize * np.prod(item.shape[1:]))
+    return int(_CHUNK_SIZE / row_size) + 1
+
+
+def _leaf_hashes(item, rows):
+    """The SHA1 digests of the consecutive blocks of rows of item, hashed in parallel"""
+    blocks = [item[i: i + rows] for i in range(0, len(item), rows)]
+    return _compression.parallel_map(lambda block: hashlib.sha1(np.ascontiguousarray(block)).digest(), blocks)
+
+
+def _bulk_write(collection, bulk):
+    if bulk:
+        try:
+            collection.bulk_write(bulk, ordered=False)
+        except BulkWriteError as bwe:
+            logger.error(f"Bulk write failed with details: {bwe.details} (Exception: {bwe})")
+            raise
+
+
+def _get_segment_writer_pool():
+    global _segment_writer_pool
+    if _segment_writer_pool is None:
+        _segment_writer_pool = ThreadPool(ARGUS_WRITE_IN_FLIGHT)
+    return _segment_writer_pool
+
+
+def _get_segment_reader_pool():
+    global _segment_reader_pool
+    if _segment_reader_pool is None:
+        _segment_reader_pool = ThreadPool(max(ARGUS_ITERATOR_READ_AHEAD, 1))
+    return _segment_reader_pool
+
+
+class _SegmentWriter:
+    """
+    Sends the segment updates of a write to MongoDB in bulk writes of about ARGUS_WRITE_BATCH_SIZE bytes,
+    from the segment writer threads, while the caller goes on compressing. Waits for a bulk write to
+    complete (raising its error) when ARGUS_WRITE_IN_FLIGHT of them are in flight already.
+    """
+
+    def __init__(self, collection):
+        self._collection = collection
+        self._bulk, self._size = [], 0
+        self._pending = deque()
+
+    def add(self, update, size=0):
+        self._bulk.append(update)
+        self._size += size
+        if self._size >= ARGUS_WRITE_BATCH_SIZE:
+            self._send()
+
+    def _send(self):
+        bulk, self._bulk, self._size = self._bulk, [], 0
+        if not bulk:
+            return
+        if ARGUS_WRITE_IN_FLIGHT < 1:
+            _bulk_write(self._collection, bulk)
+            return
+        while len(self._pending) >= ARGUS_WRITE_IN_FLIGHT:
+            self._pending.popleft().get()
+        self._pending.append(_get_segment_writer_pool().apply_async(_bulk_write, (self._collection, bulk)))
+
+    def flush(self):
+        """Send the remaining updates and wait for all the bulk writes"""
+        self._send()
+        while self._pending:
+            self._pending.popleft().get()
+
+    def abort(self):
+        """Wait for the bulk writes in flight, ignoring their errors"""
+        while self._pending:
+            self._pending.popleft().wait()
+
+
+@contextmanager
+def batched_segment_writes():
+    """
+    Within the context, NdarrayStore writes on this thread share one _SegmentWriter per collection, so the segments
+    of many (small) symbols go to MongoDB in a few bulk writes, and put off their check_written until the segments
+    have all been sent. Yields a dict which, once the context exits, holds symbol -> exception for the symbols
+    whose segments failed to be written.
+    """
+    if getattr(_batched_writes, "writers", None) is not None:
+        raise ArgusException("Segment writes are already being batched on this thread")
+    _batched_writes.writers, _batched_writes.checks = {}, []
+    failed = {}
+    try:
+        yield failed
+        for writer in _batched_writes.writers.values():
+            try:
+                writer.flush()
+            except Exception as e:
+                # Unordered bulk writes go on past errors: the checks below tell which symbols were hit
+                logger.error(f"Batched segment write failed: {e}")
+    finally:
+        writers, checks = _batched_writes.writers, _batched_writes.checks
+        _batched_writes.writers = _batched_writes.checks = None
+        for writer in writers.values():
+            writer.abort()
+    failed.update(_check_written_batch(checks))
+
+
+def _check_written_batch(checks):
+    """
+    NdarrayStore.check_written for each of the (collection, symbol, version) in checks, counting the segments
+    of all of them with one aggregation per collection. Returns symbol -> exception for the failed checks.
+    """
+    failed = {}
+    by_collection = {}
+    for collection, symbol, version in checks:
+        by_collection.setdefault(collection.full_name, (collection, []))[1].append((symbol, version))
+    for collection, coll_checks in by_collection.values():
+        specs = []
+        for symbol, version in coll_checks:
+            if version.get(FW_POINTERS_CONFIG_KEY) == FwPointersCfg.DISABLED.name:
+                specs.append({"symbol": symbol, "parent": version_base_or_id(version)})
+            else:
+                specs.append({"symbol": symbol, "sha": {"$in": version[FW_POINTERS_REFS_KEY]}})
+        try:
+            counts = {
+                x["_id"]: x["count"]
+                for x in collection.aggregate(
+                    [{"$match": {"$or": specs}}, {"$group": {"_id": "$symbol", "count": {"$sum": 1}}}]
+                )
+            }
+        except OperationFailure as e:
+            logger.warning(f"Failed to count the written segments of {len(coll_checks)} symbols: {e}")
+            counts = {}
+        for symbol, version in coll_checks:
+            if (
+                counts.get(symbol) == version["segment_count"]
+                and version.get(FW_POINTERS_CONFIG_KEY) != FwPointersCfg.HYBRID.name
+            ):
+                continue
+            # Mismatched, or needing the reconcile check: raise the error check_written does
+            try:
+                NdarrayStore.check_written(collection, symbol, version)
+            except Exception as e:
+                failed[symbol] = e
+    return failed
+
+
+def _cached_segments(collection, symbol, segment_cache, shas):
+    """
+    The segment documents with shas: those in the segment cache from it, and then the others from collection,
+    which are added to the cache.
+    """
+    missing = []
+    for sha in shas:
+        doc = segment_cache.get(sha)
+        if doc is None:
+            missing.append(sha)
+        else:
+            yield doc
+    if missing:
+        for doc in collection.find({"symbol": symbol, "sha": {"$in": missing}}):
+            segment_cache.put(doc["sha"], doc)
+            yield doc
+
+
+def _compress_and_hash(store, symbol, codec, job):
+    """
+    Compress a row range of the item into its segment document and checksum it in one pass. job is the
+    (segment, rows) pair. Returns the document, with its sha, and the SHA1 of the uncompressed rows (the
+    leaf of the item's hash tree).
+    """
+    segment, chunk = job
+    doc = store._compress_segments([chunk], codec=codec)[0]
+    doc["segment"] = segment
+    doc["sha"] = checksum(symbol, doc)
+    return doc, hashlib.sha1(np.ascontiguousarray(chunk)).digest()
+
+
+def _write_segment_worker(store, shm_name, dtype, shape, symbol, codec, job):
+    """
+    _compress_and_hash the rows [start, stop) of the item held in the shared memory block shm_name, where
+    job is (start, stop, segment) (runs in the compression process pool).
+    """
+    start, stop, segment = job
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        item = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+        result = _compress_and_hash(store, symbol, codec, (segment, item[start:stop]))
+        # The views on the block must be gone before it can be closed
+        del item
+    finally:
+        shm.close()
+    return result
 
 
 def _promote_struct_dtypes(dtype1, dtype2):
@@ -176,6 +388,19 @@ def _update_fw_pointers(collection, symbol, version, previous_version, is_append
     version[FW_POINTERS_REFS_KEY] = list(version_shas)
 
 
+def _segment_columns(segment, records, fields=None):
+    """
+    The [name, dtype, start, end] entries of a column-oriented segment for the (wanted) fields of records.
+    """
+    if records is None:
+        raise DataIntegrityException(f"Column-oriented segment {segment['segment']} for a non-structured dtype")
+    missing = set(records.dtype.names if fields is None else fields) - set(c[0] for c in segment["columns"])
+    missing &= set(records.dtype.names)
+    if missing:
+        raise DataIntegrityException(f"Segment {segment['segment']} is missing columns {sorted(missing)}")
+    return [c for c in segment["columns"] if fields is None or c[0] in fields]
+
+
 def _spec_fw_pointers_aware(symbol, version, from_index=None, to_index=None):
     """
     This method updates the find query filter spec used to read the segment for a version.
@@ -251,7 +476,8 @@ class NdarrayStore:
       u'dtype': u'float64',
       u'dtype_metadata': {},
       u'segment_count': 1, #only 1 segment included in this version
-      u'sha': Binary('.........', 0),
+      u'sha': Binary('.........', 0), # sha1 of the sha1s of each block of sha_tree rows of the data
+      u'sha_tree': 131073, # rows per block of the sha (versions without it have the sha1 of the whole data)
       u'shape': [-1],
       },
 
@@ -275,6 +501,7 @@ class NdarrayStore:
      #first chunk written:
      {u'_id': ObjectId('55fa9a778b376a68efdd10e3'),
       u'compressed': True, #data is lz4 compressed on write()
+      u'codec': u'zstd:9+shuffle', #only for libraries with a COMPRESSION codec set, see argus._compression
       u'data': Binary('...........', 0),
       u'parent': [ObjectId('55fa9a7781f12654382e58b8')],
       u'segment': 9, #10 rows in the data up to this segment, so last row is 9
@@ -365,48 +592,336 @@ class NdarrayStore:
         ret["type"] = version["type"]
         ret["handler"] = self.__class__.__name__
         ret["rows"] = int(version["up_to"])
+        if "compression" in version:
+            ret["compression"] = version["compression"]
         return ret
 
     @staticmethod
     def read_options():
         return ["from_version"]
 
-    def read(self, argus_lib, version, symbol, read_preference=None, **kwargs):
+    def read(self, argus_lib, version, symbol, read_preference=None, fields=None, prefetched=None, **kwargs):
         index_range = self._index_range(version, symbol, **kwargs)
         collection = argus_lib.get_top_level_collection()
         if read_preference:
             collection = collection.with_options(read_preference=read_preference)
-        return self._do_read(collection, version, symbol, index_range=index_range)
+        item = self._do_read(collection, version, symbol, index_range=index_range, fields=fields, prefetched=prefetched)
+        from_version = kwargs.get("from_version")
+        if from_version and index_range[0] == from_version["up_to"]:
+            # Just the rows after from_version, rather than from the start of the segment holding the first of them
+            from_index, to_index = self._read_bounds(version, index_range)
+            rows = max(to_index - from_index, 0)
+            if rows < len(item):
+                item = item[len(item) - rows:]
+        return item
+
+    def batch_read(self, argus_lib, versions, read_preference=None, **kwargs):
+        """
+        Read many symbols at once. The segments of up to ARGUS_BATCH_READ_SYMBOLS symbols are fetched together,
+        with one layout and one data query, and that group of symbols is decompressed and deserialized in parallel
+        before the next group is fetched.
+
+        Parameters
+        ----------
+        versions : `dict`
+            symbol -> version document to read
+        read_preference, kwargs :
+            as for read, applied to every symbol
+
+        Returns
+        -------
+        dict of symbol -> the data read, or the exception raised reading it
+        """
+        collection = argus_lib.get_top_level_collection()
+        if read_preference:
+            collection = collection.with_options(read_preference=read_preference)
+        prefetched = {}
+
+        def _read(symbol):
+            try:
+                return self.read(
+                    argus_lib,
+                    versions[symbol],
+                    symbol,
+                    read_preference=read_preference,
+                    prefetched=prefetched.pop(symbol),
+                    **kwargs,
+                )
+            except Exception as e:
+                return e
+
+        results = {}
+        symbols = list(versions)
+        for i in range(0, len(symbols), ARGUS_BATCH_READ_SYMBOLS):
+            group = symbols[i: i + ARGUS_BATCH_READ_SYMBOLS]
+            layout_specs, specs = [], []
+            for symbol in group:
+                version = versions[symbol]
+                from_index, to_index = self._read_bounds(version, self._index_range(version, symbol, **kwargs))
+                layout_specs.append(_spec_fw_pointers_aware(symbol, version, None, to_index))
+                specs.append(_spec_fw_pointers_aware(symbol, version, from_index, to_index))
+            try:
+                segment_ends = {symbol: [] for symbol in group}
+                for x in collection.find(
+                    {"$or": layout_specs}, projection={"symbol": 1, "segment": 1, "_id": 0}, sort=[("segment", 1)]
+                ):
+                    segment_ends[x["symbol"]].append(x["segment"])
+                segments = {symbol: [] for symbol in group}
+                for doc in collection.find({"$or": specs}):
+                    segments[doc["symbol"]].append(doc)
+            except Exception as e:
+                results.update((symbol, e) for symbol in group)
+                continue
+            prefetched.update((symbol, (segment_ends[symbol], segments.pop(symbol))) for symbol in group)
+            # Deserialize the group before fetching the next one, so only one group's segments are held at once
+            results.update(zip(group, _compression.parallel_map(_read, group)))
+        return results
+
+    def iterator(self, argus_lib, version, symbol, rows_per_batch=None, read_preference=None, fields=None, **kwargs):
+        """
+        Read the item in batches of whole segments, of at least rows_per_batch rows each (but the last).
+        The segments of the next batches are fetched and decompressed in the background while a batch is
+        being consumed (see ARGUS_ITERATOR_READ_AHEAD), so only a few batches are held in memory at once.
+        kwargs (e.g. date_range) select the segments to read, as for read.
+        """
+        rows_per_batch = ARGUS_ITERATOR_ROWS_PER_BATCH if rows_per_batch is None else rows_per_batch
+        collection = argus_lib.get_top_level_collection()
+        if read_preference:
+            collection = collection.with_options(read_preference=read_preference)
+        from_index, to_index = self._read_bounds(version, self._index_range(version, symbol, **kwargs))
+        from_version = kwargs.get("from_version")
+        # Just the rows after from_version, rather than from the start of the segment holding the first of them
+        from_row = from_index if from_version and from_index == from_version["up_to"] else None
+
+        segment_cache = get_segment_cache()
+        projection = {"segment": 1, "_id": 0}
+        if segment_cache is not None:
+            projection["sha"] = 1
+        layout = list(
+            collection.find(
+                _spec_fw_pointers_aware(symbol, version, None, to_index), projection=projection, sort=[("segment", 1)]
+            )
+        )
+        if from_index is None and version.get("segment_count") is not None and len(layout) != version["segment_count"]:
+            raise OperationFailure(
+                "Incorrect number of segments returned for {}:{}.  Expected: {}, but got {}. {}".format(
+                    symbol,
+                    version["version"],
+                    version["segment_count"],
+                    len(layout),
+                    collection.database.name + "." + collection.name,
+                )
+            )
+
+        def _batches():
+            # (end of the segment before the batch, the segments of the batch)
+            previous, batch = None, []
+            for i, x in enumerate(layout):
+                if from_index is not None and x["segment"] < from_index:
+                    continue
+                if not batch:
+                    previous = layout[i - 1]["segment"] if i else None
+                batch.append(x)
+                if x["segment"] + 1 - (0 if previous is None else previous + 1) >= rows_per_batch:
+                    yield previous, batch
+                    batch = []
+            if batch:
+                yield previous, batch
+
+        def _read_batch(batch):
+            previous, segments = batch
+            ends = [x["segment"] for x in segments]
+            if segment_cache is not None:
+                docs = _cached_segments(collection, symbol, segment_cache, [x["sha"] for x in segments])
+            else:
+                docs = collection.find(_spec_fw_pointers_aware(symbol, version, ends[0], ends[-1] + 1))
+            prefetched = ([] if previous is None else [previous]) + ends, docs
+            item = self._do_read(
+                collection, version, symbol, index_range=(ends[0], ends[-1] + 1), fields=fields, prefetched=prefetched
+            )
+            first_row = 0 if previous is None else previous + 1
+            if from_row is not None and first_row < from_row:
+                item = item[from_row - first_row:]
+            return item
+
+        return _compression.read_ahead(_read_batch, _batches(), ARGUS_ITERATOR_READ_AHEAD, _get_segment_reader_pool())
 
-    def _do_read(self, collection, version, symbol, index_range=None):
+    @staticmethod
+    def _read_bounds(version, index_range):
         """
-        index_range is a 2-tuple of integers - a [from, to) range of segments to be read.
-            Either from or to can be None, indicating no bound.
+        The [from, to) range of segment numbers to read for index_range. from is None when reading from the start.
         """
         from_index = index_range[0] if index_range else None
         to_index = version["up_to"]
         if index_range and index_range[1] and index_range[1] < version["up_to"]:
             to_index = index_range[1]
+        return from_index, to_index
+
+    @staticmethod
+    def _check_segment_count(collection, version, symbol, expected, count):
+        """Check that the correct number of segments has been returned, when it's known (expected isn't None)"""
+        if expected is not None and count != expected:
+            raise OperationFailure(
+                "Incorrect number of segments returned for {}:{}.  Expected: {}, but got {}. {}".format(
+                    symbol,
+                    version["version"],
+                    expected,
+                    count,
+                    collection.database.name + "." + collection.name,
+                )
+            )
+
+    def _do_read(self, collection, version, symbol, index_range=None, fields=None, prefetched=None):
+        """
+        index_range is a 2-tuple of integers - a [from, to) range of segments to be read.
+            Either from or to can be None, indicating no bound.
+        fields is an optional list of the fields of a structured dtype which are needed. Column-oriented segments
+            only decompress these, leaving the other fields of the returned array uninitialised.
+        prefetched is an optional 2-tuple of the sorted segment numbers up to the end of index_range (or from the
+            one before it) and the segment documents in index_range, already fetched or queried for (by batch_read
+            or iterator). No other queries are made when given.
+        """
+        from_index, to_index = self._read_bounds(version, index_range)
         segment_count = version.get("segment_count") if from_index is None else None
 
         spec = _spec_fw_pointers_aware(symbol, version, from_index, to_index)
+        dtype = self._dtype(version["dtype"], version.get("dtype_metadata", {}))
+
+        # Segments are numbered by their last row, so the row range of every segment is known from the end of the
+        # one before it. Without a layout, the data segments are streamed in segment order (served by the
+        # (symbol, parent, segment) and (symbol, sha, segment) indexes) and each one is decompressed straight into
+        # its place in a preallocated output buffer. With the segment cache, a covered query for the layout gives
+        # the shas of the segments, which tell which ones need to be fetched. Prefetched segments come with their
+        # layout, in any order.
+        segment_cache = get_segment_cache() if prefetched is None else None
+        if prefetched is not None:
+            segment_ends = list(prefetched[0])
+        elif segment_cache is not None:
+            layout = list(
+                collection.find(
+                    _spec_fw_pointers_aware(symbol, version, None, to_index),
+                    projection={"segment": 1, "sha": 1, "_id": 0},
+                    sort=[("segment", 1)],
+                )
+            )
+            segment_ends = [x["segment"] for x in layout]
+        else:
+            segment_ends = None
 
-        data = bytearray()
-        i = -1
-        for i, x in enumerate(sorted(collection.find(spec), key=itemgetter("segment"))):
-            data.extend(decompress(x["data"]) if x["compressed"] else x["data"])
+        if segment_ends is None:
+            segments = collection.find(spec, sort=[("segment", 1)])
+            segment_starts = None
+        else:
+            segment_starts = dict(zip(segment_ends, [0] + [end + 1 for end in segment_ends[:-1]]))
+            if from_index is not None:
+                segment_ends = [end for end in segment_ends if end >= from_index]
+            self._check_segment_count(collection, version, symbol, segment_count, len(segment_ends))
+            if not segment_ends:
+                return np.frombuffer(b"", dtype=dtype).reshape(version.get("shape", (-1)))
+            if prefetched is not None:
+                segments = iter(prefetched[1])
+            else:
+                shas = {x["segment"]: x["sha"] for x in layout}
+                segments = _cached_segments(collection, symbol, segment_cache, [shas[end] for end in segment_ends])
+
+        # The first segment we get back tells us the size of a row (and where the rows read start, when not
+        # known from the layout), hence the size of the output buffer
+        first = next(segments, None)
+        if first is None:
+            if segment_starts is not None:
+                raise OperationFailure(f"Segments of {symbol}:{version['version']} changed while reading")
+            self._check_segment_count(collection, version, symbol, segment_count, 0)
+            return np.frombuffer(b"", dtype=dtype).reshape(version.get("shape", (-1)))
+        if segment_starts is not None and first["segment"] not in segment_starts:
+            raise OperationFailure(f"Segments of {symbol}:{version['version']} changed while reading")
+        if "columns" in first:
+            row_size = dtype.itemsize
+            if segment_starts is not None:
+                start_row = segment_starts[segment_ends[0]]
+            elif from_index is None:
+                start_row = 0
+            else:
+                name, col_dtype, offset, end = first["columns"][0]
+                column = first["data"][offset:end]
+                if first["compressed"]:
+                    column = decompress(column, first.get("codec"), np.dtype(col_dtype).itemsize)
+                start_row = first["segment"] + 1 - len(column) // np.dtype(col_dtype).itemsize
+        else:
+            first_data = (
+                decompress(first["data"], first.get("codec"), dtype.itemsize) if first["compressed"] else first["data"]
+            )
+            first = dict(first, data=first_data, compressed=False)
+            if segment_starts is not None:
+                row_size = len(first["data"]) // (first["segment"] + 1 - segment_starts[first["segment"]])
+                start_row = segment_starts[segment_ends[0]]
+            elif from_index is None:
+                row_size = len(first["data"]) // (first["segment"] + 1)
+                start_row = 0
+            else:
+                row_size = dtype.itemsize * int(np.prod(version.get("shape", [-1])[1:]))
+                start_row = first["segment"] + 1 - len(first["data"]) // row_size
+
+        # Without a layout the rows read end at the last segment before to_index: the buffer is trimmed to it
+        end_row = segment_ends[-1] + 1 if segment_ends is not None else to_index
+        buf = np.empty((end_row - start_row) * row_size, dtype=np.uint8)
+        records = buf.view(dtype) if dtype.names else None
+        remaining = set(segment_ends) if segment_ends is not None else None
+        read = [start_row - 1, 0]  # the end of the last segment read, and the number of segments read
+
+        def _chunks():
+            for doc in itertools.chain((first,), segments):
+                if remaining is not None:
+                    if doc["segment"] not in remaining:
+                        raise OperationFailure(f"Unexpected segment {doc['segment']} returned for {symbol}")
+                    remaining.remove(doc["segment"])
+                    seg_start = segment_starts[doc["segment"]] - start_row
+                else:
+                    if doc["segment"] <= read[0] or doc["segment"] >= end_row:
+                        raise OperationFailure(f"Unexpected segment {doc['segment']} returned for {symbol}")
+                    seg_start = read[0] + 1 - start_row
+                    read[0] = doc["segment"]
+                read[1] += 1
+                seg_end = doc["segment"] + 1 - start_row
+                if "columns" in doc:
+                    for name, col_dtype, offset, end in _segment_columns(doc, records, fields):
+                        if col_dtype != str(dtype.fields[name][0]):
+                            raise DataIntegrityException(
+                                f"Segment {doc['segment']} of {symbol} holds {name} as {col_dtype}, expected "
+                                f"{dtype.fields[name][0]}"
+                            )
+                        yield (
+                            records[name][seg_start:seg_end],
+                            doc["data"][offset:end],
+                            doc["compressed"],
+                            doc.get("codec"),
+                        )
+                else:
+                    # Viewed as opaque dtype sized items, which the shuffle filter works on
+                    dest = buf[seg_start * row_size: seg_end * row_size].view(np.dtype((np.void, dtype.itemsize)))
+                    yield dest, doc["data"], doc["compressed"], doc.get("codec")
 
-        # Check that the correct number of segments has been returned
-        if segment_count is not None and i + 1 != segment_count:
+        n_chunks = len(segment_ends) if segment_ends is not None else version.get("segment_count")
+        try:
+            decompress_into(_chunks(), n_chunks=n_chunks, decompressor=decompress)
+        except ValueError as e:
+            raise OperationFailure(f"Mismatched segment size for {symbol}:{version['version']}: {e}")
+
+        if remaining:
             raise OperationFailure(
                 "Incorrect number of segments returned for {}:{}.  Expected: {}, but got {}. {}".format(
-                    symbol, version["version"], segment_count, i + 1, collection.database.name + "." + collection.name
+                    symbol,
+                    version["version"],
+                    len(segment_ends),
+                    len(segment_ends) - len(remaining),
+                    collection.database.name + "." + collection.name,
                 )
             )
+        if segment_ends is None:
+            self._check_segment_count(collection, version, symbol, segment_count, read[1])
+            buf = buf[: (read[0] + 1 - start_row) * row_size]
 
-        dtype = self._dtype(version["dtype"], version.get("dtype_metadata", {}))
-        rtn = np.frombuffer(data, dtype=dtype).reshape(version.get("shape", (-1)))
-        return rtn
+        # A writeable view of the buffer lets the pandas stores build their objects on top of it without copying
+        return buf.view(dtype).reshape(version.get("shape", (-1)))
 
     def _promote_types(self, dtype, dtype_str):
         if dtype_str == str(dtype):
@@ -445,6 +960,7 @@ class NdarrayStore:
         # Create an empty entry to prevent cases where this field is accessed without being there. (#710)
         if version[FW_POINTERS_CONFIG_KEY] != FwPointersCfg.DISABLED.name:
             version[FW_POINTERS_REFS_KEY] = list()
+        codec = self._select_codec(argus_lib, version, item, str(dtype), previous_version)
 
         if str(dtype) != previous_version["dtype"] or _fw_pointers_convert_append_to_write(previous_version):
             logger.debug(f"Converting {symbol} from {previous_version['dtype']} to {str(dtype)}")
@@ -460,9 +976,9 @@ class NdarrayStore:
 
             item = np.concatenate([old_arr, item])
             version["up_to"] = len(item)
-            version["sha"] = self.checksum(item)
+            version["sha"] = self._do_write(collection, version, symbol, item, previous_version, codec=codec)
+            version["sha_tree"] = _rows_per_chunk(item)
             version["base_sha"] = version["sha"]
-            self._do_write(collection, version, symbol, item, previous_version)
         else:
             version["dtype"] = previous_version["dtype"]
             version["dtype_metadata"] = previous_version["dtype_metadata"]
@@ -478,9 +994,9 @@ class NdarrayStore:
                 )
                 dirty_append = True  # force a concat and re-write (use new base version id)
 
-            self._do_append(collection, version, symbol, item, previous_version, dirty_append)
+            self._do_append(collection, version, symbol, item, previous_version, dirty_append, codec=codec)
 
-    def _do_append(self, collection, version, symbol, item, previous_version, dirty_append):
+    def _do_append(self, collection, version, symbol, item, previous_version, dirty_append, codec=None):
         data = item.tostring()
         # Compatibility with Argus 1.22.0 that didn't write base_sha into the version document
         version["base_sha"] = previous_version.get("base_sha", Binary(b""))
@@ -533,12 +1049,13 @@ class NdarrayStore:
                     If we concat_and_rewrite here, new chunks will have a different parent id (the _id of this version doc)
                     ...so we can safely write them.
                     """
-                    self._concat_and_rewrite(collection, version, symbol, item, previous_version)
+                    self._concat_and_rewrite(collection, version, symbol, item, previous_version, codec=codec)
                     return
 
-                if "segment_index" in previous_version:
+                # Appending to an empty item starts its indexes
+                if "segment_index" in previous_version or not previous_version["up_to"]:
                     segment_index = self._segment_index(
-                        item,
+                        item[-1:],
                         existing_index=previous_version.get("segment_index"),
                         start=previous_version["up_to"],
                         new_segments=[
@@ -547,16 +1064,30 @@ class NdarrayStore:
                     )
                     if segment_index:
                         version["segment_index"] = segment_index
+                if "segment_ranges" in previous_version or not previous_version["up_to"]:
+                    segment_ranges = self._segment_ranges(
+                        [self._date_bounds(item)],
+                        previous_version.get("segment_ranges"),
+                        start=previous_version["up_to"],
+                        new_segments=[segment["segment"]],
+                    )
+                    if segment_ranges:
+                        version["segment_ranges"] = segment_ranges
                 logger.debug("Appended segment %d for parent %s" % (segment["segment"], version["_id"]))
             else:
                 if "segment_index" in previous_version:
                     version["segment_index"] = previous_version["segment_index"]
+                if "segment_ranges" in previous_version:
+                    version["segment_ranges"] = previous_version["segment_ranges"]
 
         else:  # Too much data has been appended now, so rewrite (and compress/chunk).
-            self._concat_and_rewrite(collection, version, symbol, item, previous_version)
-
-    def _concat_and_rewrite(self, collection, version, symbol, item, previous_version):
+            self._concat_and_rewrite(collection, version, symbol, item, previous_version, codec=codec)
 
+    def _concat_and_rewrite(self, collection, version, symbol, item, previous_version, codec=None, pieces=None):
+        """
+        Rewrite the appended segments of previous_version, and its last compressed one, with item appended.
+        pieces: the row chunks of item, streamed from an incremental serializer instead of item.
+        """
         version.pop("base_version_id", None)
 
         # Figure out which is the last 'full' chunk
@@ -593,12 +1124,29 @@ class NdarrayStore:
 
         # Only read back the section that needs to be compressed here (index_range=...)
         old_arr = self._do_read(collection, previous_version, symbol, index_range=read_index_range)
-        if len(item) == 0:
+        if pieces is not None:
+            logger.debug(f"Rewrite and compress/chunk {symbol}, streaming the appended item")
+            rows = _rows_per_chunk(old_arr)
+            old_pieces = [old_arr[i: i + rows] for i in range(0, len(old_arr), rows)]
+            self._do_write_pieces(
+                collection,
+                version,
+                symbol,
+                itertools.chain(old_pieces, pieces),
+                previous_version,
+                segment_offset=read_index_range[0],
+                codec=codec,
+            )
+        elif len(item) == 0:
             logger.debug(f"Rewrite and compress/chunk item {symbol}, rewrote old_arr")
-            self._do_write(collection, version, symbol, old_arr, previous_version, segment_offset=read_index_range[0])
+            self._do_write(
+                collection, version, symbol, old_arr, previous_version, segment_offset=read_index_range[0], codec=codec
+            )
         elif len(old_arr) == 0:
             logger.debug(f"Rewrite and compress/chunk item {symbol}, wrote item")
-            self._do_write(collection, version, symbol, item, previous_version, segment_offset=read_index_range[0])
+            self._do_write(
+                collection, version, symbol, item, previous_version, segment_offset=read_index_range[0], codec=codec
+            )
         else:
             logger.debug(f"Rewrite and compress/chunk {symbol}, np.concatenate {item.dtype} to {old_arr.dtype}")
             self._do_write(
@@ -608,6 +1156,7 @@ class NdarrayStore:
                 np.concatenate([old_arr, item]),
                 previous_version,
                 segment_offset=read_index_range[0],
+                codec=codec,
             )
         if unchanged_segments:
             if version.get(FW_POINTERS_CONFIG_KEY) != FwPointersCfg.ENABLED.name:
@@ -625,6 +1174,11 @@ class NdarrayStore:
 
     @staticmethod
     def check_written(collection, symbol, version):
+        if getattr(_batched_writes, "checks", None) is not None:
+            # The segments may not have been sent yet: checked when the batched writes are done
+            _batched_writes.checks.append((collection, symbol, version))
+            return
+
         # Currently only called from methods which guarantee 'base_version_id' is not populated.
         # Make it nonetheless safe for the general case.
         parent_id = version_base_or_id(version)
@@ -666,6 +1220,24 @@ class NdarrayStore:
         sha.update(item.tostring())
         return Binary(sha.digest())
 
+    def _prefix_leaves(self, item, previous_version):
+        """
+        The hash tree leaves of item if its first rows are the item of previous_version, else None.
+        Versions written before the hash tree (without "sha_tree") are compared with the plain checksum.
+        """
+        up_to = previous_version["up_to"]
+        rows = previous_version.get("sha_tree")
+        if rows is None:
+            if self.checksum(item[:up_to]) != previous_version["sha"]:
+                return None
+            return _leaf_hashes(item, _rows_per_chunk(item))
+        # The full blocks of the previous version are also leaves of item, only its last block needs hashing again
+        full = up_to - up_to % rows
+        leaves = _leaf_hashes(item[:up_to], rows)
+        if tree_checksum(leaves) != previous_version["sha"]:
+            return None
+        return leaves[: full // rows] + _leaf_hashes(item[full:], rows)
+
     def write(self, argus_lib, version, symbol, item, previous_version, dtype=None):
         collection = argus_lib.get_top_level_collection()
         if item.dtype.hasobject:
@@ -678,136 +1250,366 @@ class NdarrayStore:
         version["dtype_metadata"] = dict(dtype.metadata or {})
         version["type"] = self.TYPE
         version["up_to"] = len(item)
-        version["sha"] = self.checksum(item)
         version[FW_POINTERS_CONFIG_KEY] = ARGUS_FORWARD_POINTERS_CFG.name
         # Create an empty entry to prevent cases where this field is accessed without being there. (#710)
         if version[FW_POINTERS_CONFIG_KEY] != FwPointersCfg.DISABLED.name:
             version[FW_POINTERS_REFS_KEY] = list()
+        codec = self._select_codec(argus_lib, version, item, version["dtype"], previous_version)
 
-        if previous_version:
-            if (
-                    "sha" in previous_version
-                    and previous_version["dtype"] == version["dtype"]
-                    and self.checksum(item[: previous_version["up_to"]]) == previous_version["sha"]
-            ):
+        if previous_version and "sha" in previous_version and previous_version["dtype"] == version["dtype"]:
+            leaves = self._prefix_leaves(item, previous_version)
+            if leaves is not None:
                 # The first n rows are identical to the previous version, so just append.
                 # Do a 'dirty' append (i.e. concat & start from a new base version) for safety
+                version["sha"] = tree_checksum(leaves)
+                version["sha_tree"] = previous_version.get("sha_tree") or _rows_per_chunk(item)
                 self._do_append(
-                    collection, version, symbol, item[previous_version["up_to"]:], previous_version, dirty_append=True
+                    collection,
+                    version,
+                    symbol,
+                    item[previous_version["up_to"]:],
+                    previous_version,
+                    dirty_append=True,
+                    codec=codec,
                 )
                 return
 
+        # The sha is the root of a hash tree over the segments, so it is computed along with their compression
+        version["sha"] = self._do_write(collection, version, symbol, item, previous_version, codec=codec)
+        version["sha_tree"] = _rows_per_chunk(item)
         version["base_sha"] = version["sha"]
-        self._do_write(collection, version, symbol, item, previous_version)
 
-    def _do_write(self, collection, version, symbol, item, previous_version, segment_offset=0):
+    def _write_incremental(self, argus_lib, version, symbol, serializer, previous_version, dtype):
+        """
+        Write the item of an incremental serializer (see argus.serialization.incremental): its row chunks are
+        compressed and written as they are serialized, so the whole serialized item is never held in memory.
+        Unlike write(), this always writes a new base version (the segments unchanged from the previous
+        version are still shared with it).
+        """
+        collection = argus_lib.get_top_level_collection()
+        if serializer.dtype.hasobject:
+            raise UnhandledDtypeException()
 
-        row_size = int(item.dtype.itemsize * np.prod(item.shape[1:]))
+        version["dtype"] = str(dtype)
+        version["shape"] = (-1,) + tuple(serializer.shape[1:])
+        version["dtype_metadata"] = dict(dtype.metadata or {})
+        version["type"] = self.TYPE
+        version["up_to"] = len(serializer)
+        version[FW_POINTERS_CONFIG_KEY] = ARGUS_FORWARD_POINTERS_CFG.name
+        # Create an empty entry to prevent cases where this field is accessed without being there. (#710)
+        if version[FW_POINTERS_CONFIG_KEY] != FwPointersCfg.DISABLED.name:
+            version[FW_POINTERS_REFS_KEY] = list()
 
-        # chunk and store the data by (uncompressed) size
-        # increasing the rows per chunk by 1 because the value maybe 0
-        # Doesn't make much difference in the general case
-        # Will fail if row_size is greater than MAX_DOC_SIZE
-        rows_per_chunk = int(_CHUNK_SIZE / row_size) + 1
+        pieces = (chunk for chunk, _, _, _ in serializer.generator())
+        first = next(pieces)
+        codec = self._select_codec(argus_lib, version, first, version["dtype"], previous_version)
+        version["sha"] = self._do_write_pieces(
+            collection, version, symbol, itertools.chain([first], pieces), previous_version, codec=codec
+        )
+        version["sha_tree"] = serializer.rows_per_chunk
+        version["base_sha"] = version["sha"]
 
-        symbol_all_previous_shas, version_shas = set(), set()
-        if previous_version:
-            symbol_all_previous_shas.update(
-                Binary(x["sha"]) for x in collection.find({"symbol": symbol}, projection={"sha": 1, "_id": 0})
-            )
+    def _append_incremental(self, argus_lib, version, symbol, serializer, previous_version, dtype):
+        """
+        Append the item of an incremental serializer, streaming its row chunks into the rewrite of the last
+        segments of previous_version (see _write_incremental). Returns False, without writing, unless the
+        item has the dtype of previous_version and can be appended without converting it.
+        """
+        if (
+                previous_version["up_to"] == 0
+                or str(dtype) != previous_version["dtype"]
+                or previous_version.get("shape", [-1]) != [-1] + list(serializer.shape[1:])
+                or _fw_pointers_convert_append_to_write(previous_version)
+        ):
+            return False
+        collection = argus_lib.get_top_level_collection()
+
+        version["type"] = self.TYPE
+        version[FW_POINTERS_CONFIG_KEY] = ARGUS_FORWARD_POINTERS_CFG.name
+        # Create an empty entry to prevent cases where this field is accessed without being there. (#710)
+        if version[FW_POINTERS_CONFIG_KEY] != FwPointersCfg.DISABLED.name:
+            version[FW_POINTERS_REFS_KEY] = list()
+        version["dtype"] = previous_version["dtype"]
+        version["dtype_metadata"] = previous_version["dtype_metadata"]
+
+        pieces = (chunk for chunk, _, _, _ in serializer.generator())
+        first = next(pieces)
+        codec = self._select_codec(argus_lib, version, first, version["dtype"], previous_version)
+        # Compatibility with Argus 1.22.0 that didn't write base_sha into the version document
+        version["base_sha"] = previous_version.get("base_sha", Binary(b""))
+        version["up_to"] = previous_version["up_to"] + len(serializer)
+        self._concat_and_rewrite(
+            collection, version, symbol, None, previous_version, codec=codec, pieces=itertools.chain([first], pieces)
+        )
+        return True
 
+    def _do_write(self, collection, version, symbol, item, previous_version, segment_offset=0, codec=None):
+        """
+        Compress, checksum and write item as segments from segment_offset. Returns the checksum of item:
+        the root of the hash tree of its segments' uncompressed rows (see tree_checksum).
+        """
+        rows_per_chunk = _rows_per_chunk(item)
         length = len(item)
 
-        if segment_offset > 0 and "segment_index" in previous_version:
-            existing_index = previous_version["segment_index"]
+        # Compress and checksum, each segment in a single pass of a worker
+        bounds = [(start, min(start + rows_per_chunk, length)) for start in range(0, length, rows_per_chunk)]
+        if _compression.COMPRESSION_BACKEND == "process" and len(bounds) > 1:
+            results = self._compress_segments_in_processes(item, symbol, bounds, segment_offset, codec=codec)
         else:
-            existing_index = None
+            results = _compression.parallel_imap(
+                partial(_compress_and_hash, self, symbol, codec),
+                ((stop - 1 + segment_offset, item[start:stop]) for start, stop in bounds),
+            )
 
-        segment_index = []
+        leaves = self._write_segments(
+            collection,
+            version,
+            symbol,
+            results,
+            previous_version,
+            segment_offset,
+            lambda segments: item[np.array(segments, dtype="i8") - segment_offset],
+            lambda _: [self._date_bounds(item[start:stop]) for start, stop in bounds],
+        )
+        return tree_checksum(leaves)
 
-        # Compress
-        idxs = range(int(np.ceil(float(length) / rows_per_chunk)))
-        chunks = [(item[i * rows_per_chunk: (i + 1) * rows_per_chunk]).tostring() for i in idxs]
-        compressed_chunks = compress_array(chunks)
+    def _do_write_pieces(self, collection, version, symbol, pieces, previous_version, segment_offset=0, codec=None):
+        """
+        Like _do_write, for an item given as an iterable of its consecutive row chunks (at least one, none
+        empty), e.g. from an incremental serializer. Each chunk is written as a segment, and is compressed and written while the
+        next ones are produced, so only a bounded number of them is held in memory at once.
+        """
+        last_rows, date_bounds = [], []
+
+        def jobs():
+            end = segment_offset
+            for piece in pieces:
+                end += len(piece)
+                last_rows.append(piece[-1:].copy())
+                date_bounds.append(self._date_bounds(piece))
+                yield end - 1, piece
+
+        pool = _compression._get_compress_process_pool() if _compression.COMPRESSION_BACKEND == "process" else None
+        results = _compression.parallel_imap(partial(_compress_and_hash, self, symbol, codec), jobs(), pool=pool)
+
+        leaves = self._write_segments(
+            collection,
+            version,
+            symbol,
+            results,
+            previous_version,
+            segment_offset,
+            lambda _: np.concatenate(last_rows),
+            lambda _: date_bounds,
+        )
+        return tree_checksum(leaves)
 
-        # Write
-        bulk = []
-        for i, chunk in zip(idxs, compressed_chunks):
-            segment = {
-                "data": Binary(chunk),
-                "compressed": True,
-                "segment": min((i + 1) * rows_per_chunk - 1, length - 1) + segment_offset,
-            }
-            segment_index.append(segment["segment"])
-            sha = checksum(symbol, segment)
-            segment_spec = {"symbol": symbol, "sha": sha, "segment": segment["segment"]}
-
-            if ARGUS_FORWARD_POINTERS_CFG is FwPointersCfg.DISABLED:
-                if sha not in symbol_all_previous_shas:
-                    segment["sha"] = sha
-                    bulk.append(
-                        pymongo.UpdateOne(
-                            segment_spec, {"$set": segment, "$addToSet": {"parent": version["_id"]}}, upsert=True
-                        )
+    def _write_segments(
+        self, collection, version, symbol, results, previous_version, segment_offset, last_rows, date_bounds
+    ):
+        """
+        Write the segment documents of results, the (document, leaf) pairs of _compress_and_hash, in batches
+        as they are produced (see _SegmentWriter). Then update the segment index and counts of version, given
+        the last row of each new segment by last_rows(segments) and its date bounds by date_bounds(segments),
+        and check the write. Returns the leaves.
+        """
+        version_shas = set()
+
+        if segment_offset > 0 and "segment_index" in previous_version:
+            existing_index = previous_version["segment_index"]
+        else:
+            existing_index = None
+        if segment_offset > 0:
+            existing_ranges = previous_version.get("segment_ranges")
+        else:
+            existing_ranges = None
+
+        def add_updates(segments):
+            # Only look up which of the batch's segments exist already, rather than every sha of the symbol
+            existing_shas = set()
+            if previous_version and segments:
+                existing_shas.update(
+                    Binary(x["sha"])
+                    for x in collection.find(
+                        {"symbol": symbol, "sha": {"$in": [s["sha"] for s in segments]}},
+                        projection={"sha": 1, "_id": 0},
                     )
+                )
+            for segment in segments:
+                sha = segment.pop("sha")
+                segment_spec = {"symbol": symbol, "sha": sha, "segment": segment["segment"]}
+
+                if ARGUS_FORWARD_POINTERS_CFG is FwPointersCfg.DISABLED:
+                    if sha not in existing_shas:
+                        segment["sha"] = sha
+                        writer.add(
+                            pymongo.UpdateOne(
+                                segment_spec, {"$set": segment, "$addToSet": {"parent": version["_id"]}}, upsert=True
+                            ),
+                            len(segment["data"]),
+                        )
+                    else:
+                        writer.add(pymongo.UpdateOne(segment_spec, {"$addToSet": {"parent": version["_id"]}}))
                 else:
-                    bulk.append(pymongo.UpdateOne(segment_spec, {"$addToSet": {"parent": version["_id"]}}))
-            else:
-                version_shas.add(sha)
-
-                # We only keep for the records the ID of the version which created the segment.
-                # We also need the uniqueness of the parent field for the (symbol, parent, segment) index,
-                # because upon mongo_retry "dirty_append == True", we compress and only the SHA changes
-                # which raises DuplicateKeyError if we don't have a unique (symbol, parent, segment).
-                set_spec = {"$addToSet": {"parent": version["_id"]}}
-
-                if sha not in symbol_all_previous_shas:
-                    segment["sha"] = sha
-                    set_spec["$set"] = segment
-                    bulk.append(pymongo.UpdateOne(segment_spec, set_spec, upsert=True))
-                elif ARGUS_FORWARD_POINTERS_CFG is FwPointersCfg.HYBRID:
-                    bulk.append(pymongo.UpdateOne(segment_spec, set_spec))
-                # With FwPointersCfg.ENABLED  we make zero updates on existing segment documents, but:
-                #   - write only the new segment(s) documents
-                #   - write the new version document
-                # This helps with performance as we update as less documents as necessary
-
-        if bulk:
-            try:
-                collection.bulk_write(bulk, ordered=False)
-            except BulkWriteError as bwe:
-                logger.error(f"Bulk write failed with details: {bwe.details} (Exception: {bwe})")
-                raise
+                    version_shas.add(sha)
+
+                    # We only keep for the records the ID of the version which created the segment.
+                    # We also need the uniqueness of the parent field for the (symbol, parent, segment) index,
+                    # because upon mongo_retry "dirty_append == True", we compress and only the SHA changes
+                    # which raises DuplicateKeyError if we don't have a unique (symbol, parent, segment).
+                    set_spec = {"$addToSet": {"parent": version["_id"]}}
+
+                    if sha not in existing_shas:
+                        segment["sha"] = sha
+                        set_spec["$set"] = segment
+                        writer.add(pymongo.UpdateOne(segment_spec, set_spec, upsert=True), len(segment["data"]))
+                    elif ARGUS_FORWARD_POINTERS_CFG is FwPointersCfg.HYBRID:
+                        writer.add(pymongo.UpdateOne(segment_spec, set_spec))
+                    # With FwPointersCfg.ENABLED  we make zero updates on existing segment documents, but:
+                    #   - write only the new segment(s) documents
+                    #   - write the new version document
+                    # This helps with performance as we update as less documents as necessary
+
+        segment_index, leaves = [], []
+        batch, batch_size = [], 0
+
+        # Write, overlapping the compression of the next segments
+        shared_writers = getattr(_batched_writes, "writers", None)
+        if shared_writers is None:
+            writer = _SegmentWriter(collection)
+        else:
+            writer = shared_writers.setdefault(collection.full_name, _SegmentWriter(collection))
+        try:
+            for segment, leaf in results:
+                leaves.append(leaf)
+                segment_index.append(segment["segment"])
+                batch.append(segment)
+                batch_size += len(segment["data"])
+                if batch_size >= ARGUS_WRITE_BATCH_SIZE:
+                    add_updates(batch)
+                    batch, batch_size = [], 0
+            add_updates(batch)
+            if shared_writers is None:
+                writer.flush()
+        except BaseException:
+            if shared_writers is None:
+                writer.abort()
+            raise
 
+        segment_ranges = None
+        if segment_offset == 0 or existing_ranges is not None:
+            segment_ranges = self._segment_ranges(
+                date_bounds(segment_index), existing_ranges, start=segment_offset, new_segments=segment_index
+            )
         segment_index = self._segment_index(
-            item, existing_index=existing_index, start=segment_offset, new_segments=segment_index
+            last_rows(segment_index), existing_index=existing_index, start=segment_offset, new_segments=segment_index
         )
         if segment_index:
             version["segment_index"] = segment_index
-        version["segment_count"] = len(chunks)
+        if segment_ranges:
+            version["segment_ranges"] = segment_ranges
+        version["segment_count"] = len(leaves)
         version["append_size"] = 0
         version["append_count"] = 0
 
         _update_fw_pointers(collection, symbol, version, previous_version, is_append=False, shas_to_add=version_shas)
 
         self.check_written(collection, symbol, version)
+        return leaves
 
-    def _segment_index(self, new_data, existing_index, start, new_segments):
+    def _select_codec(self, argus_lib, version, item, dtype, previous_version):
+        """
+        The codec to compress item with. With adaptive compression, the codec chosen for the previous version
+        is kept as long as the dtype doesn't change, and the choice is recorded in the version document.
+        """
+        codec = argus_lib.get_compression()
+        if not is_adaptive(codec):
+            return codec
+        choice = previous_version.get("compression") if previous_version else None
+        if not (choice and choice.get("adaptive") == codec and previous_version["dtype"] == dtype):
+            _, choice = select_codec(codec, lambda: self._codec_samples(item))
+        if choice:
+            version["compression"] = choice
+            return choice["codec"]
+        return None
+
+    def _codec_samples(self, item):
+        """Samples of item for adaptive compression, laid out as _compress_segments compresses it"""
+        return array_samples([item])
+
+    def _compress_segments(self, chunks, codec=None):
+        """
+        Compress the row ranges of the item which are written as segments, returning the body of
+        each segment document. Segments compressed with a codec other than the default record it.
+        """
+        if not chunks:
+            return []
+        data = compress_array([c.tostring() for c in chunks], codec=codec, typesize=chunks[0].dtype.itemsize)
+        segments = [{"data": Binary(c), "compressed": True} for c in data]
+        if codec is not None:
+            for segment in segments:
+                segment["codec"] = codec
+        return segments
+
+    def _compress_segments_in_processes(self, item, symbol, bounds, segment_offset=0, codec=None):
+        """
+        Lazily _compress_and_hash the [start, stop) row ranges of item in the compression process pool. The
+        item is copied once into shared memory, from which the workers slice their own row ranges, so only
+        the compressed segments are pickled back.
+        """
+        shm = shared_memory.SharedMemory(create=True, size=max(item.nbytes, 1))
+        try:
+            shared = np.ndarray(item.shape, dtype=item.dtype, buffer=shm.buf)
+            shared[...] = item
+            del shared
+            yield from _compression.parallel_imap(
+                partial(_write_segment_worker, self, shm.name, item.dtype, item.shape, symbol, codec),
+                [(start, stop, stop - 1 + segment_offset) for start, stop in bounds],
+                pool=_compression._get_compress_process_pool(),
+            )
+        finally:
+            shm.close()
+            shm.unlink()
+
+    def _segment_index(self, last_rows, existing_index, start, new_segments):
         """
         Generate a segment index which can be used in subselect data in _index_range.
         This function must handle both generation of the index and appending to an existing index
 
         Parameters:
         -----------
-        new_data: new data being written (or appended)
+        last_rows: the last row of each new segment being written (or appended)
         existing_index: index field from the versions document of the previous version
         start: first (0-based) offset of the new data
         segments: list of offsets. Each offset is the row index of the
                   the last row of a particular chunk relative to the start of the _original_ item.
-                  array(new_data) - segments = array(offsets in item)
 
         Returns:
         --------
         Library specific index metadata to be stored in the version document.
         """
         pass  # numpy arrays have no index
+
+    def _date_bounds(self, rows):
+        """
+        The (min, max) datetimes of rows, for _segment_ranges, or None if the rows aren't indexed by datetime.
+        """
+        return None  # numpy arrays have no index
+
+    def _segment_ranges(self, date_bounds, existing_ranges, start, new_segments):
+        """
+        Generate the date range of every segment, so that _index_range can pick exactly the segments holding
+        a date range, even when the index isn't sorted.
+
+        Parameters:
+        -----------
+        date_bounds: the _date_bounds of each new segment being written (or appended)
+        existing_ranges: segment_ranges field from the versions document of the previous version
+        start: first (0-based) offset of the new data
+        new_segments: the last row of each new segment
+
+        Returns:
+        --------
+        Library specific index metadata to be stored in the version document, or None.
+        """
+        pass  # numpy arrays have no index
@@ -6,10 +6,11 @@ from bson.binary import Binary
 from pandas import DataFrame, Series
 
 from argus._util import NP_OBJECT_DTYPE
+from argus.serialization.incremental import IncrementalPandasToRecArraySerializer
 from argus.serialization.numpy_records import SeriesSerializer, DataFrameSerializer
-from ._ndarray_store import NdarrayStore
-from .._compression import compress, decompress
-from .._config import FORCE_BYTES_TO_UNICODE
+from ._ndarray_store import NdarrayStore, _CHUNK_SIZE
+from .._compression import compress, compress_array, decompress, array_samples
+from .._config import FORCE_BYTES_TO_UNICODE, ARGUS_STREAMING_WRITE_MIN_SIZE
 from ..date._util import to_pandas_closed_closed
 from ..exceptions import ArgusException
 
@@ -19,20 +20,22 @@ DTN64_DTYPE = "datetime64[ns]"
 
 INDEX_DTYPE = [("datetime", DTN64_DTYPE), ("index", "i8")]
 
+# The earliest and latest datetimes of each segment, and the segment (its last row)
+RANGES_DTYPE = [("min", DTN64_DTYPE), ("max", DTN64_DTYPE), ("index", "i8")]
+
 
 class PandasStore(NdarrayStore):
-    def _segment_index(self, recarr, existing_index, start, new_segments):
+    def _segment_index(self, last_rows, existing_index, start, new_segments):
         """
         Generate index of datetime64 -> item offset.
 
         Parameters:
         -----------
-        new_data: new data being written (or appended)
+        last_rows: the last row of each new segment being written (or appended)
         existing_index: index field from the versions document of the previous version
         start: first (0-based) offset of the new data
         segments: list of offsets. Each offset is the row index of the
                   the last row of a particular chunk relative to the start of the _original_ item.
-                  array(new_data) - segments = array(offsets in item)
 
         Returns:
         --------
@@ -40,11 +43,10 @@ class PandasStore(NdarrayStore):
             Where index is the 0-based index of the datetime in the DataFrame
         """
         # find the index of the first datetime64 column
-        idx_col = self._datetime64_index(recarr)
+        idx_col = self._datetime64_index(last_rows)
         # if one exists let's create the index on it
         if idx_col is not None:
             new_segments = np.array(new_segments, dtype="i8")
-            last_rows = recarr[new_segments - start]
             # create numpy index
             index = np.core.records.fromarrays(
                 [last_rows[idx_col]]
@@ -65,6 +67,36 @@ class PandasStore(NdarrayStore):
             raise ArgusException("Could not find datetime64 index in item but existing data contains one")
         return None
 
+    def _date_bounds(self, rows):
+        idx_col = self._datetime64_index(rows)
+        if idx_col is None:
+            return None
+        dts = rows[idx_col]
+        dts = dts[~np.isnat(dts)]
+        if not len(dts):
+            # Such a segment holds no rows of any date range
+            return np.datetime64("NaT"), np.datetime64("NaT")
+        return dts.min(), dts.max()
+
+    def _segment_ranges(self, date_bounds, existing_ranges, start, new_segments):
+        """
+        Generate the index of the datetime64 range of each segment.
+
+        Returns:
+        --------
+        Binary(compress(array([(min, max, index)])))
+            Where index is the 0-based index of the last row of the segment in the DataFrame
+        """
+        if not date_bounds or any(b is None for b in date_bounds):
+            return None
+        ranges = np.array([(lo, hi, end) for (lo, hi), end in zip(date_bounds, new_segments)], dtype=RANGES_DTYPE)
+        if existing_ranges:
+            existing_ranges_arr = np.frombuffer(decompress(existing_ranges), dtype=RANGES_DTYPE)
+            if start > 0:
+                existing_ranges_arr = existing_ranges_arr[existing_ranges_arr["index"] < start]
+            ranges = np.concatenate((existing_ranges_arr, ranges))
+        return Binary(compress(ranges.tobytes()))
+
     def _datetime64_index(self, recarr):
         """Given a np.recarray find the first datetime64 column"""
         # TODO: Handle multi-indexes
@@ -75,12 +107,33 @@ class PandasStore(NdarrayStore):
         return None
 
     def read_options(self):
-        return ["date_range"]
+        return super(PandasStore, self).read_options() + ["date_range"]
 
-    def _index_range(self, version, symbol, date_range=None, **kwargs):
-        """Given a version, read the segment_index and return the chunks associated
+    def _index_range(self, version, symbol, date_range=None, from_version=None, **kwargs):
+        """Given a version, read the segment_ranges (or the segment_index) and return the chunks associated
         with the date_range. As the segment index is (id -> last datetime)
         we need to take care in choosing the correct chunks."""
+        if date_range and from_version:
+            # The chunks of the date_range appended since from_version
+            start, end = self._index_range(version, symbol, date_range=date_range, **kwargs)
+            if start == -1:
+                return start, end
+            return max(start or 0, from_version["up_to"]), end
+        if date_range and "segment_ranges" in version:
+            ranges = np.frombuffer(decompress(version["segment_ranges"]), dtype=RANGES_DTYPE)
+            # The ranges of an item appended to by older versions of argus may not cover all its segments
+            covered = len(ranges) > 0 and len(ranges) == version.get("segment_count")
+            if covered and ranges["index"][-1] == version["up_to"] - 1:
+                start, end = _bounds(date_range)
+                overlaps = np.ones(len(ranges), dtype=bool)
+                if start is not None:
+                    overlaps &= ranges["max"] >= start
+                if end is not None:
+                    overlaps &= ranges["min"] <= end
+                selected = np.flatnonzero(overlaps)
+                if not len(selected):
+                    return -1, -1
+                return int(ranges["index"][selected[0]]), int(ranges["index"][selected[-1]] + 1)
         if date_range and "segment_index" in version:
             # index is read-only but it's never written to
             index = np.frombuffer(decompress(version["segment_index"]), dtype=INDEX_DTYPE)
@@ -93,7 +146,7 @@ class PandasStore(NdarrayStore):
                 idxstart = min(np.searchsorted(dts, start), len(dts) - 1)
                 idxend = min(np.searchsorted(dts, end, side="right"), len(dts) - 1)
                 return int(index["index"][idxstart]), int(index["index"][idxend] + 1)
-        return super(PandasStore, self)._index_range(version, symbol, **kwargs)
+        return super(PandasStore, self)._index_range(version, symbol, from_version=from_version, **kwargs)
 
     def _daterange(self, recarr, date_range):
         """Given a recarr, slice out the given artic.date.DateRange if a
@@ -101,10 +154,18 @@ class PandasStore(NdarrayStore):
         idx = self._datetime64_index(recarr)
         if idx and len(recarr):
             dts = recarr[idx]
-            mask = Series(np.zeros(len(dts)), index=dts)
-            start, end = _start_end(date_range, dts)
-            mask[start:end] = 1.0
-            return recarr[mask.values.astype(bool)]
+            start, end = _bounds(date_range)
+            if np.all(dts[1:] >= dts[:-1]):
+                # Sorted (and without NaT): binary search for the bounds
+                from_row = np.searchsorted(dts, start) if start is not None else 0
+                to_row = np.searchsorted(dts, end, side="right") if end is not None else len(dts)
+                return recarr[from_row:to_row]
+            mask = ~np.isnat(dts)
+            if start is not None:
+                mask &= dts >= start
+            if end is not None:
+                mask &= dts <= end
+            return recarr[mask]
         return recarr
 
     def read(self, argus_lib, version, symbol, read_preference=None, date_range=None, **kwargs):
@@ -115,6 +176,13 @@ class PandasStore(NdarrayStore):
             item = self._daterange(item, date_range)
         return item
 
+    def iterator(self, argus_lib, version, symbol, date_range=None, **kwargs):
+        for item in super(PandasStore, self).iterator(argus_lib, version, symbol, date_range=date_range, **kwargs):
+            if date_range:
+                item = self._daterange(item, date_range)
+            if len(item):
+                yield item
+
     def get_info(self, version):
         """
         parses out the relevant information in version
@@ -132,12 +200,21 @@ def _start_end(date_range, dts):
     Return tuple: [start, end] of np.datetime64 dates that are inclusive of the passed
     in datetimes.
     """
-    # FIXME: timezones
     assert len(dts)
+    start, end = _bounds(date_range)
+    return dts[0] if start is None else start, dts[-1] if end is None else end
+
+
+def _bounds(date_range):
+    """
+    Return tuple: [start, end] of np.datetime64 dates that are inclusive of the passed
+    in datetimes, None where the date_range is unbounded.
+    """
+    # FIXME: timezones
     _assert_no_timezone(date_range)
     date_range = to_pandas_closed_closed(date_range, add_tz=False)
-    start = np.datetime64(date_range.start) if date_range.start else dts[0]
-    end = np.datetime64(date_range.end) if date_range.end else dts[-1]
+    start = np.datetime64(date_range.start, "ns") if date_range.start else None
+    end = np.datetime64(date_range.end, "ns") if date_range.end else None
     return start, end
 
 
@@ -180,6 +257,11 @@ class PandasSeriesStore(PandasStore):
         force_bytes_to_unicode = kwargs.get("force_bytes_to_unicode", FORCE_BYTES_TO_UNICODE)
         return self.SERIALIZER.deserialize(item, force_bytes_to_unicode=force_bytes_to_unicode)
 
+    def iterator(self, argus_lib, version, symbol, **kwargs):
+        force_bytes_to_unicode = kwargs.get("force_bytes_to_unicode", FORCE_BYTES_TO_UNICODE)
+        for item in super(PandasSeriesStore, self).iterator(argus_lib, version, symbol, **kwargs):
+            yield self.SERIALIZER.deserialize(item, force_bytes_to_unicode=force_bytes_to_unicode)
+
 
 class PandasDataFrameStore(PandasStore):
     TYPE = "pandasdf"
@@ -197,18 +279,109 @@ class PandasDataFrameStore(PandasStore):
         return False
 
     def write(self, argus_lib, version, symbol, item, previous_version):
+        serializer, md = self._incremental_serializer(item)
+        if serializer is not None:
+            return self._write_incremental(argus_lib, version, symbol, serializer, previous_version, md)
         item, md = self.SERIALIZER.serialize(item)
         super(PandasDataFrameStore, self).write(argus_lib, version, symbol, item, previous_version, dtype=md)
 
     def append(self, argus_lib, version, symbol, item, previous_version, **kwargs):
+        serializer, md = self._incremental_serializer(item)
+        if serializer is not None and self._append_incremental(
+                argus_lib, version, symbol, serializer, previous_version, md
+        ):
+            return
         item, md = self.SERIALIZER.serialize(item)
         super(PandasDataFrameStore, self).append(argus_lib, version, symbol, item, previous_version, dtype=md, **kwargs)
 
-    def read(self, argus_lib, version, symbol, **kwargs):
+    def _incremental_serializer(self, item):
+        """
+        An incremental serializer of item and its serialized dtype, if item should be written incrementally
+        (see ARGUS_STREAMING_WRITE_MIN_SIZE), else (None, None)
+        """
+        if not len(item) or np.sum(item.memory_usage(index=True)) < ARGUS_STREAMING_WRITE_MIN_SIZE:
+            return None, None
+        serializer = IncrementalPandasToRecArraySerializer(self.SERIALIZER, item, _CHUNK_SIZE)
+        dtype = serializer.dtype
+        if dtype.metadata is None:
+            # The dtype of objects converted to strings is rebuilt from the data, without the serializer's metadata
+            dtype = np.dtype(dtype, metadata=dict(self.SERIALIZER.serialize(item[0:1])[1].metadata))
+        return serializer, dtype
+
+    def _fields(self, version, columns):
+        """The fields of the stored records needed to build the given columns (and the index)"""
+        dtype = self._dtype(version["dtype"], version.get("dtype_metadata", {}))
+        wanted = set(str(c) for c in version.get("dtype_metadata", {}).get("index", [])) | set(str(c) for c in columns)
+        # date_range is applied on the first datetime64 field, see PandasStore._datetime64_index
+        wanted.update([n for n in dtype.names if dtype.fields[n][0] == DTN64_DTYPE][:1])
+        return [n for n in dtype.names if n in wanted]
+
+    def read(self, argus_lib, version, symbol, columns=None, **kwargs):
+        if columns is not None:
+            kwargs["fields"] = self._fields(version, columns)
         item = super(PandasDataFrameStore, self).read(argus_lib, version, symbol, **kwargs)
         # Try to check if force_bytes_to_unicode is set in kwargs else use the config value (which defaults to False)
         force_bytes_to_unicode = kwargs.get("force_bytes_to_unicode", FORCE_BYTES_TO_UNICODE)
-        return self.SERIALIZER.deserialize(item, force_bytes_to_unicode=force_bytes_to_unicode)
+        return self.SERIALIZER.deserialize(item, force_bytes_to_unicode=force_bytes_to_unicode, columns=columns)
+
+    def iterator(self, argus_lib, version, symbol, columns=None, **kwargs):
+        if columns is not None:
+            kwargs["fields"] = self._fields(version, columns)
+        force_bytes_to_unicode = kwargs.get("force_bytes_to_unicode", FORCE_BYTES_TO_UNICODE)
+        for item in super(PandasDataFrameStore, self).iterator(argus_lib, version, symbol, **kwargs):
+            yield self.SERIALIZER.deserialize(item, force_bytes_to_unicode=force_bytes_to_unicode, columns=columns)
 
     def read_options(self):
-        return super(PandasDataFrameStore, self).read_options()
+        return super(PandasDataFrameStore, self).read_options() + ["columns"]
+
+
+class PandasColumnarDataFrameStore(PandasDataFrameStore):
+    """
+    Stores DataFrames like PandasDataFrameStore, but lays out each segment by column: every column of the segment's
+    row range is compressed on its own, so LZ4 works on homogeneous data, and reads with `columns` only decompress
+    the blocks they need. Appended (uncompressed) segments keep the row layout until they are rewritten.
+
+    segment documents:
+    [
+     {u'_id': ObjectId('55fa9a778b376a68efdd10e3'),
+      u'compressed': True,
+      u'data': Binary('...........', 0),  # the compressed columns, concatenated
+      u'columns': [[u'index', u'datetime64[ns]', 0, 5371],  # [name, dtype, start, end) of each block in data
+                   [u'price', u'float64', 5371, 41033]],
+      u'parent': [ObjectId('55fa9a7781f12654382e58b8')],
+      u'segment': 9,
+      u'sha': Binary('.............', 0),
+      u'symbol': u'test'},
+    ]
+
+    Libraries opt in with the COLUMNAR_SEGMENTS library metadata (or the ARGUS_COLUMNAR_SEGMENTS environment
+    variable), versions already written keep the layout they were written with.
+    """
+
+    TYPE = "pandasdf_columnar"
+    COLUMNAR = True
+
+    def _codec_samples(self, item):
+        return array_samples([item[name] for name in item.dtype.names])
+
+    def _compress_segments(self, chunks, codec=None):
+        names = chunks[0].dtype.names if chunks else ()
+        # Compressed a column at a time, as the shuffle filter works on the column's itemsize
+        blocks = {}
+        for name in names:
+            columns = [np.ascontiguousarray(chunk[name]) for chunk in chunks]
+            blocks[name] = compress_array(
+                [c.tostring() for c in columns], codec=codec, typesize=columns[0].dtype.itemsize
+            )
+        segments = []
+        for i, chunk in enumerate(chunks):
+            columns, offset = [], 0
+            chunk_blocks = [blocks[name][i] for name in names]
+            for name, block in zip(names, chunk_blocks):
+                columns.append([name, str(chunk.dtype.fields[name][0]), offset, offset + len(block)])
+                offset += len(block)
+            segment = {"data": Binary(b"".join(chunk_blocks)), "compressed": True, "columns": columns}
+            if codec is not None:
+                segment["codec"] = codec
+            segments.append(segment)
+        return segments
@@ -3,13 +3,14 @@ import logging
 from operator import itemgetter
 
 import bson
+import numpy as np
 import six
 from bson.binary import Binary
 from bson.errors import InvalidDocument
 from six.moves import cPickle
 
 from ._version_store_utils import checksum, pickle_compat_load, version_base_or_id
-from .._compression import decompress, compress_array
+from .._compression import decompress, compress_array, array_samples, is_adaptive, select_codec
 from .._config import SKIP_BSON_ENCODE_PICKLE_STORE, MAX_BSON_ENCODE
 from ..exceptions import UnsupportedPickleStoreVersion
 
@@ -28,10 +29,13 @@ class PickleStore:
         pass
 
     def get_info(self, _version):
-        return {
+        ret = {
             "type": "blob",
             "handler": self.__class__.__name__,
         }
+        if "compression" in _version:
+            ret["compression"] = _version["compression"]
+        return ret
 
     def read(self, mongoose_lib, version, symbol, **kwargs):
         blob = version.get("blob")
@@ -39,7 +43,7 @@ class PickleStore:
             if blob == _MAGIC_CHUNKEDV2:
                 collection = mongoose_lib.get_top_level_collection()
                 data = b"".join(
-                    decompress(x["data"])
+                    decompress(x["data"], x.get("codec"))
                     for x in sorted(
                         collection.find({"symbol": symbol, "parent": version_base_or_id(version)}),
                         key=itemgetter("segment"),
@@ -110,12 +114,23 @@ class PickleStore:
         pickle_protocol = min(cPickle.HIGHEST_PROTOCOL, 4)
         pickled = cPickle.dumps(item, protocol=pickle_protocol)
 
+        codec = argus_lib.get_compression()
+        if is_adaptive(codec):
+            choice = (_previous_version or {}).get("compression")
+            if not (choice and choice.get("adaptive") == codec):
+                _, choice = select_codec(codec, array_samples([np.frombuffer(pickled, dtype=np.uint8)]))
+            if choice:
+                version["compression"] = choice
+            codec = choice["codec"] if choice else None
         data = compress_array(
-            [pickled[i * _CHUNK_SIZE: (i + 1) * _CHUNK_SIZE] for i in range(int(len(pickled) / _CHUNK_SIZE + 1))]
+            [pickled[i * _CHUNK_SIZE: (i + 1) * _CHUNK_SIZE] for i in range(int(len(pickled) / _CHUNK_SIZE + 1))],
+            codec=codec,
         )
 
         for seg, d in enumerate(data):
             segment = {"data": Binary(d)}
+            if codec is not None:
+                segment["codec"] = codec
             segment["segment"] = seg
             seg += 1
             sha = checksum(symbol, segment)
@@ -0,0 +1,151 @@
+"""
+Pruning of previous versions in the background, off the write path.
+"""
+import logging
+import threading
+from collections import Counter, OrderedDict
+from contextlib import contextmanager, nullcontext
+
+from .._config import ARGUS_ASYNC_PRUNE, ARGUS_PRUNE_BATCH_SYMBOLS
+from ..hooks import log_exception
+
+logger = logging.getLogger(__name__)
+
+_pruner = None
+_configured = False
+
+
+class BackgroundPruner:
+    """
+    Prunes the previous versions of the symbols submitted to it, in a background thread. The requests for a symbol
+    made while it waits to be pruned are coalesced, and the waiting symbols of a library are pruned together, up
+    to batch_size at a time (see VersionStore._prune_previous_versions_batch).
+
+    A symbol is never pruned while this process writes it (see writing): the write may point its new version at
+    segments which already exist, and which the prune would delete. Writes from other processes are not guarded,
+    as with synchronous pruning.
+    """
+
+    def __init__(self, batch_size=ARGUS_PRUNE_BATCH_SYMBOLS):
+        self.batch_size = batch_size
+        # (host, library name) -> (VersionStore, OrderedDict of symbol -> (keep_mins, new version))
+        self._pending = OrderedDict()
+        # The number of writes in progress, and the symbols being pruned, by (host, library name, symbol)
+        self._writing = Counter()
+        self._pruning = set()
+        self._busy = False
+        self._cond = threading.Condition()
+        self._thread = None
+
+    @staticmethod
+    def _key(version_store):
+        return version_store._argus_lib.argus.mongo_host, version_store._argus_lib.get_name()
+
+    def submit(self, version_store, symbol, keep_mins, new_version):
+        """
+        Prune the previous versions of symbol in version_store, keeping those less than keep_mins old, as if
+        new_version, the version document just inserted, had not been inserted yet (as a synchronous prune does)
+        """
+        key = self._key(version_store)
+        with self._cond:
+            _, symbols = self._pending.setdefault(key, (version_store, OrderedDict()))
+            if symbol in symbols:
+                # Coalesced requests keep the fewest versions any of them asked for, before the latest new version
+                pending_keep_mins, pending_version = symbols[symbol]
+                keep_mins = min(keep_mins, pending_keep_mins)
+                if pending_version["version"] > new_version["version"]:
+                    new_version = pending_version
+            symbols[symbol] = (keep_mins, new_version)
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="ArgusPruner", daemon=True)
+                self._thread.start()
+            self._cond.notify_all()
+
+    def flush(self, timeout=None):
+        """Wait until the symbols submitted so far have been pruned. Returns False on timeout."""
+        with self._cond:
+            return self._cond.wait_for(lambda: not self._pending and not self._busy, timeout)
+
+    @contextmanager
+    def writing(self, version_store, symbols):
+        """Keep symbols from being pruned while they are written, waiting for the prunes in progress to finish"""
+        keys = [self._key(version_store) + (symbol,) for symbol in symbols]
+        with self._cond:
+            self._cond.wait_for(lambda: not any(key in self._pruning for key in keys))
+            self._writing.update(keys)
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._writing.subtract(keys)
+                self._writing += Counter()
+                self._cond.notify_all()
+
+    def _take_batch(self):
+        # Called with the lock held: the first batch of waiting symbols of a library which are not being written
+        for key, (version_store, symbols) in self._pending.items():
+            batch = OrderedDict()
+            for symbol in list(symbols):
+                if len(batch) == self.batch_size:
+                    break
+                if not self._writing[key + (symbol,)]:
+                    batch[symbol] = symbols.pop(symbol)
+            if not symbols:
+                del self._pending[key]
+            if batch:
+                return key, version_store, batch
+        return None
+
+    def _next_batch(self):
+        with self._cond:
+            key, version_store, batch = self._cond.wait_for(self._take_batch)
+            self._pruning.update(key + (symbol,) for symbol in batch)
+            self._busy = True
+            return key, version_store, batch
+
+    def _run(self):
+        while True:
+            key, version_store, batch = self._next_batch()
+            try:
+                for keep_mins in set(k for k, _ in batch.values()):
+                    symbols = [symbol for symbol, (k, _) in batch.items() if k == keep_mins]
+                    version_store._prune_previous_versions_batch(
+                        symbols, keep_mins=keep_mins, new_versions={symbol: batch[symbol][1] for symbol in symbols}
+                    )
+            except Exception as e:
+                # The versions are left for a later prune of the symbols
+                log_exception("BackgroundPruner", e, 1)
+                logger.warning(f"Failed to prune the previous versions of {len(batch)} symbols: {e}")
+            finally:
+                with self._cond:
+                    self._pruning.difference_update(key + (symbol,) for symbol in batch)
+                    self._busy = False
+                    self._cond.notify_all()
+
+
+def set_async_prune(enabled):
+    """
+    Prune the previous versions of the symbols written or appended to by VersionStores of this process in the
+    background (see BackgroundPruner), rather than on the write path.
+    """
+    global _pruner, _configured
+    if enabled:
+        if _pruner is None:
+            _pruner = BackgroundPruner()
+    elif _pruner is not None:
+        _pruner.flush()
+        _pruner = None
+    _configured = True
+
+
+def writing(version_store, symbols):
+    """A context in which the background pruner, if any, leaves symbols of version_store alone"""
+    pruner = get_pruner()
+    return pruner.writing(version_store, symbols) if pruner is not None else nullcontext()
+
+
+def get_pruner():
+    """The background pruner writes leave the pruning to, or None"""
+    if not _configured:
+        set_async_prune(ARGUS_ASYNC_PRUNE)
+    return _pruner
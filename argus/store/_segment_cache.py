@@ -0,0 +1,137 @@
+"""
+Content-addressed cache of segment documents on local disk.
+
+Segments are immutable, and their sha (see _version_store_utils.checksum) covers the symbol, the data and the
+segment number, so a segment cached under its sha can be used by any version (or library) which refers to it.
+"""
+import binascii
+import json
+import logging
+import mmap
+import os
+import struct
+import threading
+import uuid
+
+from .._config import ARGUS_SEGMENT_CACHE_DIR, ARGUS_SEGMENT_CACHE_SIZE
+
+logger = logging.getLogger(__name__)
+
+# Each file holds the length of the JSON header, the header (the fields below and the length of the data), the data
+_HEADER_SIZE = struct.Struct("<I")
+_FIELDS = ("segment", "compressed", "codec", "columns")
+
+_segment_cache = None
+_configured = False
+
+
+class SegmentCache:
+    """
+    Segment documents cached in files under directory, named by their sha. The data of a cached segment is
+    memory-mapped rather than read. The least recently used files are evicted once the files take more
+    than max_size bytes (down to 90% of it).
+    """
+
+    def __init__(self, directory, max_size):
+        self.directory = directory
+        self.max_size = max_size
+        self._size = None
+        self._lock = threading.Lock()
+
+    def _path(self, sha):
+        name = binascii.hexlify(sha).decode("ascii")
+        return os.path.join(self.directory, name[:2], name)
+
+    def get(self, sha):
+        """The segment document cached for sha (with its data a memoryview), or None"""
+        path = self._path(sha)
+        try:
+            with open(path, "rb") as f:
+                mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            # The modification time orders the files for eviction
+            os.utime(path)
+        except (FileNotFoundError, ValueError):
+            return None
+        try:
+            (header_size,) = _HEADER_SIZE.unpack_from(mapped)
+            start = _HEADER_SIZE.size + header_size
+            doc = json.loads(mapped[_HEADER_SIZE.size: start].decode("utf-8"))
+            if len(mapped) != start + doc.pop("size"):
+                raise ValueError(f"truncated: {len(mapped)} bytes")
+        except (struct.error, ValueError, KeyError) as e:
+            logger.warning(f"Ignoring corrupt cached segment {path}: {e}")
+            mapped.close()
+            return None
+        doc["data"] = memoryview(mapped)[start:]
+        doc["sha"] = sha
+        return doc
+
+    def put(self, sha, doc):
+        """Cache the segment document doc under its sha"""
+        header = {k: doc[k] for k in _FIELDS if k in doc}
+        header["size"] = len(doc["data"])
+        header = json.dumps(header).encode("utf-8")
+        path = self._path(sha)
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(tmp_path, "wb") as f:
+                f.write(_HEADER_SIZE.pack(len(header)))
+                f.write(header)
+                f.write(doc["data"])
+            # Readers only ever see complete files
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning(f"Failed to cache segment {path}: {e}")
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            return
+        size = _HEADER_SIZE.size + len(header) + len(doc["data"])
+        with self._lock:
+            if self._size is None:
+                self._size = sum(s for _, _, s in self._files())
+            else:
+                self._size += size
+            if self._size > self.max_size:
+                self._evict()
+
+    def _files(self):
+        for root, _, names in os.walk(self.directory):
+            for name in names:
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                yield path, stat.st_mtime, stat.st_size
+
+    def _evict(self):
+        files = sorted(self._files(), key=lambda x: x[1])
+        self._size = sum(size for _, _, size in files)
+        for path, _, size in files:
+            if self._size <= 0.9 * self.max_size:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            self._size -= size
+
+
+def set_segment_cache(directory, max_size=ARGUS_SEGMENT_CACHE_SIZE):
+    """
+    Cache the segments read by VersionStores of this process in directory, using up to about max_size bytes.
+    None disables the cache.
+    """
+    global _segment_cache, _configured
+    _segment_cache = SegmentCache(directory, max_size) if directory else None
+    _configured = True
+
+
+def get_segment_cache():
+    """The segment cache reads go through, or None"""
+    if not _configured:
+        set_segment_cache(ARGUS_SEGMENT_CACHE_DIR)
+    return _segment_cache
@@ -1,6 +1,10 @@
+import copy
 import hashlib
 import logging
 import pickle
+import threading
+import time
+from collections import OrderedDict
 
 import numpy as np
 import pandas as pd
@@ -46,6 +50,13 @@ def checksum(symbol, doc):
     return Binary(sha.digest())
 
 
+def tree_checksum(leaves):
+    """
+    Checksum of an item from the SHA1 digests of its consecutive row blocks (the leaves of a hash tree)
+    """
+    return Binary(hashlib.sha1(b"".join(leaves)).digest())
+
+
 def get_symbol_alive_shas(symbol, versions_coll):
     return set(Binary(x) for x in versions_coll.distinct(FW_POINTERS_REFS_KEY, {"symbol": symbol}))
 
@@ -131,6 +142,77 @@ def cleanup(argus_lib, symbol, version_ids, versions_coll, shas_to_delete=None,
     _cleanup_mixed(symbol, collection, version_ids, versions_coll)
 
 
+class VersionCache:
+    """
+    A bounded LRU cache of version documents, keyed by (symbol, as_of), which also keeps when each document was
+    last known to be current. Copies of the documents are handed out, as readers modify them: shallow ones, as
+    the readers only set and pop their top-level fields and treat the values (the segment shas and indexes) as
+    immutable. The metadata, which is handed on to the callers, is copied too.
+    """
+
+    def __init__(self, max_size, ttl):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._items = OrderedDict()
+        self._keys = {}  # symbol -> its keys in _items
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """
+        Returns (version, fresh), where fresh is False once the version was checked more than ttl seconds ago,
+        or None if key isn't cached.
+        """
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                return None
+            self._items.move_to_end(key)
+            version, checked = item
+            return _copy_version(version), time.monotonic() - checked <= self.ttl
+
+    def put(self, key, version):
+        with self._lock:
+            self._items[key] = (_copy_version(version), time.monotonic())
+            self._items.move_to_end(key)
+            self._keys.setdefault(key[0], set()).add(key)
+            while len(self._items) > self.max_size:
+                evicted, _ = self._items.popitem(last=False)
+                self._discard_key(evicted)
+
+    def touch(self, key):
+        """The version cached for key has been checked to be current"""
+        with self._lock:
+            if key in self._items:
+                self._items[key] = (self._items[key][0], time.monotonic())
+
+    def invalidate(self, symbol=None):
+        """Drop the versions cached for symbol, or all of them"""
+        with self._lock:
+            if symbol is None:
+                self._items.clear()
+                self._keys.clear()
+                return
+            for key in self._keys.pop(symbol, ()):
+                del self._items[key]
+
+    def _discard_key(self, key):
+        keys = self._keys.get(key[0])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._keys[key[0]]
+
+    def __len__(self):
+        return len(self._items)
+
+
+def _copy_version(version):
+    version = dict(version)
+    if version.get("metadata") is not None:
+        version["metadata"] = copy.deepcopy(version["metadata"])
+    return version
+
+
 def version_base_or_id(version):
     return version.get("base_version_id", version["_id"])
 
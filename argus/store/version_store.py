@@ -1,20 +1,38 @@
 import logging
 from datetime import datetime as dt, timedelta
+from multiprocessing.pool import ThreadPool
 
 import bson
 import pymongo
 import six
 from pymongo import ReadPreference
-from pymongo.errors import OperationFailure, AutoReconnect, DuplicateKeyError
+from pymongo.errors import OperationFailure, AutoReconnect, DuplicateKeyError, BulkWriteError
 
+from ._ndarray_store import batched_segment_writes
 from ._pickle_store import PickleStore
-from ._version_store_utils import cleanup, get_symbol_alive_shas, _get_symbol_pointer_cfgs
+from ._pruner import get_pruner, writing
+from ._version_store_utils import (
+    cleanup,
+    get_symbol_alive_shas,
+    _get_symbol_pointer_cfgs,
+    version_base_or_id,
+    VersionCache,
+)
 from .versioned_item import VersionedItem
-from .._config import STRICT_WRITE_HANDLER_MATCH, FW_POINTERS_REFS_KEY, FW_POINTERS_CONFIG_KEY, FwPointersCfg
+from .._config import (
+    STRICT_WRITE_HANDLER_MATCH,
+    ARGUS_COLUMNAR_SEGMENTS,
+    ARGUS_VERSION_CACHE_SIZE,
+    ARGUS_VERSION_CACHE_TTL,
+    ARGUS_PRUNE_BATCH_SYMBOLS,
+    FW_POINTERS_REFS_KEY,
+    FW_POINTERS_CONFIG_KEY,
+    FwPointersCfg,
+)
 from .._util import indent, enable_sharding, mongo_count, get_fwptr_config
 from ..date import mktz, datetime_to_ms, ms_to_datetime
 from ..decorators import mongo_retry
-from ..exceptions import NoDataFoundException, DuplicateSnapshotException, ArgusException
+from ..exceptions import NoDataFoundException, DuplicateSnapshotException, ArgusException, FullReadRequiredException
 from ..hooks import log_exception
 
 logger = logging.getLogger(__name__)
@@ -31,6 +49,36 @@ def register_version(version, numerical):
     ARGUS_VERSION_NUMERICAL = numerical
 
 
+def _prunable_versions_spec(symbol, keep_mins):
+    """
+    Query for the non-snapshotted versions of symbol at least keep_mins minutes old
+    """
+    return {
+        "symbol": symbol,
+        # Not snapshotted
+        "$or": [{"parent": {"$exists": False}}, {"parent": []}],
+        # At least 'keep_mins' old
+        "_id": {
+            "$lt": bson.ObjectId.from_datetime(
+                dt.utcnow()
+                # Add one second as the ObjectId
+                # str has random fuzz
+                + timedelta(seconds=1)
+                - timedelta(minutes=keep_mins)
+            )
+        },
+    }
+
+
+def _uses_symbols_collection(version_store):
+    """Whether list_symbols and has_symbol can be answered by the symbols collection of version_store"""
+    return getattr(version_store, "_symbols", None) is not None and version_store._with_symbols_collection
+
+
+def _is_deleted(version):
+    return (version.get("metadata") or {}).get("deleted", False) is True
+
+
 def register_versioned_storage(storageClass):
     existing_instances = [i for i, v in enumerate(_TYPE_HANDLERS) if str(v.__class__) == str(storageClass)]
     if existing_instances:
@@ -51,6 +99,12 @@ class VersionStore:
         if "strict_write_handler" in kwargs:
             argus_lib.set_library_metadata("STRICT_WRITE_HANDLER_MATCH", bool(kwargs.pop("strict_write_handler")))
 
+        if "columnar_segments" in kwargs:
+            argus_lib.set_library_metadata("COLUMNAR_SEGMENTS", bool(kwargs.pop("columnar_segments")))
+
+        # A new library has no symbols, so its symbols collection is complete from the start
+        argus_lib.set_library_metadata("SYMBOLS_COLLECTION", True)
+
         for th in _TYPE_HANDLERS:
             th.initialize_library(argus_lib, **kwargs)
         VersionStore._bson_handler.initialize_library(argus_lib, **kwargs)
@@ -84,6 +138,10 @@ class VersionStore:
             background=True,
         )
         collection.version_nums.create_index("symbol", unique=True, background=True)
+        collection.symbols.create_index("symbol", unique=True, background=True)
+        collection.symbols.create_index(
+            [("deleted", pymongo.ASCENDING), ("symbol", pymongo.ASCENDING)], name="symbols_idx", background=True
+        )
         for th in _TYPE_HANDLERS:
             th._ensure_index(collection)
 
@@ -93,6 +151,11 @@ class VersionStore:
         self._allow_secondary = self._argus_lib.argus._allow_secondary
         self._reset()
         self._with_strict_handler = None
+        self._with_columnar = None
+        self._with_symbols = None
+        self._version_cache = (
+            VersionCache(ARGUS_VERSION_CACHE_SIZE, ARGUS_VERSION_CACHE_TTL) if ARGUS_VERSION_CACHE_SIZE > 0 else None
+        )
 
     @property
     def _with_strict_handler_match(self):
@@ -101,6 +164,20 @@ class VersionStore:
             self._with_strict_handler = STRICT_WRITE_HANDLER_MATCH if strict_meta is None else strict_meta
         return self._with_strict_handler
 
+    @property
+    def _with_columnar_segments(self):
+        if self._with_columnar is None:
+            columnar_meta = self._argus_lib.get_library_metadata("COLUMNAR_SEGMENTS")
+            self._with_columnar = ARGUS_COLUMNAR_SEGMENTS if columnar_meta is None else columnar_meta
+        return self._with_columnar
+
+    @property
+    def _with_symbols_collection(self):
+        """Whether the symbols collection holds the state of every symbol (see _backfill_symbols)"""
+        if self._with_symbols is None:
+            self._with_symbols = bool(self._argus_lib.get_library_metadata("SYMBOLS_COLLECTION"))
+        return self._with_symbols
+
     @mongo_retry
     def _reset(self):
         # The default collections
@@ -109,6 +186,7 @@ class VersionStore:
         self._snapshots = self._collection.snapshots
         self._versions = self._collection.versions
         self._version_nums = self._collection.version_nums
+        self._symbols = self._collection.symbols
 
     def __getstate__(self):
         return {"argus_lib": self._argus_lib}
@@ -153,6 +231,15 @@ class VersionStore:
         query = {}
         if regex is not None:
             query["symbol"] = {"$regex": regex}
+        if snapshot is None and not all_symbols and not kwargs and _uses_symbols_collection(self):
+            # An indexed scan of the symbols collection, rather than grouping all the versions by symbol
+            query["deleted"] = False
+            return [
+                x["symbol"]
+                for x in self._symbols.find(query, projection={"symbol": 1, "_id": 0}).sort(
+                    "symbol", pymongo.ASCENDING
+                )
+            ]
         if kwargs:
             for k, v in six.iteritems(kwargs):
                 # TODO: this doesn't work as expected as it ignores the versions with metadata.deleted set
@@ -201,6 +288,8 @@ class VersionStore:
             `str` : snapshot name which contains the version
             `datetime.datetime` : the version of the data that existed as_of the requested point in time
         """
+        if as_of is None and _uses_symbols_collection(self):
+            return self._symbols.find_one({"symbol": symbol, "deleted": False}, projection={"_id": 1}) is not None
         try:
             # Always use the primary for has_symbol, it's safer
             self._read_metadata(symbol, as_of=as_of, read_preference=ReadPreference.PRIMARY)
@@ -318,6 +407,9 @@ class VersionStore:
     def _write_handler(self, version, symbol, data, **kwargs):
         handler = None
         for h in _TYPE_HANDLERS:
+            # Handlers writing the column-oriented layout are opt-in, per library
+            if getattr(h, "COLUMNAR", False) and not self._with_columnar_segments:
+                continue
             if h.can_write(version, symbol, data, **kwargs):
                 handler = h
                 break
@@ -345,11 +437,17 @@ class VersionStore:
         date_range: `argus.date.DateRange`
             DateRange to read data for.  Applies to Pandas data, with a DateTime index
             returns only the part of the data that falls in the DateRange.
+        from_version : `int` or `VersionedItem` or `None`
+            Return only the rows appended since this version (number) of the symbol. Raises
+            FullReadRequiredException when the version read doesn't extend it with appends (e.g. it has
+            been rewritten since, or from_version has been pruned), or the data isn't an array or Pandas object.
         allow_secondary : `bool` or `None`
             Override the default behavior for allowing reads from secondary members of a cluster:
             `None` : use the settings from the top-level `Argus` object used to query this version store.
             `True` : allow reads from secondary members
             `False` : only allow reads from primary members
+        columns : `list` or `None`
+            Applies to Pandas DataFrames, only the given columns (and the index) are returned.
 
         Returns
         -------
@@ -374,6 +472,57 @@ class VersionStore:
             log_exception("read", e, 1)
             raise
 
+    def iterator(self, symbol, as_of=None, rows_per_batch=None, date_range=None, allow_secondary=None, **kwargs):
+        """
+        Read the data of the named symbol in batches, so that data bigger than memory can be processed.
+        Batches are made of whole segments, and the next ones are fetched and decompressed in the background
+        while a batch is being processed. With a date_range, the reading starts from the first segment holding
+        it, found with the segment index.
+        Data which isn't stored in segments (e.g. pickled objects) is returned in a single batch.
+
+        Parameters
+        ----------
+        symbol : `str`
+            symbol name for the item
+        as_of : `str` or `int` or `datetime.datetime`
+            Read the data as it was as_of the point in time (see read).
+        rows_per_batch : `int` or `None`
+            Batches hold at least this many rows (but the last one). Default: ARGUS_ITERATOR_ROWS_PER_BATCH
+        date_range: `argus.date.DateRange`
+            DateRange to read data for, as for read.
+        from_version : `int` or `VersionedItem` or `None`
+            Only read the rows appended since this version of the symbol, as for read.
+        allow_secondary : `bool` or `None`
+            Override the default behavior for allowing reads from secondary members of a cluster (see read).
+        columns : `list` or `None`
+            Applies to Pandas DataFrames, only the given columns (and the index) are returned.
+
+        Returns
+        -------
+        iterator over the batches of the data (ndarrays, DataFrames or Series), in order
+        """
+        read_preference = self._read_preference(allow_secondary)
+        version = mongo_retry(self._read_metadata)(symbol, as_of=as_of, read_preference=read_preference)
+        from_version = kwargs.pop("from_version", None)
+        handler = self._checked_read_handler(symbol, version, date_range=date_range, **kwargs)
+        if not hasattr(handler, "iterator"):
+            item = self._do_read(
+                symbol, version, from_version, date_range=date_range, read_preference=read_preference, **kwargs
+            )
+            return iter([item.data])
+        if from_version is not None:
+            from_version = self._appended_since(symbol, version, from_version, handler, read_preference)
+        return handler.iterator(
+            self._argus_lib,
+            version,
+            symbol,
+            rows_per_batch=rows_per_batch,
+            read_preference=read_preference,
+            date_range=date_range,
+            from_version=from_version,
+            **kwargs,
+        )
+
     @mongo_retry
     def get_info(self, symbol, as_of=None):
         """
@@ -432,6 +581,54 @@ class VersionStore:
         return self._read_metadata(symbol, as_of=as_of).get("argus_version", 0)
 
     def _do_read(self, symbol, version, from_version=None, **kwargs):
+        handler = self._checked_read_handler(symbol, version, **kwargs)
+        if from_version is not None:
+            from_version = self._appended_since(symbol, version, from_version, handler, kwargs.get("read_preference"))
+        data = handler.read(self._argus_lib, version, symbol, from_version=from_version, **kwargs)
+        return self._versioned_item(symbol, version, data)
+
+    _do_read_retry = mongo_retry(_do_read)
+
+    def _versioned_item(self, symbol, version, data):
+        return VersionedItem(
+            symbol=symbol,
+            library=self._argus_lib.get_name(),
+            version=version["version"],
+            metadata=version.pop("metadata", None),
+            data=data,
+            host=self._argus_lib.argus.mongo_host,
+        )
+
+    def _appended_since(self, symbol, version, from_version, handler, read_preference=None):
+        """
+        The version document of from_version (a version number, VersionedItem or version document), checking that
+        version only has rows appended to it, so that the handler can read just those.
+        """
+        if isinstance(from_version, VersionedItem):
+            from_version = from_version.version
+        if not isinstance(from_version, dict):
+            try:
+                from_version = self._read_metadata(symbol, as_of=from_version, read_preference=read_preference)
+            except NoDataFoundException:
+                raise FullReadRequiredException(f"Version {from_version} of {symbol} not found")
+        if not (
+            self.handler_supports_read_option(handler, "from_version")
+            and "up_to" in version
+            and version.get("type") == from_version.get("type")
+            and version.get("dtype") == from_version.get("dtype")
+            and version_base_or_id(version) == version_base_or_id(from_version)
+            and version["up_to"] >= from_version.get("up_to", 0)
+        ):
+            # Rewritten since, rather than appended to: the data of from_version may have changed
+            raise FullReadRequiredException(
+                f"Version {version['version']} of {symbol} doesn't extend version {from_version['version']}"
+            )
+        return from_version
+
+    def _checked_read_handler(self, symbol, version, **kwargs):
+        """
+        The handler to read version with, checking that it can serve the read options in kwargs.
+        """
         if version.get("deleted"):
             raise NoDataFoundException(f"No data found for {symbol} in library {self._argus_lib.get_name()}")
         handler = self._read_handler(version, symbol)
@@ -443,18 +640,94 @@ class VersionStore:
                 and not self.handler_supports_read_option(handler, "date_range")
         ):
             raise ArgusException(f"Date range arguments not supported by handler in {symbol}")
+        if (
+                self._with_strict_handler_match
+                and kwargs.get("columns") is not None
+                and not self.handler_supports_read_option(handler, "columns")
+        ):
+            raise ArgusException(f"Column selection not supported by handler in {symbol}")
+        return handler
 
-        data = handler.read(self._argus_lib, version, symbol, from_version=from_version, **kwargs)
-        return VersionedItem(
-            symbol=symbol,
-            library=self._argus_lib.get_name(),
-            version=version["version"],
-            metadata=version.pop("metadata", None),
-            data=data,
-            host=self._argus_lib.argus.mongo_host,
-        )
+    def batch_read(self, symbols, as_of=None, date_range=None, allow_secondary=None, **kwargs):
+        """
+        Read data for many symbols at once. The version documents are resolved in one query, and the data of the
+        symbols is fetched in a few large queries and decompressed in parallel, which is much faster than reading
+        the symbols one by one.
 
-    _do_read_retry = mongo_retry(_do_read)
+        Parameters
+        ----------
+        symbols : `list` of `str`
+            symbol names to read
+        as_of : `str` or `int` or `datetime.datetime`
+            Return the data as it was as_of the point in time, for every symbol (see read)
+        date_range: `argus.date.DateRange`
+            DateRange to read data for.  Applies to Pandas data, with a DateTime index
+            returns only the part of the data that falls in the DateRange.
+        allow_secondary : `bool` or `None`
+            Override the default behavior for allowing reads from secondary members of a cluster (see read)
+        columns : `list` or `None`
+            Applies to Pandas DataFrames, only the given columns (and the index) are returned.
+
+        Returns
+        -------
+        dict of symbol -> VersionedItem, or the exception raised reading that symbol. Errors reading one symbol
+        don't stop the others being read.
+        """
+        kwargs["date_range"] = date_range
+        read_preference = self._read_preference(allow_secondary)
+        results = {}
+        try:
+            versions = self._read_metadata_batch(symbols, as_of=as_of, read_preference=read_preference)
+        except (OperationFailure, AutoReconnect) as e:
+            log_exception("batch_read", e, 1)
+            versions = mongo_retry(self._read_metadata_batch)(
+                symbols, as_of=as_of, read_preference=ReadPreference.PRIMARY
+            )
+
+        by_handler = {}
+        for symbol in symbols:
+            version = versions[symbol]
+            if not isinstance(version, Exception):
+                try:
+                    handler = self._checked_read_handler(symbol, version, **kwargs)
+                    by_handler.setdefault(handler, {})[symbol] = version
+                    continue
+                except Exception as e:
+                    version = e
+            results[symbol] = version
+
+        for handler, handler_versions in by_handler.items():
+            if hasattr(handler, "batch_read"):
+                data = handler.batch_read(
+                    self._argus_lib, handler_versions, read_preference=read_preference, **kwargs
+                )
+            else:
+                data = {}
+                for symbol, version in handler_versions.items():
+                    try:
+                        data[symbol] = handler.read(
+                            self._argus_lib, version, symbol, read_preference=read_preference, **kwargs
+                        )
+                    except Exception as e:
+                        data[symbol] = e
+            for symbol, version in handler_versions.items():
+                if isinstance(data[symbol], (OperationFailure, AutoReconnect)):
+                    # As in read: the secondary may have lagged, so retry the symbol on the primary
+                    log_exception("batch_read", data[symbol], 1)
+                    try:
+                        version = mongo_retry(self._read_metadata)(
+                            symbol, as_of=as_of, read_preference=ReadPreference.PRIMARY
+                        )
+                        results[symbol] = self._do_read_retry(
+                            symbol, version, read_preference=ReadPreference.PRIMARY, **kwargs
+                        )
+                    except Exception as e:
+                        results[symbol] = e
+                elif isinstance(data[symbol], Exception):
+                    results[symbol] = data[symbol]
+                else:
+                    results[symbol] = self._versioned_item(symbol, version, data[symbol])
+        return {symbol: results[symbol] for symbol in symbols}
 
     @mongo_retry
     def read_metadata(self, symbol, as_of=None, allow_secondary=None):
@@ -498,6 +771,19 @@ class VersionStore:
 
         versions_coll = self._versions.with_options(read_preference=read_preference)
 
+        cache_key = None
+        version_cache = getattr(self, "_version_cache", None)
+        if version_cache is not None and not isinstance(as_of, dt):
+            cache_key = (symbol, as_of)
+            cached = version_cache.get(cache_key)
+            if cached is not None:
+                _version, fresh = cached
+                if fresh:
+                    return _version
+                if self._is_current_version(versions_coll, symbol, as_of, _version):
+                    version_cache.touch(cache_key)
+                    return _version
+
         _version = None
         if as_of is None:
             _version = versions_coll.find_one({"symbol": symbol}, sort=[("version", pymongo.DESCENDING)])
@@ -526,8 +812,158 @@ class VersionStore:
         if metadata is not None and metadata.get("deleted", False) is True:
             raise NoDataFoundException(f"No data found for {symbol} in library {self._argus_lib.get_name()}")
 
+        if cache_key is not None:
+            version_cache.put(cache_key, _version)
         return _version
 
+    @staticmethod
+    def _is_current_version(versions_coll, symbol, as_of, version):
+        """
+        Whether the cached version is still what _read_metadata(symbol, as_of) reads, checked with a query covered
+        by the (symbol, version) index. Versions of a snapshot aren't checked, but read again.
+        """
+        if as_of is None:
+            latest = versions_coll.find_one(
+                {"symbol": symbol}, sort=[("version", pymongo.DESCENDING)], projection={"version": 1, "_id": 0}
+            )
+            return latest is not None and latest["version"] == version["version"]
+        if isinstance(as_of, six.string_types):
+            return False
+        spec = {"symbol": symbol, "version": as_of}
+        return versions_coll.find_one(spec, projection={"version": 1, "_id": 0}) is not None
+
+    def _invalidate_cached_versions(self, symbol=None):
+        version_cache = getattr(self, "_version_cache", None)
+        if version_cache is not None:
+            version_cache.invalidate(symbol)
+
+    def _read_metadata_batch(self, symbols, as_of=None, read_preference=None):
+        """
+        Like _read_metadata for each of symbols, but in a single query. Returns a dict of symbol -> version
+        document, or the NoDataFoundException for symbols that have no (live) version as_of.
+        """
+        if read_preference is None:
+            read_preference = (
+                ReadPreference.PRIMARY_PREFERRED if not self._allow_secondary else ReadPreference.SECONDARY_PREFERRED
+            )
+        versions_coll = self._versions.with_options(read_preference=read_preference)
+
+        spec = {"symbol": {"$in": list(symbols)}}
+        found = []
+        if as_of is None or isinstance(as_of, dt):
+            if isinstance(as_of, dt):
+                if not as_of.tzinfo:
+                    as_of = as_of.replace(tzinfo=mktz())
+                spec["_id"] = {"$lt": bson.ObjectId.from_datetime(as_of + timedelta(seconds=1))}
+            found = self._latest_versions(spec, versions_coll).values()
+        elif isinstance(as_of, six.string_types):
+            # as_of is a snapshot
+            snapshot = self._snapshots.find_one({"name": as_of})
+            if snapshot:
+                spec["parent"] = snapshot["_id"]
+                found = versions_coll.find(spec)
+        else:
+            # Backward compatibility - as of is a version number
+            spec["version"] = as_of
+            found = versions_coll.find(spec)
+
+        versions = {}
+        for version in found:
+            # if the item has been deleted, don't return any metadata
+            metadata = version.get("metadata", None)
+            if metadata is None or metadata.get("deleted", False) is not True:
+                versions[version["symbol"]] = version
+        for symbol in symbols:
+            if symbol not in versions:
+                versions[symbol] = NoDataFoundException(
+                    f"No data found for {symbol} in library {self._argus_lib.get_name()}"
+                )
+        return versions
+
+    def _latest_versions(self, spec, versions_coll=None):
+        """
+        The latest of the version documents matching spec, of each symbol, found with one aggregation.
+        Returns a dict of symbol -> version document.
+        """
+        versions_coll = self._versions if versions_coll is None else versions_coll
+        found = versions_coll.aggregate(
+            [
+                {"$match": spec},
+                {"$sort": {"symbol": pymongo.ASCENDING, "version": pymongo.DESCENDING}},
+                {"$group": {"_id": "$symbol", "version": {"$first": "$$ROOT"}}},
+            ],
+            allowDiskUse=True,
+        )
+        return {x["_id"]: x["version"] for x in found}
+
+    def _next_version_nums(self, symbols, upsert=True):
+        """
+        Take the next version number of each of symbols, with one bulk update and one query (rather than a
+        find_one_and_update per symbol). Returns a dict of symbol -> version number.
+
+        Unlike find_one_and_update, the $inc and the find aren't atomic: a concurrent write of one of the symbols
+        which takes a number in between makes us read its number rather than ours. Both writes then use the same
+        version number, and the insert of one of the two version documents fails on the unique (symbol, version)
+        index. _do_batch_write retries that symbol on its own with write or append, which take a new number
+        atomically. The number we took is skipped, as after any failed write.
+        """
+        if not symbols:
+            return {}
+        mongo_retry(self._version_nums.bulk_write)(
+            [pymongo.UpdateOne({"symbol": symbol}, {"$inc": {"version": 1}}, upsert=upsert) for symbol in symbols],
+            ordered=False,
+        )
+        return {
+            x["symbol"]: x["version"]
+            for x in self._version_nums.find({"symbol": {"$in": list(symbols)}}, projection={"_id": 0})
+        }
+
+    def _insert_versions(self, versions):
+        """
+        Insert the version documents with one insert_many. Returns a dict of symbol -> exception for the versions
+        which failed to be inserted.
+        """
+        if not versions:
+            return {}
+        for version in versions:
+            self._invalidate_cached_versions(version["symbol"])
+        try:
+            self._versions.insert_many(versions, ordered=False)
+        except BulkWriteError as bwe:
+            failed = {}
+            for error in bwe.details.get("writeErrors", []):
+                symbol = versions[error["index"]]["symbol"]
+                if error.get("code") == 11000:
+                    # As in _insert_version: the write of the symbol gets retried with a new version
+                    failed[symbol] = OperationFailure("A version with the same _id exists, force a clean retry")
+                else:
+                    failed[symbol] = OperationFailure(error.get("errmsg"), error.get("code"))
+            self._update_symbol_states(
+                [(v["symbol"], v["version"], _is_deleted(v)) for v in versions if v["symbol"] not in failed]
+            )
+            return failed
+        except (OperationFailure, AutoReconnect) as e:
+            # Insert the versions which didn't make it one by one
+            log_exception("_insert_versions", e, 1)
+            inserted = set(
+                x["_id"]
+                for x in self._versions.find({"_id": {"$in": [v["_id"] for v in versions]}}, projection={"_id": 1})
+            )
+            failed = {}
+            for version in versions:
+                if version["_id"] not in inserted:
+                    try:
+                        self._insert_version(version)
+                    except (OperationFailure, AutoReconnect) as err:
+                        failed[version["symbol"]] = err
+            # (_insert_version records the states of the others)
+            self._update_symbol_states(
+                [(v["symbol"], v["version"], _is_deleted(v)) for v in versions if v["_id"] in inserted]
+            )
+            return failed
+        self._update_symbol_states([(v["symbol"], v["version"], _is_deleted(v)) for v in versions])
+        return {}
+
     def _insert_version(self, version):
         try:
             # Keep here the mongo_retry to avoid incrementing versions and polluting the DB with garbage segments,
@@ -535,9 +971,86 @@ class VersionStore:
             # If, however, we get a DuplicateKeyError, suppress it and raise OperationFailure, so that the method-scoped
             # mongo_retry re-tries and creates a new version, to overcome the issue.
             mongo_retry(self._versions.insert_one)(version)
+            self._invalidate_cached_versions(version["symbol"])
         except DuplicateKeyError as err:
             logger.exception(err)
             raise OperationFailure("A version with the same _id exists, force a clean retry")
+        self._update_symbol_states([(version["symbol"], version["version"], _is_deleted(version))])
+
+    def _update_symbol_states(self, states):
+        """
+        Record the (symbol, version number, deleted) states in the symbols collection, unless a newer version
+        of the symbol has been recorded already.
+        """
+        if not states:
+            return
+        try:
+            mongo_retry(self._symbols.bulk_write)(
+                [
+                    pymongo.UpdateOne(
+                        {"symbol": symbol, "version": {"$lt": version}},
+                        {"$set": {"version": version, "deleted": deleted}},
+                        upsert=True,
+                    )
+                    for symbol, version, deleted in states
+                ],
+                ordered=False,
+            )
+        except BulkWriteError as bwe:
+            # The upsert of a symbol whose recorded version is newer fails on the unique symbol index
+            errors = [e for e in bwe.details.get("writeErrors", []) if e.get("code") != 11000]
+            if errors:
+                raise OperationFailure(errors[0].get("errmsg"), errors[0].get("code"))
+
+    @mongo_retry
+    def _refresh_symbol_state(self, symbol, version_num):
+        """
+        Record the state of the latest remaining version of symbol once version version_num has been deleted,
+        unless a newer version has been recorded since.
+        """
+        latest = self._versions.find_one(
+            {"symbol": symbol}, sort=[("version", pymongo.DESCENDING)], projection={"version": 1, "metadata": 1}
+        )
+        spec = {"symbol": symbol, "version": {"$lte": version_num}}
+        if latest is None:
+            self._symbols.delete_one(spec)
+        else:
+            self._symbols.update_one(spec, {"$set": {"version": latest["version"], "deleted": _is_deleted(latest)}})
+
+    @mongo_retry
+    def _backfill_symbols(self):
+        """
+        Record the state of every symbol of the library in the symbols collection, then mark the library as
+        having it so that list_symbols and has_symbol use it. This can be run again, also while the library is
+        being written to.
+        """
+        states = self._versions.aggregate(
+            [
+                {"$sort": bson.SON([("symbol", pymongo.ASCENDING), ("version", pymongo.DESCENDING)])},
+                {
+                    "$group": {
+                        "_id": "$symbol",
+                        "version": {"$first": "$version"},
+                        "deleted": {"$first": "$metadata.deleted"},
+                    }
+                },
+            ],
+            allowDiskUse=True,
+        )
+        symbols = set()
+        batch = []
+        for state in states:
+            symbols.add(state["_id"])
+            batch.append((state["_id"], state["version"], state["deleted"] is True))
+            if len(batch) == 1000:
+                self._update_symbol_states(batch)
+                batch = []
+        self._update_symbol_states(batch)
+        # Drop the states left behind by symbols which have no versions any more
+        for state in self._symbols.find({"symbol": {"$nin": list(symbols)}}, projection={"_id": 0}):
+            self._refresh_symbol_state(state["symbol"], state["version"])
+        self._argus_lib.set_library_metadata("SYMBOLS_COLLECTION", True)
+        self._with_symbols = True
 
     @mongo_retry
     def append(self, symbol, data, metadata=None, prune_previous_version=True, upsert=True, **kwargs):
@@ -620,25 +1133,29 @@ class VersionStore:
         elif "metadata" in previous_version:
             version["metadata"] = previous_version["metadata"]
 
-        if handler and hasattr(handler, "append") and callable(handler.append):
+        if not (handler and hasattr(handler, "append") and callable(handler.append)):
+            raise Exception(f"Append not implemented for handler {handler}")
+
+        with writing(self, [symbol]):
             handler.append(
                 self._argus_lib, version, symbol, data, previous_version, dirty_append=dirty_append, **kwargs
             )
-        else:
-            raise Exception(f"Append not implemented for handler {handler}")
 
-        if prune_previous_version and previous_version:
-            # Does not allow prune to remove the base of the new version
-            self._prune_previous_versions(
-                symbol,
-                keep_version=version.get("base_version_id"),
-                new_version_shas=version.get(FW_POINTERS_REFS_KEY),
-                keep_mins=kwargs.get("keep_mins", 120),
-            )
+            pruner = get_pruner() if prune_previous_version and previous_version else None
+            if prune_previous_version and previous_version and pruner is None:
+                # Does not allow prune to remove the base of the new version
+                self._prune_previous_versions(
+                    symbol,
+                    keep_version=version.get("base_version_id"),
+                    new_version_shas=version.get(FW_POINTERS_REFS_KEY),
+                    keep_mins=kwargs.get("keep_mins", 120),
+                )
 
-        # Insert the new version into the version DB
-        version["version"] = next_ver
-        self._insert_version(version)
+            # Insert the new version into the version DB
+            version["version"] = next_ver
+            self._insert_version(version)
+            if pruner is not None:
+                pruner.submit(self, symbol, kwargs.get("keep_mins", 120), version)
 
         return VersionedItem(
             symbol=symbol,
@@ -688,15 +1205,19 @@ class VersionStore:
         )
 
         handler = self._write_handler(version, symbol, data, **kwargs)
-        handler.write(self._argus_lib, version, symbol, data, previous_version, **kwargs)
+        with writing(self, [symbol]):
+            handler.write(self._argus_lib, version, symbol, data, previous_version, **kwargs)
 
-        if prune_previous_version and previous_version:
-            self._prune_previous_versions(
-                symbol, keep_mins=kwargs.get("keep_mins", 120), new_version_shas=version.get(FW_POINTERS_REFS_KEY)
-            )
+            pruner = get_pruner() if prune_previous_version and previous_version else None
+            if prune_previous_version and previous_version and pruner is None:
+                self._prune_previous_versions(
+                    symbol, keep_mins=kwargs.get("keep_mins", 120), new_version_shas=version.get(FW_POINTERS_REFS_KEY)
+                )
 
-        # Insert the new version into the version DB
-        self._insert_version(version)
+            # Insert the new version into the version DB
+            self._insert_version(version)
+            if pruner is not None:
+                pruner.submit(self, symbol, kwargs.get("keep_mins", 120), version)
 
         logger.debug("Finished writing versions for %s", symbol)
 
@@ -709,6 +1230,249 @@ class VersionStore:
             host=self._argus_lib.argus.mongo_host,
         )
 
+    def batch_write(self, items, metadata=None, prune_previous_version=True, **kwargs):
+        """
+        Write many symbols at once. Does what write does for each symbol, but the version numbers are taken, the
+        previous versions looked up and the new versions inserted for all the symbols together, the segments of
+        all the symbols are sent in a few bulk writes, and the previous versions are pruned in one pass at the end.
+        As with write, a symbol gets a new version only if all its data has been written. The version numbers
+        aren't taken atomically (see _next_version_nums): a symbol written concurrently by another writer may be
+        written twice, the second time on its own.
+
+        Parameters
+        ----------
+        items : `dict`
+            symbol -> data to be persisted
+        metadata : `dict` or `None`
+            an optional dictionary of symbol -> metadata to persist along with the symbol.
+        prune_previous_version : `bool`
+            Removes previous (non-snapshotted) versions from the database.
+            Default: True
+        kwargs :
+            passed through to the write handlers
+
+        Returns
+        -------
+        dict of symbol -> VersionedItem (without data) of the written version, or the exception raised writing the
+        symbol. Errors writing one symbol don't stop the others being written.
+        """
+        self._argus_lib.check_quota()
+        metadata = metadata or {}
+        symbols = list(items)
+        version_nums = self._next_version_nums(symbols)
+        previous_versions = self._latest_versions({"symbol": {"$in": symbols}})
+
+        writes = {}
+        for symbol in symbols:
+            version = {"_id": bson.ObjectId()}
+            version["argus_version"] = ARGUS_VERSION_NUMERICAL
+            version["symbol"] = symbol
+            version["version"] = version_nums[symbol]
+            version["metadata"] = metadata.get(symbol)
+            previous_version = previous_versions.get(symbol)
+            if previous_version is not None and previous_version["version"] >= version["version"]:
+                # Written concurrently since: look for the version before ours, as write does
+                previous_version = self._versions.find_one(
+                    {"symbol": symbol, "version": {"$lt": version["version"]}}, sort=[("version", pymongo.DESCENDING)]
+                )
+
+            def _write(symbol=symbol, version=version, previous_version=previous_version):
+                handler = self._write_handler(version, symbol, items[symbol], **kwargs)
+                handler.write(self._argus_lib, version, symbol, items[symbol], previous_version, **kwargs)
+
+            writes[symbol] = (version, previous_version, _write)
+
+        return self._do_batch_write(
+            writes,
+            prune_previous_version,
+            kwargs.get("keep_mins", 120),
+            retry=lambda symbol: self.write(
+                symbol, items[symbol], metadata.get(symbol), prune_previous_version=prune_previous_version, **kwargs
+            ),
+        )
+
+    def batch_append(self, items, metadata=None, prune_previous_version=True, upsert=True, **kwargs):
+        """
+        Append to many symbols at once. Does what append does for each symbol, sharing the database operations
+        of the symbols as batch_write does. Symbols which don't exist yet (or have been deleted) are written with
+        batch_write if upsert.
+
+        Parameters
+        ----------
+        items : `dict`
+            symbol -> data to be appended
+        metadata : `dict` or `None`
+            an optional dictionary of symbol -> metadata to persist along with the symbol.
+        prune_previous_version : `bool`
+            Removes previous (non-snapshotted) versions from the database.
+            Default: True
+        upsert : `bool`
+            Write the data of symbols which have no previous version.
+        kwargs :
+            passed through to the append handlers, or the write handlers of the symbols written
+
+        Returns
+        -------
+        dict of symbol -> VersionedItem (without data) of the new version, or the exception raised appending to the
+        symbol. Errors appending to one symbol don't stop the others being appended to.
+        """
+        self._argus_lib.check_quota()
+        metadata = metadata or {}
+        symbols = list(items)
+        previous_versions = self._latest_versions({"symbol": {"$in": symbols}})
+
+        results, appends, to_write = {}, [], []
+        for symbol in symbols:
+            previous_version = previous_versions.get(symbol)
+            if previous_version is None:
+                if upsert:
+                    to_write.append(symbol)
+                else:
+                    results[symbol] = NoDataFoundException(
+                        f"No data found for {symbol} in library {self._argus_lib.get_name()}"
+                    )
+            elif previous_version.get("metadata") and previous_version["metadata"].get("deleted", False) is True:
+                if upsert:
+                    to_write.append(symbol)
+                else:
+                    appends.append(symbol)
+            elif len(items[symbol]) == 0:
+                results[symbol] = VersionedItem(
+                    symbol=symbol,
+                    library=self._argus_lib.get_name(),
+                    version=previous_version["version"],
+                    metadata=None,
+                    data=None,
+                    host=self._argus_lib.argus.mongo_host,
+                )
+            else:
+                appends.append(symbol)
+
+        version_nums = self._next_version_nums(appends, upsert=False)
+        writes = {}
+        for symbol in appends:
+            if symbol not in version_nums:
+                results[symbol] = ArgusException(f"No version number found for {symbol}")
+                continue
+            previous_version = previous_versions[symbol]
+            version = {"_id": bson.ObjectId()}
+            version["argus_version"] = ARGUS_VERSION_NUMERICAL
+            version["symbol"] = symbol
+            version["version"] = version_nums[symbol]
+            if metadata.get(symbol) is not None:
+                version["metadata"] = metadata[symbol]
+            elif "metadata" in previous_version:
+                version["metadata"] = previous_version["metadata"]
+            # As in append: a version number out of sequence means the history of the symbol isn't clean
+            dirty_append = version["version"] != previous_version["version"] + 1
+
+            def _append(symbol=symbol, version=version, previous_version=previous_version, dirty_append=dirty_append):
+                handler = self._read_handler(previous_version, symbol)
+                if not (handler and hasattr(handler, "append") and callable(handler.append)):
+                    raise Exception(f"Append not implemented for handler {handler}")
+                handler.append(
+                    self._argus_lib,
+                    version,
+                    symbol,
+                    items[symbol],
+                    previous_version,
+                    dirty_append=dirty_append,
+                    **kwargs,
+                )
+
+            writes[symbol] = (version, previous_version, _append)
+
+        results.update(
+            self._do_batch_write(
+                writes,
+                prune_previous_version,
+                kwargs.get("keep_mins", 120),
+                retry=lambda symbol: self.append(
+                    symbol,
+                    items[symbol],
+                    metadata.get(symbol),
+                    prune_previous_version=prune_previous_version,
+                    upsert=upsert,
+                    **kwargs,
+                ),
+            )
+        )
+        if to_write:
+            results.update(
+                self.batch_write(
+                    {symbol: items[symbol] for symbol in to_write},
+                    metadata={symbol: metadata[symbol] for symbol in to_write if symbol in metadata},
+                    prune_previous_version=prune_previous_version,
+                    **kwargs,
+                )
+            )
+        return {symbol: results[symbol] for symbol in symbols}
+
+    def _do_batch_write(self, writes, prune_previous_version, keep_mins, retry):
+        """
+        Run the writes, symbol -> (version, previous_version, write function), with their segment writes batched,
+        insert the versions of the symbols written successfully, and then prune their previous versions.
+        Symbols which failed with an error that mongo_retry retries are written again on their own with retry(symbol).
+        Returns a dict of symbol -> VersionedItem or exception.
+        """
+        results = {}
+        written = []
+        pruner = get_pruner() if prune_previous_version else None
+        with writing(self, writes):
+            with batched_segment_writes() as failed:
+                for symbol, (version, previous_version, write) in writes.items():
+                    try:
+                        write()
+                        written.append(symbol)
+                    except Exception as e:
+                        results[symbol] = e
+            results.update(failed)
+
+            # Insert the new versions of the symbols which have all their segments written
+            written = [symbol for symbol in written if symbol not in failed]
+            results.update(self._insert_versions([writes[symbol][0] for symbol in written]))
+            written = [symbol for symbol in written if symbol not in results]
+
+            if pruner is not None:
+                for symbol in written:
+                    if writes[symbol][1]:
+                        pruner.submit(self, symbol, keep_mins, writes[symbol][0])
+
+        if prune_previous_version and pruner is None:
+            to_prune = [symbol for symbol in written if writes[symbol][1]]
+            try:
+                self._prune_previous_versions_batch(
+                    to_prune,
+                    keep_mins=keep_mins,
+                    new_versions={symbol: writes[symbol][0] for symbol in to_prune},
+                )
+            except Exception as e:
+                # The new versions are in place: the old ones get pruned by a later write
+                log_exception("_prune_previous_versions_batch", e, 1)
+                logger.warning(f"Failed to prune the previous versions of {len(to_prune)} symbols: {e}")
+
+        for symbol in written:
+            version = writes[symbol][0]
+            results[symbol] = VersionedItem(
+                symbol=symbol,
+                library=self._argus_lib.get_name(),
+                version=version["version"],
+                metadata=version.pop("metadata", None),
+                data=None,
+                host=self._argus_lib.argus.mongo_host,
+            )
+
+        for symbol, result in list(results.items()):
+            if isinstance(result, (OperationFailure, AutoReconnect)) and not isinstance(
+                result, (DuplicateKeyError, BulkWriteError)
+            ):
+                logger.debug(f"Retrying the write of {symbol} on its own: {result}")
+                try:
+                    results[symbol] = retry(symbol)
+                except Exception as e:
+                    results[symbol] = e
+        return results
+
     def _add_new_version_using_reference(self, symbol, new_version, reference_version, prune_previous_version):
         # Attention: better not use this method following an append.
         # It is dangerous because if it deletes the version at the last_look, the segments added by the
@@ -743,6 +1507,8 @@ class VersionStore:
         if last_look is None or last_look.get("deleted"):
             # Revert the change
             mongo_retry(self._versions.delete_one)({"_id": new_version["_id"]})
+            self._invalidate_cached_versions(symbol)
+            self._refresh_symbol_state(symbol, new_version["version"])
             # Indicate the failure
             raise OperationFailure(
                 "Failed to write metadata for symbol %s. "
@@ -750,7 +1516,10 @@ class VersionStore:
                 % (symbol, str(reference_version["_id"]), reference_version["version"])
             )
 
-        if prune_previous_version and reference_version:
+        pruner = get_pruner() if prune_previous_version and reference_version else None
+        if pruner is not None:
+            pruner.submit(self, symbol, 120, new_version)
+        elif prune_previous_version and reference_version:
             self._prune_previous_versions(symbol, new_version_shas=new_version.get(FW_POINTERS_REFS_KEY))
 
         logger.debug("Finished updating versions with new metadata for %s", symbol)
@@ -877,21 +1646,7 @@ class VersionStore:
         """
         read_preference = ReadPreference.SECONDARY_PREFERRED if keep_mins > 0 else ReadPreference.PRIMARY
         versions = self._versions.with_options(read_preference=read_preference)
-        query = {
-            "symbol": symbol,
-            # Not snapshotted
-            "$or": [{"parent": {"$exists": False}}, {"parent": []}],
-            # At least 'keep_mins' old
-            "_id": {
-                "$lt": bson.ObjectId.from_datetime(
-                    dt.utcnow()
-                    # Add one second as the ObjectId
-                    # str has random fuzz
-                    + timedelta(seconds=1)
-                    - timedelta(minutes=keep_mins)
-                )
-            },
-        }
+        query = _prunable_versions_spec(symbol, keep_mins)
         cursor = versions.find(
             query,
             # Using version number here instead of _id as there's a very unlikely case
@@ -945,6 +1700,7 @@ class VersionStore:
 
         # Delete the version documents
         mongo_retry(self._versions.delete_many)({"_id": {"$in": version_ids}})
+        self._invalidate_cached_versions(symbol)
 
         prunable_ids_to_shas = {k: prunable_ids_to_shas[k] for k in version_ids}
 
@@ -961,6 +1717,112 @@ class VersionStore:
             pointers_cfgs=[v[1] for v in prunable_ids_to_shas.values()],
         )
 
+    def _prune_previous_versions_batch(self, symbols, keep_mins=120, new_versions=None):
+        """
+        _prune_previous_versions for many symbols, after their new versions (symbol -> version document) have been
+        inserted. The prunable versions of all the symbols are found with one query, and deleted with another.
+        """
+        if not symbols:
+            return
+        new_versions = new_versions or {}
+        read_preference = ReadPreference.SECONDARY_PREFERRED if keep_mins > 0 else ReadPreference.PRIMARY
+        versions = self._versions.with_options(read_preference=read_preference)
+        query = _prunable_versions_spec({"$in": list(symbols)}, keep_mins)
+        # Prune as if the new versions had not been inserted yet, as _prune_previous_versions does
+        query["_id"]["$nin"] = [v["_id"] for v in new_versions.values()]
+        cursor = mongo_retry(versions.find)(
+            query,
+            sort=[("symbol", pymongo.ASCENDING), ("version", pymongo.DESCENDING)],
+            projection={"symbol": 1, "_id": 1, FW_POINTERS_REFS_KEY: 1, FW_POINTERS_CONFIG_KEY: 1},
+        )
+        prunable = {}
+        for v in cursor:
+            if v["symbol"] not in prunable:
+                # Guarantees at least one version is kept
+                prunable[v["symbol"]] = {}
+                continue
+            prunable[v["symbol"]][v["_id"]] = (
+                [bson.binary.Binary(x) for x in v.get(FW_POINTERS_REFS_KEY, [])],
+                get_fwptr_config(v),
+            )
+        prunable_ids = [i for ids in prunable.values() for i in ids]
+        if not prunable_ids:
+            return
+
+        # Keep the bases of the versions which stay (including the new ones)
+        base_version_ids = set(
+            v["base_version_id"]
+            for v in self._versions.find(
+                {
+                    "symbol": {"$in": [symbol for symbol in prunable if prunable[symbol]]},
+                    "_id": {"$nin": prunable_ids},
+                    "base_version_id": {"$exists": True},
+                },
+                projection={"base_version_id": 1},
+            )
+        )
+        to_delete = {}
+        for symbol, ids_to_shas in prunable.items():
+            version_ids = [i for i in ids_to_shas if i not in base_version_ids]
+            if version_ids:
+                to_delete[symbol] = version_ids
+        if not to_delete:
+            return
+
+        # Delete the version documents
+        mongo_retry(self._versions.delete_many)({"_id": {"$in": [i for ids in to_delete.values() for i in ids]}})
+        for symbol in to_delete:
+            self._invalidate_cached_versions(symbol)
+
+        # Cleanup any chunks
+        for symbol, version_ids in to_delete.items():
+            new_version_shas = set(new_versions.get(symbol, {}).get(FW_POINTERS_REFS_KEY, []))
+            ids_to_shas = {k: prunable[symbol][k] for k in version_ids}
+            mongo_retry(cleanup)(
+                self._argus_lib,
+                symbol,
+                version_ids,
+                self._versions,
+                shas_to_delete=[sha for v in ids_to_shas.values() for sha in v[0] if sha not in new_version_shas],
+                pointers_cfgs=[v[1] for v in ids_to_shas.values()],
+            )
+
+    def prune_all(self, keep_mins=120, workers=1, symbols=None):
+        """
+        Prune the previous versions of every symbol in the library, as writes do: delete the versions not pointed
+        to by snapshots which are older than a version at least keep_mins minutes old. The symbols are pruned
+        ARGUS_PRUNE_BATCH_SYMBOLS at a time, with a few queries per batch.
+
+        Parameters
+        ----------
+        keep_mins : `int`
+            Keep the versions less than keep_mins minutes old. Default: 120
+        workers : `int`
+            The number of batches pruned in parallel. Default: 1
+        symbols : `list` or `None`
+            Only prune these symbols
+        """
+        if symbols is None:
+            symbols = self._versions.distinct("symbol")
+        symbols = list(symbols)
+        batches = [
+            symbols[i: i + ARGUS_PRUNE_BATCH_SYMBOLS] for i in range(0, len(symbols), ARGUS_PRUNE_BATCH_SYMBOLS)
+        ]
+
+        def _prune(batch):
+            mongo_retry(self._prune_previous_versions_batch)(batch, keep_mins=keep_mins)
+
+        if workers > 1 and len(batches) > 1:
+            pool = ThreadPool(min(workers, len(batches)))
+            try:
+                pool.map(_prune, batches)
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            for batch in batches:
+                _prune(batch)
+
     @mongo_retry
     def _delete_version(self, symbol, version_num, do_cleanup=True):
         """
@@ -981,6 +1843,8 @@ class VersionStore:
                 )
                 return
         self._versions.delete_one({"_id": version["_id"]})
+        self._invalidate_cached_versions(symbol)
+        self._refresh_symbol_state(symbol, version_num)
         # TODO: for FW pointers, if the above statement fails, they we have no way to delete the orphaned segments.
         #       This would be possible only via FSCK, or by moving the above statement at the end of this method,
         #       but with the risk of failing to delelte the version catastrophically, and ending up with a corrupted v.
@@ -1077,6 +1941,7 @@ class VersionStore:
                 pass
 
         mongo_retry(self._snapshots.insert_one)(snapshot)
+        self._invalidate_cached_versions()
 
     @mongo_retry
     def delete_snapshot(self, snap_name):
@@ -1096,6 +1961,7 @@ class VersionStore:
         self._versions.update_many({"parent": snapshot["_id"]}, {"$pull": {"parent": snapshot["_id"]}})
 
         self._snapshots.delete_one({"name": snap_name})
+        self._invalidate_cached_versions()
 
     @mongo_retry
     def list_snapshots(self):
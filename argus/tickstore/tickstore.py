@@ -27,6 +27,7 @@ from ..date import (
     to_dt,
     utc_dt_to_local_dt,
 )
+from .._compression import compress, decompress, array_samples, select_codec
 from ..decorators import mongo_retry
 from ..exceptions import (
     OverlappingDataException,
@@ -76,6 +77,7 @@ logger = logging.getLogger(__name__)
 #  SEGMENT: 1386933906826L,
 #  SHA: 1386933906826L,
 #  VERSION: 3,
+#  CODEC: u'zstd:9+shuffle',  # only for libraries with a COMPRESSION codec set, otherwise LZ4HC
 # }
 
 TICK_STORE_TYPE = "TickStoreV3"
@@ -100,6 +102,7 @@ ROWMASK = "m"
 
 COUNT = "c"
 VERSION = "v"
+CODEC = "cd"
 
 META = "md"
 
@@ -471,7 +474,8 @@ class TickStore:
         if doc[VERSION] != 3:
             raise ArgusException(f"Unhandled document version: {doc[VERSION]}")
         # np.cumsum copies the read-only array created with frombuffer
-        rtn[INDEX] = np.cumsum(np.frombuffer(lz4_decompress(doc[INDEX]), dtype="uint64"))
+        codec = doc.get(CODEC)
+        rtn[INDEX] = np.cumsum(np.frombuffer(decompress(doc[INDEX], codec, 8), dtype="uint64"))
         doc_length = len(rtn[INDEX])
         column_set.update(doc[COLUMNS].keys())
 
@@ -481,7 +485,7 @@ class TickStore:
             try:
                 coldata = doc[COLUMNS][c]
                 # the or below will make a copy of this read-only array
-                mask = np.frombuffer(lz4_decompress(coldata[ROWMASK]), dtype="uint8")
+                mask = np.frombuffer(decompress(coldata[ROWMASK], codec), dtype="uint8")
                 union_mask = union_mask | mask
             except KeyError:
                 rtn[c] = None
@@ -501,11 +505,11 @@ class TickStore:
                 dtype = np.dtype(coldata[DTYPE])
                 # values ends up being copied by pandas before being returned to the user. However, we
                 # copy it into a bytearray here for safety.
-                values = np.frombuffer(bytearray(lz4_decompress(coldata[DATA])), dtype=dtype)
+                values = np.frombuffer(bytearray(decompress(coldata[DATA], codec, dtype.itemsize)), dtype=dtype)
                 self._set_or_promote_dtype(column_dtypes, c, dtype)
                 rtn[c] = self._empty(rtn_length, dtype=column_dtypes[c])
                 # unpackbits will make a copy of the read-only array created by frombuffer
-                rowmask = np.unpackbits(np.frombuffer(lz4_decompress(coldata[ROWMASK]), dtype="uint8"))[
+                rowmask = np.unpackbits(np.frombuffer(decompress(coldata[ROWMASK], codec), dtype="uint8"))[
                           :doc_length
                           ].astype("bool")
                 rowmask = rowmask[union_mask]
@@ -615,10 +619,15 @@ class TickStore:
             raise UnhandledDtypeException(f"Can't persist type {type(data)} to tickstore")
         self._assert_nonoverlapping_data(symbol, to_dt(start), to_dt(end))
 
+        codec, _ = select_codec(
+            self._argus_lib.get_compression(),
+            lambda: self._codec_samples(data if pandas else pd.DataFrame(data[:10000])),
+            key=(self._argus_lib.get_name(), symbol),
+        )
         if pandas:
-            buckets = self._pandas_to_buckets(data, symbol, initial_image)
+            buckets = self._pandas_to_buckets(data, symbol, initial_image, codec)
         else:
-            buckets = self._to_buckets(data, symbol, initial_image)
+            buckets = self._to_buckets(data, symbol, initial_image, codec)
         self._write(buckets)
 
         if metadata:
@@ -632,20 +641,34 @@ class TickStore:
         rate = int(ticks / t) if t != 0 else float("nan")
         logger.debug(f"{len(buckets)} buckets in {t}: approx {rate} ticks/sec")
 
-    def _pandas_to_buckets(self, x, symbol, initial_image):
+    def _pandas_to_buckets(self, x, symbol, initial_image, codec=None):
         rtn = []
         for i in range(0, len(x), self._chunk_size):
-            bucket, initial_image = TickStore._pandas_to_bucket(x[i: i + self._chunk_size], symbol, initial_image)
+            bucket, initial_image = TickStore._pandas_to_bucket(
+                x[i: i + self._chunk_size], symbol, initial_image, codec
+            )
             rtn.append(bucket)
         return rtn
 
-    def _to_buckets(self, x, symbol, initial_image):
+    def _to_buckets(self, x, symbol, initial_image, codec=None):
         rtn = []
         for i in range(0, len(x), self._chunk_size):
-            bucket, initial_image = TickStore._to_bucket(x[i: i + self._chunk_size], symbol, initial_image)
+            bucket, initial_image = TickStore._to_bucket(x[i: i + self._chunk_size], symbol, initial_image, codec)
             rtn.append(bucket)
         return rtn
 
+    @staticmethod
+    def _codec_samples(df):
+        """Samples of the columns for adaptive compression"""
+        return array_samples([np.asarray(df[c]) for c in df if c != "index"])
+
+    @staticmethod
+    def _compress(data, codec, typesize=1):
+        """Compress with the library's codec, buckets of libraries without one are compressed with LZ4HC"""
+        if codec is None:
+            return lz4_compressHC(data)
+        return compress(data, codec, typesize)
+
     @staticmethod
     def _to_ms(date):
         if isinstance(date, dt):
@@ -709,8 +732,10 @@ class TickStore:
         return final_image
 
     @staticmethod
-    def _pandas_to_bucket(df, symbol, initial_image):
+    def _pandas_to_bucket(df, symbol, initial_image, codec=None):
         rtn = {SYMBOL: symbol, VERSION: CHUNK_VERSION_NUMBER, COLUMNS: {}, COUNT: len(df)}
+        if codec is not None:
+            rtn[CODEC] = codec
         end = to_dt(df.index[-1].to_pydatetime())
         if initial_image:
             if "index" in initial_image:
@@ -727,7 +752,7 @@ class TickStore:
         rtn[START] = start
 
         logger.warning("NB treating all values as 'exists' - no longer sparse")
-        rowmask = Binary(lz4_compressHC(np.packbits(np.ones(len(df), dtype="uint8")).tostring()))
+        rowmask = Binary(TickStore._compress(np.packbits(np.ones(len(df), dtype="uint8")).tostring(), codec))
 
         index_name = df.index.names[0] or "index"
         if PD_VER < "0.23.0":
@@ -738,26 +763,30 @@ class TickStore:
         for col in df:
             array = TickStore._ensure_supported_dtypes(recs[col])
             col_data = {
-                DATA: Binary(lz4_compressHC(array.tostring())),
+                DATA: Binary(TickStore._compress(array.tostring(), codec, array.dtype.itemsize)),
                 ROWMASK: rowmask,
                 DTYPE: TickStore._str_dtype(array.dtype),
             }
             rtn[COLUMNS][col] = col_data
         rtn[INDEX] = Binary(
-            lz4_compressHC(
+            TickStore._compress(
                 np.concatenate(
                     (
                         [recs[index_name][0].astype("datetime64[ms]").view("uint64")],
                         np.diff(recs[index_name].astype("datetime64[ms]").view("uint64")),
                     )
-                ).tostring()
+                ).tostring(),
+                codec,
+                8,
             )
         )
         return rtn, final_image
 
     @staticmethod
-    def _to_bucket(ticks, symbol, initial_image):
+    def _to_bucket(ticks, symbol, initial_image, codec=None):
         rtn = {SYMBOL: symbol, VERSION: CHUNK_VERSION_NUMBER, COLUMNS: {}, COUNT: len(ticks)}
+        if codec is not None:
+            rtn[CODEC] = codec
         data = {}
         rowmask = {}
         start = to_dt(ticks[0]["index"])
@@ -783,13 +812,15 @@ class TickStore:
                         rowmask[k][i] = 1
                     data[k] = [v]
 
-        rowmask = dict([(k, Binary(lz4_compressHC(np.packbits(v).tostring()))) for k, v in iteritems(rowmask)])
+        rowmask = dict(
+            [(k, Binary(TickStore._compress(np.packbits(v).tostring(), codec))) for k, v in iteritems(rowmask)]
+        )
         for k, v in iteritems(data):
             if k != "index":
                 v = np.array(v)
                 v = TickStore._ensure_supported_dtypes(v)
                 rtn[COLUMNS][k] = {
-                    DATA: Binary(lz4_compressHC(v.tostring())),
+                    DATA: Binary(TickStore._compress(v.tostring(), codec, v.dtype.itemsize)),
                     DTYPE: TickStore._str_dtype(v.dtype),
                     ROWMASK: rowmask[k],
                 }
@@ -802,7 +833,8 @@ class TickStore:
             rtn[IMAGE_DOC] = {IMAGE_TIME: image_start, IMAGE: initial_image}
         rtn[END] = end
         rtn[START] = start
-        rtn[INDEX] = Binary(lz4_compressHC(np.concatenate(([data["index"][0]], np.diff(data["index"]))).tostring()))
+        index = np.concatenate(([data["index"][0]], np.diff(data["index"])))
+        rtn[INDEX] = Binary(TickStore._compress(index.tostring(), codec, index.dtype.itemsize))
         return rtn, final_image
 
     def max_date(self, symbol):
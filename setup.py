@@ -63,6 +63,7 @@ setup(
         "tzlocal",
         "lz4",
     ],
+    extras_require={"zstd": ["zstandard"]},
     tests_require=["mock", "mockextras", "pytest", "pytest-cov", "pytest-timeout", "pytest-xdist", "lz4"],
     entry_points={
         "console_scripts": [
@@ -73,6 +74,7 @@ setup(
             "argus_create_user = argus.scripts.argus_create_user:main",
             "argus_prune_versions = argus.scripts.argus_prune_versions:main",
             "argus_fsck = argus.scripts.argus_fsck:main",
+            "argus_backfill_symbols = argus.scripts.argus_backfill_symbols:main",
         ]
     },
     classifiers=[
@@ -6,14 +6,16 @@ import numpy as np
 import pandas as pd
 import pymongo
 import pytest
+from mock import patch
 from pandas import DataFrame, MultiIndex, Index, Series
 from pandas.util.testing import assert_frame_equal, assert_series_equal
 
 from argus._util import mongo_count
-from argus.chunkstore.chunkstore import START, SYMBOL
+from argus.chunkstore.chunkstore import CHUNK_STORE_TYPE, COLUMN, PARTS, START, SYMBOL, ChunkStore
 from argus.chunkstore.passthrough_chunker import PassthroughChunker
 from argus.date import DateRange
 from argus.exceptions import NoDataFoundException
+from argus.serialization.numpy_arrays import FrametoArraySerializer
 from tests.integration.chunkstore.test_utils import create_test_data
 from tests.util import assert_frame_equal_
 
@@ -1243,6 +1245,23 @@ def test_chunkstore_multiread_samedate(chunkstore_lib):
     assert len(ret["c"]) == 0
 
 
+def test_chunkstore_multiread_fetches_metadata_in_one_query(chunkstore_lib):
+    df = create_test_data(size=10)
+    chunkstore_lib.write("a", df, chunk_size="D")
+    df2 = create_test_data(size=10, date_offset=3)
+    chunkstore_lib.write("b", df2, chunk_size="D")
+
+    with patch.object(chunkstore_lib._mdata, "find", wraps=chunkstore_lib._mdata.find) as find, patch.object(
+        chunkstore_lib._mdata, "find_one"
+    ) as find_one:
+        ret = chunkstore_lib.read(["a", "b"], chunk_range=DateRange(dt(2016, 1, 5), None))
+
+    assert find.call_count == 1
+    assert find_one.call_count == 0
+    assert_frame_equal_(df[4:], ret["a"])
+    assert_frame_equal_(df2[1:], ret["b"])
+
+
 def test_write_dataframe_with_func(chunkstore_lib):
     def f(data):
         data.loc[:, "data0"] += 1.0
@@ -1254,3 +1273,183 @@ def test_write_dataframe_with_func(chunkstore_lib):
 
     df.loc[:, "data0"] += 1.0
     assert_frame_equal_(df, read_df)
+
+
+def test_write_update_with_codec(chunkstore_lib):
+    df = DataFrame(
+        data={"data": np.random.randn(30), "s": ["abc", None, "de"] * 10},
+        index=MultiIndex.from_tuples(
+            [(dt(2016, 1, 1 + i // 3), i % 3) for i in range(30)], names=["date", "id"]
+        ),
+    )
+    chunkstore_lib._argus_lib.set_compression("lz4hc+shuffle")
+    chunkstore_lib.write("test_df", df, chunk_size="D")
+    assert set(m.get("cd") for m in chunkstore_lib._mdata.find({SYMBOL: "test_df"})) == {"lz4hc+shuffle"}
+    assert_frame_equal_(chunkstore_lib.read("test_df"), df)
+
+    chunkstore_lib._argus_lib.set_compression(None)
+    update = df.iloc[:3].copy()
+    update["data"] = 1.0
+    chunkstore_lib.update("test_df", update)
+    expected = df.copy()
+    expected.iloc[:3, 0] = 1.0
+    assert_frame_equal_(chunkstore_lib.read("test_df"), expected)
+    assert_frame_equal_(chunkstore_lib.read("test_df", columns=["s"]), expected[["s"]])
+
+
+def test_adaptive_compression(chunkstore_lib):
+    df = create_test_data(size=100, index=True, multiindex=False)
+    chunkstore_lib._argus_lib.set_compression("auto:0")
+    chunkstore_lib.write("test_df", df, chunk_size="D")
+    info = chunkstore_lib.get_info("test_df")["compression"]
+    assert info["adaptive"] == "auto:0"
+    assert set(m.get("cd") for m in chunkstore_lib._mdata.find({SYMBOL: "test_df"})) == {info["codec"]}
+
+    with patch("argus.chunkstore.chunkstore.select_codec") as select_codec:
+        chunkstore_lib.append("test_df", create_test_data(size=10, index=True, multiindex=False, date_offset=100))
+    assert select_codec.call_count == 0
+    assert chunkstore_lib.get_info("test_df")["compression"] == info
+    assert len(chunkstore_lib.read("test_df")) == 110
+
+
+def test_columnar_chunks(argus, library_name):
+    argus.initialize_library(library_name, CHUNK_STORE_TYPE, columnar_chunks=True)
+    lib = argus[library_name]
+    df = create_test_data(size=31, cols=5).assign(s=["abc", None, "de"] * 10 + ["f"])
+    new = create_test_data(size=3, cols=5, date_offset=31).assign(s="xyz")
+
+    with patch("argus.chunkstore.chunkstore.MAX_CHUNK_SIZE", 40):
+        lib.write("test_df", df, chunk_size="M")
+        lib.append("test_df", new)
+    expected = pd.concat([df, new])
+
+    segments = list(lib._collection.find({SYMBOL: "test_df"}))
+    assert {s[COLUMN] for s in segments} == {"date", "id", "data0", "data1", "data2", "data3", "data4", "s"}
+    assert len(segments) > 16
+    assert_frame_equal_(lib.read("test_df"), expected)
+
+    real_find = lib._collection.find
+    fetched = []
+
+    def _find(*args, **kwargs):
+        docs = list(real_find(*args, **kwargs))
+        fetched.extend(docs)
+        return docs
+
+    with patch.object(lib._collection, "find", side_effect=_find):
+        assert_frame_equal_(lib.read("test_df", columns=["data3", "s"]), expected[["data3", "s"]])
+    assert {s[COLUMN] for s in fetched} == {"date", "id", "data3", "s"}
+
+    # Chunks rewritten without the columnar layout are read in full
+    lib._argus_lib.set_library_metadata("COLUMNAR_CHUNKS", False)
+    lib._columnar = None
+    more = create_test_data(size=3, cols=5, date_offset=34).assign(s="new")
+    lib.update("test_df", more)
+    expected = pd.concat([df, more])
+
+    assert COLUMN in lib._collection.find_one({SYMBOL: "test_df", START: dt(2016, 1, 1)})
+    assert all(COLUMN not in s for s in lib._collection.find({SYMBOL: "test_df", START: dt(2016, 2, 1)}))
+    assert_frame_equal_(lib.read("test_df"), expected)
+    assert_frame_equal_(lib.read("test_df", columns=["data3", "s"]), expected[["data3", "s"]])
+
+
+def test_append_in_place(chunkstore_lib):
+    df = create_test_data(size=10, cols=2, multiindex=False)
+    chunkstore_lib.write("test_df", df, chunk_size="M")
+    appends = [
+        create_test_data(size=2, cols=2, multiindex=False, date_offset=10),
+        create_test_data(size=3, cols=2, multiindex=False, date_offset=12),
+    ]
+
+    with patch.object(ChunkStore, "_read_chunks", autospec=True, side_effect=ChunkStore._read_chunks) as read_chunks:
+        for append in appends:
+            chunkstore_lib.append("test_df", append)
+    assert read_chunks.call_count == 0
+    expected = pd.concat([df] + appends)
+
+    assert len(chunkstore_lib._mdata.find_one({SYMBOL: "test_df"})[PARTS]) == 2
+    assert_frame_equal_(chunkstore_lib.read("test_df"), expected)
+    assert_frame_equal_(chunkstore_lib.read("test_df", columns=["data1"]), expected[["data1"]])
+    assert chunkstore_lib.get_info("test_df")["len"] == 15
+    assert chunkstore_lib.get_info("test_df")["appended_rows"] == 5
+
+    # Data before the end of the chunk's data, or past the chunk's parts limit, rewrites the chunk
+    overlap = create_test_data(size=2, cols=2, multiindex=False, date_offset=14)
+    chunkstore_lib.append("test_df", overlap)
+    expected = pd.concat([expected, overlap]).sort_index()
+    assert PARTS not in chunkstore_lib._mdata.find_one({SYMBOL: "test_df"})
+    assert_frame_equal_(chunkstore_lib.read("test_df"), expected)
+
+    with patch("argus.chunkstore.chunkstore.ARGUS_CHUNKSTORE_MAX_PARTS", 2):
+        for offset in [16, 17]:
+            append = create_test_data(size=1, cols=2, multiindex=False, date_offset=offset)
+            chunkstore_lib.append("test_df", append)
+            expected = pd.concat([expected, append])
+            assert len(chunkstore_lib._mdata.find_one({SYMBOL: "test_df"}).get(PARTS, [])) == 17 - offset
+    assert_frame_equal_(chunkstore_lib.read("test_df"), expected)
+
+    # Data after the last chunk is a new chunk
+    with patch.object(ChunkStore, "_read_chunks", autospec=True, side_effect=ChunkStore._read_chunks) as read_chunks:
+        append = create_test_data(size=3, cols=2, multiindex=False, date_offset=40)
+        chunkstore_lib.append("test_df", append)
+    assert read_chunks.call_count == 0
+    expected = pd.concat([expected, append])
+    assert_frame_equal_(chunkstore_lib.read("test_df"), expected)
+    assert chunkstore_lib.get_info("test_df")["chunk_count"] == 2
+
+
+def test_append_in_place_without_index(chunkstore_lib):
+    df = create_test_data(size=4, index=False)
+    chunkstore_lib.write("test_df", df, chunk_size="M")
+    # appends to a chunk without an index are concatenated as they are
+    append = create_test_data(size=2, index=False, date_offset=1)
+    chunkstore_lib.append("test_df", append)
+
+    assert len(chunkstore_lib._mdata.find_one({SYMBOL: "test_df"})[PARTS]) == 1
+    assert_frame_equal_(chunkstore_lib.read("test_df"), pd.concat([df, append], ignore_index=True))
+
+
+def test_update_reads_chunks_in_one_query(chunkstore_lib):
+    df = create_test_data(size=10, cols=2, multiindex=False)
+    chunkstore_lib.write("test_df", df, chunk_size="D")
+    update = df.iloc[2:8] * 2
+
+    with patch.object(ChunkStore, "_read_chunks", autospec=True, side_effect=ChunkStore._read_chunks) as read_chunks:
+        chunkstore_lib.update("test_df", update)
+    assert read_chunks.call_count == 1
+    assert_frame_equal_(chunkstore_lib.read("test_df"), pd.concat([df.iloc[:2], update, df.iloc[8:]]))
+
+
+@pytest.mark.parametrize("read_ahead", [0, 2])
+def test_iterators_read_ahead(chunkstore_lib, read_ahead):
+    df = create_test_data(size=20, cols=2, multiindex=False).assign(s=["abc", None] * 10)
+    append = create_test_data(size=3, cols=2, multiindex=False, date_offset=20).assign(s="x")
+    with patch("argus.chunkstore.chunkstore.MAX_CHUNK_SIZE", 100):
+        chunkstore_lib.write("test_df", df, chunk_size="W")
+        chunkstore_lib.append("test_df", append)
+    chunks = [
+        chunkstore_lib.read("test_df", chunk_range=DateRange(start, end))
+        for start, end in chunkstore_lib.get_chunk_ranges("test_df")
+    ]
+    assert len(chunks) == 4
+
+    with patch("argus.chunkstore.chunkstore.ARGUS_CHUNKSTORE_READ_AHEAD", read_ahead), patch.object(
+        chunkstore_lib, "read"
+    ) as read:
+        for chunk, expected in zip(chunkstore_lib.iterator("test_df"), chunks):
+            assert_frame_equal_(chunk, expected)
+        for chunk, expected in zip(chunkstore_lib.reverse_iterator("test_df", columns=["s"]), chunks[::-1]):
+            assert_frame_equal_(chunk, expected[["s"]])
+        ranged = DateRange(dt(2016, 1, 8), dt(2016, 1, 12))
+        ranged = list(chunkstore_lib.reverse_iterator("test_df", chunk_range=ranged))
+        assert len(ranged) == 2
+        assert_frame_equal_(ranged[0], chunks[2])
+
+        # stopping early, or failing, stops the reads ahead
+        iterator = chunkstore_lib.iterator("test_df")
+        assert_frame_equal_(next(iterator), chunks[0])
+        iterator.close()
+        with patch.object(FrametoArraySerializer, "deserialize", side_effect=ValueError("bad chunk")):
+            with pytest.raises(ValueError):
+                list(chunkstore_lib.iterator("test_df"))
+    assert read.call_count == 0
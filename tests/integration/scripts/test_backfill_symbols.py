@@ -0,0 +1,17 @@
+from mock import patch
+
+from argus.scripts.argus_backfill_symbols import main
+from ...util import run_as_main
+
+
+def test_backfill_symbols(mongo_host, library, library_name):
+    library.write("asdf", {"foo": "bar"})
+    library.write("furble", {"foo": "bar"})
+    library._symbols.drop()
+    library._argus_lib.set_library_metadata("SYMBOLS_COLLECTION", None)
+
+    with patch("argus.scripts.argus_backfill_symbols.do_db_auth", return_value=True):
+        run_as_main(main, "--library", library_name, "--host", mongo_host)
+
+    assert library._argus_lib.get_library_metadata("SYMBOLS_COLLECTION") is True
+    assert sorted(x["symbol"] for x in library._symbols.find({"deleted": False})) == ["asdf", "furble"]
@@ -1,3 +1,4 @@
+import hashlib
 from datetime import datetime as dt, timedelta as dtd
 
 import bson
@@ -8,6 +9,7 @@ from pymongo.server_type import SERVER_TYPE
 
 from argus._config import FwPointersCfg, FW_POINTERS_REFS_KEY
 from argus._util import mongo_count
+from argus.store import _segment_cache
 from argus.store._ndarray_store import NdarrayStore
 from argus.store.version_store import register_versioned_storage
 from tests.integration.store.test_version_store import _query, FwPointersCtx
@@ -159,6 +161,135 @@ def test_save_read_large_ndarray(library):
     assert np.all(ndarr == saved_arr)
 
 
+def test_sha_is_hash_tree_of_segments(library):
+    ndarr = np.arange(1024 * 1024, dtype="f8")
+    library.write("MYARR", ndarr)
+    version = library._versions.find_one({"symbol": "MYARR"})
+    rows = version["sha_tree"]
+    leaves = [hashlib.sha1(ndarr[i: i + rows].tobytes()).digest() for i in range(0, len(ndarr), rows)]
+    assert library._collection.count_documents({"symbol": "MYARR"}) == len(leaves) > 1
+    assert version["sha"] == bson.Binary(hashlib.sha1(b"".join(leaves)).digest())
+
+
+@pytest.mark.parametrize("legacy_sha", [False, True])
+def test_write_with_same_first_rows_appends(library, legacy_sha):
+    ndarr = np.arange(1024 * 1024, dtype="f8")
+    library.write("MYARR", ndarr[:-1000])
+    segment_count = library._collection.count_documents({"symbol": "MYARR"})
+    if legacy_sha:
+        # Written before the hash tree
+        library._versions.update_one(
+            {"symbol": "MYARR"},
+            {"$set": {"sha": hashlib.sha1(ndarr[:-1000].tobytes()).digest()}, "$unset": {"sha_tree": 1}},
+        )
+    library.write("MYARR", ndarr, prune_previous_version=False)
+    library.write("OTHER", ndarr)
+    version = library._versions.find_one({"symbol": "MYARR", "version": 2})
+    other = library._versions.find_one({"symbol": "OTHER"})
+    # Only the last segment was rewritten
+    assert library._collection.count_documents({"symbol": "MYARR"}) == segment_count + 1
+    assert version["sha"] == other["sha"]
+    assert np.all(library.read("MYARR").data == ndarr)
+
+
+@pytest.mark.parametrize("in_flight", [0, 1, 3])
+def test_write_in_batches(library, in_flight):
+    ndarr = np.random.randn(2 * 1024 * 1024)
+    with patch("argus.store._ndarray_store.ARGUS_WRITE_BATCH_SIZE", 1), patch(
+        "argus.store._ndarray_store.ARGUS_WRITE_IN_FLIGHT", in_flight
+    ), patch("argus.store._ndarray_store._segment_writer_pool", None):
+        library.write("MYARR", ndarr)
+    assert library._versions.find_one({"symbol": "MYARR"})["segment_count"] == 9
+    assert np.all(library.read("MYARR").data == ndarr)
+
+
+def test_write_looks_up_only_its_own_segments(library):
+    ndarr = np.random.randn(2 * 1024 * 1024)
+    library.write("MYARR", ndarr)
+    changed = ndarr.copy()
+    changed[0] = 0
+    collection = library._argus_lib.get_top_level_collection()
+    with patch.object(type(collection), "find", autospec=True, side_effect=type(collection).find) as find:
+        library.write("MYARR", changed, prune_previous_version=False)
+    segment_finds = [c[0][1] for c in find.call_args_list if c[0][0].name == collection.name]
+    assert segment_finds and {"symbol": "MYARR"} not in segment_finds
+    parents = [len(s["parent"]) for s in library._collection.find({"symbol": "MYARR"}, sort=[("segment", 1)])]
+    # Only the first segment changed, the others are shared with the first version
+    assert parents[:2] == [1, 1]
+    assert parents[2:] == [2] * 8
+    assert np.all(library.read("MYARR").data == changed)
+    assert np.all(library.read("MYARR", as_of=1).data == ndarr)
+
+
+@pytest.mark.parametrize("fw_pointers_cfg", [FwPointersCfg.DISABLED, FwPointersCfg.HYBRID, FwPointersCfg.ENABLED])
+def test_read_through_segment_cache(library, tmpdir, fw_pointers_cfg):
+    with FwPointersCtx(fw_pointers_cfg):
+        ndarr = np.random.randn(1024 * 1024)
+        library.write("MYARR", ndarr)
+        library.append("MYARR", ndarr[:10])
+        collection = library._argus_lib.get_top_level_collection()
+        try:
+            _segment_cache.set_segment_cache(str(tmpdir))
+            assert np.all(library.read("MYARR").data == np.concatenate([ndarr, ndarr[:10]]))
+
+            # Everything is cached now: only the segment layout is read from MongoDB
+            with patch.object(type(collection), "find", autospec=True, side_effect=type(collection).find) as find:
+                assert np.all(library.read("MYARR").data == np.concatenate([ndarr, ndarr[:10]]))
+            assert len([c for c in find.call_args_list if c[0][0].name == collection.name]) == 1
+
+            # Only the new segment is fetched
+            library.append("MYARR", ndarr[:20])
+            with patch.object(type(collection), "find", autospec=True, side_effect=type(collection).find) as find:
+                assert np.all(library.read("MYARR").data == np.concatenate([ndarr, ndarr[:10], ndarr[:20]]))
+            segment_finds = [c[0][1] for c in find.call_args_list if c[0][0].name == collection.name]
+            assert len(segment_finds[-1]["sha"]["$in"]) == 1
+        finally:
+            _segment_cache.set_segment_cache(_segment_cache.ARGUS_SEGMENT_CACHE_DIR)
+
+
+@pytest.mark.parametrize("fw_pointers_cfg", [FwPointersCfg.DISABLED, FwPointersCfg.HYBRID, FwPointersCfg.ENABLED])
+def test_read_sends_one_segment_query(library, fw_pointers_cfg):
+    with FwPointersCtx(fw_pointers_cfg):
+        with patch("argus.store._ndarray_store._CHUNK_SIZE", 1000):
+            ndarr = np.random.rand(1024)
+            library.write("MYARR", ndarr)
+            library.append("MYARR", ndarr[:10])
+            library.write("MATRIX", ndarr.reshape(-1, 4))
+        collection = library._argus_lib.get_top_level_collection()
+
+        def _segment_finds(symbol, **kwargs):
+            with patch.object(type(collection), "find", autospec=True, side_effect=type(collection).find) as find:
+                data = library.read(symbol, **kwargs).data
+            return data, len([c for c in find.call_args_list if c[0][0].name == collection.name])
+
+        data, finds = _segment_finds("MYARR")
+        assert finds == 1
+        assert np.all(data == np.concatenate([ndarr, ndarr[:10]]))
+        data, finds = _segment_finds("MYARR", from_version=1)
+        assert finds == 1
+        assert np.all(data == ndarr[:10])
+        data, finds = _segment_finds("MATRIX")
+        assert finds == 1
+        assert np.all(data == ndarr.reshape(-1, 4))
+
+
+@pytest.mark.parametrize("fw_pointers_cfg", [FwPointersCfg.DISABLED, FwPointersCfg.HYBRID, FwPointersCfg.ENABLED])
+def test_iterator(library, fw_pointers_cfg):
+    with FwPointersCtx(fw_pointers_cfg):
+        with patch("argus.store._ndarray_store._CHUNK_SIZE", 1000):
+            ndarr = np.random.rand(1024)
+            library.write("MYARR", ndarr)
+            library.append("MYARR", ndarr[:10])
+
+        # Segments hold 126 rows, but the last two (the rest of ndarr, and the appended rows)
+        batches = list(library.iterator("MYARR", rows_per_batch=300))
+        assert [len(b) for b in batches] == [378, 378, 268 + 10]
+        assert np.all(np.concatenate(batches) == np.concatenate([ndarr, ndarr[:10]]))
+
+        assert [len(b) for b in library.iterator("MYARR", rows_per_batch=1)] == [126] * 8 + [16, 10]
+        assert [len(b) for b in library.iterator("MYARR", rows_per_batch=10 ** 6)] == [1034]
+
+
 def test_mutable_ndarray(library):
     dtype = np.dtype([("abc", "int64")])
     ndarr = np.arange(32).view(dtype=dtype)
@@ -0,0 +1,113 @@
+from datetime import datetime as dt, timedelta as dtd
+
+import numpy as np
+import pandas as pd
+from mock import Mock, patch
+from pandas import DataFrame, Series, date_range
+from pandas.util.testing import assert_frame_equal, assert_series_equal
+
+from argus._compression import decompress
+from argus.date import DateRange
+
+
+def _frame(n=50000, start=dt(2001, 1, 1)):
+    return DataFrame(
+        index=date_range(start, freq="S", periods=n, name="date"),
+        data={
+            "i": np.arange(n),
+            "f": np.random.randn(n),
+            "f32": np.random.randn(n).astype(np.float32),
+            "b": np.arange(n) % 3 == 0,
+        },
+    )
+
+
+def test_columnar_write_read(columnar_library):
+    df = _frame()
+    columnar_library.write("MYARR", df)
+    assert columnar_library._versions.find_one({"symbol": "MYARR"})["type"] == "pandasdf_columnar"
+    assert columnar_library.get_info("MYARR")["handler"] == "PandasColumnarDataFrameStore"
+    assert_frame_equal(columnar_library.read("MYARR").data, df, check_freq=False)
+
+
+def test_columnar_segment_layout(columnar_library):
+    df = _frame()
+    columnar_library.write("MYARR", df)
+    segment = columnar_library._collection.find_one({"symbol": "MYARR"})
+    assert [c[:2] for c in segment["columns"]] == [
+        ["date", "datetime64[ns]"],
+        ["i", "int64"],
+        ["f", "float64"],
+        ["f32", "float32"],
+        ["b", "bool"],
+    ]
+    assert segment["columns"][0][2] == 0
+    assert segment["columns"][-1][3] == len(segment["data"])
+
+
+def test_columnar_read_columns_decompresses_only_needed_blocks(columnar_library):
+    df = _frame()
+    columnar_library.write("MYARR", df)
+    mdecompress_all = Mock(side_effect=decompress)
+    with patch("argus.store._ndarray_store.decompress", mdecompress_all):
+        columnar_library.read("MYARR")
+    mdecompress_cols = Mock(side_effect=decompress)
+    with patch("argus.store._ndarray_store.decompress", mdecompress_cols):
+        result = columnar_library.read("MYARR", columns=["f"]).data
+    assert_frame_equal(result, df[["f"]], check_freq=False)
+    # the index and one of the five blocks of each segment
+    assert len(mdecompress_cols.call_args_list) * 5 == len(mdecompress_all.call_args_list) * 2
+
+
+def test_columnar_read_columns_with_date_range(columnar_library):
+    df = _frame()
+    columnar_library.write("MYARR", df)
+    date_range = DateRange(dt(2001, 1, 1, 5), dt(2001, 1, 1, 6))
+    result = columnar_library.read("MYARR", columns=["i"], date_range=date_range).data
+    assert_frame_equal(result, df.loc[date_range.start: date_range.end, ["i"]], check_freq=False)
+
+
+def test_columnar_append(columnar_library):
+    df = _frame()
+    columnar_library.write("MYARR", df)
+    appends = [_frame(10, start=dt(2002, 1, 1) + dtd(days=i)) for i in range(70)]
+    for a in appends:
+        columnar_library.append("MYARR", a)
+    expected = pd.concat([df] + appends)
+    assert_frame_equal(columnar_library.read("MYARR").data, expected, check_freq=False)
+    assert_frame_equal(columnar_library.read("MYARR", columns=["f32"]).data, expected[["f32"]], check_freq=False)
+
+
+def test_columnar_reads_row_layout_segments(columnar_library):
+    df = _frame()
+    columnar_library._with_columnar = False
+    columnar_library.write("MYARR", df)
+    assert columnar_library._versions.find_one({"symbol": "MYARR"})["type"] == "pandasdf"
+    columnar_library._with_columnar = True
+    appended = _frame(10, start=dt(2002, 1, 1))
+    columnar_library.append("MYARR", appended)
+    columnar_library.write("OTHER", pd.concat([df, appended]))
+    assert_frame_equal(columnar_library.read("MYARR").data, pd.concat([df, appended]), check_freq=False)
+    assert_frame_equal(columnar_library.read("OTHER").data, pd.concat([df, appended]), check_freq=False)
+
+
+def test_columnar_series_not_affected(columnar_library):
+    s = Series(np.arange(10.0), index=date_range(dt(2001, 1, 1), periods=10, name="date"), name="x")
+    columnar_library.write("MYSERIES", s)
+    assert columnar_library._versions.find_one({"symbol": "MYSERIES"})["type"] == "pandasseries"
+    assert_series_equal(columnar_library.read("MYSERIES").data, s, check_freq=False)
+
+
+def test_library_without_columnar_segments(library):
+    library.write("MYARR", _frame(100))
+    assert library._versions.find_one({"symbol": "MYARR"})["type"] == "pandasdf"
+
+
+def test_columnar_with_codec(columnar_library):
+    df = _frame()
+    columnar_library._argus_lib.set_compression("lz4hc:9+shuffle")
+    columnar_library.write("MYARR", df)
+    segment = columnar_library._collection.find_one({"symbol": "MYARR"})
+    assert segment["codec"] == "lz4hc:9+shuffle"
+    assert_frame_equal(columnar_library.read("MYARR").data, df, check_freq=False)
+    assert_frame_equal(columnar_library.read("MYARR", columns=["f32", "b"]).data, df[["f32", "b"]], check_freq=False)
@@ -18,11 +18,15 @@ from pandas.tseries.offsets import DateOffset
 from pandas.util.testing import assert_frame_equal, assert_series_equal
 from six import StringIO
 
+from argus import _compression
 from argus._compression import decompress
+from argus._compression import zstandard
 from argus.date import DateRange, mktz
+from argus.exceptions import ArgusException
+from argus.serialization.incremental import IncrementalPandasToRecArraySerializer
 
 # Do not remove PandasStore, used in global scope
-from argus.store._pandas_ndarray_store import PandasDataFrameStore, PandasSeriesStore, PandasStore
+from argus.store._pandas_ndarray_store import PandasDataFrameStore, PandasSeriesStore, PandasStore, RANGES_DTYPE
 from argus.store.version_store import register_versioned_storage
 from tests.util import assert_frame_equal_
 
@@ -1370,3 +1374,226 @@ def test_forced_encodings_with_df_py3_multi_index(library):
     _assert_index_type(df_forced_unicode.index, unicode_type)
     _assert_index_type(s_str_forced.index, unicode_type)
     _assert_index_type(s_unicode_forced.index, unicode_type)
+
+
+def test_read_columns(library):
+    df = DataFrame(
+        index=date_range(dt(2001, 1, 1), freq="H", periods=1000, name="date"),
+        data={"a": np.arange(1000), "b": np.arange(1000) * 0.5, "c": np.arange(1000) * 2.0},
+    )
+    library.write("MYARR", df)
+    assert_frame_equal(library.read("MYARR", columns=["c", "a"]).data, df[["c", "a"]], check_freq=False)
+    assert_frame_equal(library.read("MYARR", columns=[]).data, df[[]], check_freq=False)
+
+
+def test_read_columns_with_date_range(library):
+    df = DataFrame(
+        index=date_range(dt(2001, 1, 1), freq="H", periods=1000, name="date"),
+        data={"a": np.arange(1000), "b": np.arange(1000) * 0.5},
+    )
+    library.write("MYARR", df)
+    result = library.read("MYARR", columns=["b"], date_range=DateRange(dt(2001, 1, 2), dt(2001, 1, 3))).data
+    assert_frame_equal(result, df.loc[dt(2001, 1, 2): dt(2001, 1, 3), ["b"]], check_freq=False)
+
+
+def test_read_columns_multi_columns_dataframe(library):
+    columns = pd.MultiIndex.from_product([["bar", "baz"], ["one", "two"]], names=["first", "second"])
+    df = pd.DataFrame(np.random.randn(2, 4), index=pd.Index([0, 1], name="index"), columns=columns)
+    library.write("test", df)
+    saved = library.read("test", columns=[("baz", "one"), ("bar", "two")]).data
+    assert_frame_equal(saved, df[[("baz", "one"), ("bar", "two")]])
+
+
+def test_read_columns_unknown_column(library):
+    df = DataFrame(data={"a": np.arange(10)}, index=date_range(dt(2001, 1, 1), freq="H", periods=10))
+    library.write("MYARR", df)
+    with pytest.raises(ArgusException):
+        library.read("MYARR", columns=["a", "z"])
+
+
+CODECS = ["lz4hc:9+shuffle", "lz4+shuffle"] + (["zstd:9+shuffle", "zstd:1"] if zstandard else [])
+
+
+@pytest.mark.parametrize("codec", CODECS)
+def test_write_read_with_codec(library, codec):
+    df = DataFrame(
+        index=date_range(dt(2001, 1, 1), freq="S", periods=200000, name="date"),
+        data={"i": np.arange(200000), "f": np.random.randn(200000), "b": np.arange(200000) % 3 == 0},
+    )
+    library._argus_lib.set_compression(codec)
+    library.write("MYARR", df)
+    segments = list(library._collection.find({"symbol": "MYARR"}))
+    assert len(segments) > 1
+    assert all(s["codec"] == codec for s in segments)
+    assert_frame_equal(library.read("MYARR").data, df, check_freq=False)
+    date_range_ = DateRange(dt(2001, 1, 1, 10), dt(2001, 1, 2, 5))
+    assert_frame_equal(
+        library.read("MYARR", date_range=date_range_).data, df[dt(2001, 1, 1, 10): dt(2001, 1, 2, 5)], check_freq=False
+    )
+
+
+def test_write_read_with_process_backend(library):
+    df = DataFrame(
+        index=date_range(dt(2001, 1, 1), freq="S", periods=300000, name="date"),
+        data={"i": np.arange(300000), "f": np.random.randn(300000)},
+    )
+    pool_size = _compression.ARGUS_COMPRESSION_PROCESSES
+    _compression.set_compression_backend("process", 2)
+    try:
+        library.write("MYARR", df)
+    finally:
+        _compression.set_compression_backend("thread", pool_size)
+    assert_frame_equal(library.read("MYARR").data, df, check_freq=False)
+    # The checksums match the thread backend's, so the segments are reused by the next version
+    library.write("MYARR", df, prune_previous_version=False)
+    segments = list(library._collection.find({"symbol": "MYARR"}))
+    assert len(segments) > 1
+    assert all(len(s["parent"]) == 2 for s in segments)
+
+
+def test_incremental_write_and_append(library):
+    df = DataFrame(
+        index=date_range(dt(2001, 1, 1), freq="S", periods=300000, name="date"),
+        data={"i": np.arange(300000), "f": np.random.randn(300000)},
+    )
+    with patch("argus.store._pandas_ndarray_store.ARGUS_STREAMING_WRITE_MIN_SIZE", 1), patch(
+        "argus.store._pandas_ndarray_store.IncrementalPandasToRecArraySerializer",
+        wraps=IncrementalPandasToRecArraySerializer,
+    ) as serializer:
+        library.write("MYARR", df[:200000])
+        library.append("MYARR", df[200000:])
+    assert serializer.call_count == 2
+    assert_frame_equal(library.read("MYARR").data, df, check_freq=False)
+    date_range_ = DateRange(dt(2001, 1, 1, 10), dt(2001, 1, 3, 5))
+    assert_frame_equal(
+        library.read("MYARR", date_range=date_range_).data, df[dt(2001, 1, 1, 10): dt(2001, 1, 3, 5)], check_freq=False
+    )
+    assert_frame_equal(library.read("MYARR", columns=["f"]).data, df[["f"]], check_freq=False)
+
+
+def test_codec_change_between_versions(library):
+    df = DataFrame(
+        index=date_range(dt(2001, 1, 1), freq="S", periods=100000, name="date"),
+        data={"f": np.random.randn(100000), "i": np.arange(100000)},
+    )
+    appended = DataFrame(
+        index=date_range(dt(2002, 1, 1), freq="S", periods=100, name="date"),
+        data={"f": np.random.randn(100), "i": np.arange(100)},
+    )
+    library.write("MYARR", df)
+    library._argus_lib.set_compression("lz4hc+shuffle")
+    library.append("MYARR", appended)
+    # Same leading rows: the tail from the last compressed segment is rewritten with the new codec
+    library.write("MYARR", concat([df, appended, appended]))
+    library._argus_lib.set_compression(None)
+    library.append("MYARR", appended)
+    assert_frame_equal(library.read("MYARR").data, concat([df] + [appended] * 3), check_freq=False)
+    assert_frame_equal(library.read("MYARR", as_of=2).data, concat([df, appended]), check_freq=False)
+    assert_frame_equal(library.read("MYARR", as_of=1).data, df, check_freq=False)
+    codecs = [s.get("codec") for s in library._collection.find({"symbol": "MYARR", "compressed": True})]
+    assert "lz4hc+shuffle" in codecs
+
+
+def test_adaptive_compression(library):
+    df = DataFrame(
+        index=date_range(dt(2001, 1, 1), freq="S", periods=100000, name="date"),
+        data={"i": np.arange(100000), "f": np.round(np.random.randn(100000), 2)},
+    )
+    appended = DataFrame(
+        index=date_range(dt(2002, 1, 1), freq="S", periods=100, name="date"),
+        data={"i": np.arange(100), "f": np.random.randn(100)},
+    )
+    library._argus_lib.set_compression("auto:0")
+    library.write("MYARR", df)
+    info = library.get_info("MYARR")["compression"]
+    assert info["adaptive"] == "auto:0"
+    assert info["ratio"] > 1
+    assert set(s["codec"] for s in library._collection.find({"symbol": "MYARR"})) == {info["codec"]}
+
+    with patch("argus.store._ndarray_store.select_codec") as select_codec:
+        library.append("MYARR", appended)
+        library.write("MYARR", concat([df, appended, appended]))
+    assert select_codec.call_count == 0
+    assert library.get_info("MYARR")["compression"] == info
+    assert_frame_equal(library.read("MYARR").data, concat([df, appended, appended]), check_freq=False)
+
+    # A different target is probed again
+    library._argus_lib.set_compression("auto:1000000")
+    library.append("MYARR", appended)
+    assert library.get_info("MYARR")["compression"]["adaptive"] == "auto:1000000"
+
+
+def test_iterator(library):
+    df = DataFrame(
+        index=date_range(dt(2001, 1, 1), freq="H", periods=5000, name="date"),
+        data={"i": np.arange(5000), "f": np.random.randn(5000)},
+    )
+    with patch("argus.store._ndarray_store._CHUNK_SIZE", 10000):
+        library.write("MYARR", df)
+    # 417 rows per segment
+    assert library.get_info("MYARR")["segment_count"] == 12
+
+    batches = list(library.iterator("MYARR", rows_per_batch=1000))
+    assert [len(b) for b in batches] == [1251, 1251, 1251, 1247]
+    assert_frame_equal(concat(batches), df, check_freq=False)
+    assert_frame_equal(concat(library.iterator("MYARR", columns=["f"])), df[["f"]], check_freq=False)
+    assert_series_equal(
+        concat(library.iterator("MYARR", rows_per_batch=1000, columns=["i"]))["i"], df["i"], check_freq=False
+    )
+
+    # Reading starts from the segment holding the start of the date range
+    date_range_ = DateRange(df.index[4500], df.index[4800])
+    with patch.object(PandasStore, "_do_read", autospec=True, side_effect=PandasStore._do_read) as do_read:
+        batches = list(library.iterator("MYARR", rows_per_batch=1, date_range=date_range_))
+    assert_frame_equal(concat(batches), df.iloc[4500:4801], check_freq=False)
+    assert [c[1]["index_range"] for c in do_read.call_args_list] == [(4586, 4587), (4999, 5000)]
+    assert len(batches) == 2
+
+    assert list(library.iterator("MYARR", date_range=DateRange(dt(2010, 1, 1)))) == []
+
+    library.write("MYSERIES", df["f"])
+    assert_series_equal(concat(library.iterator("MYSERIES", rows_per_batch=1000)), df["f"], check_freq=False)
+
+
+def test_daterange_segment_ranges(library):
+    df = DataFrame(
+        index=date_range(dt(2001, 1, 1), freq="H", periods=5000, name="date"),
+        data={"i": np.arange(5000), "f": np.random.randn(5000)},
+    )
+    with patch("argus.store._ndarray_store._CHUNK_SIZE", 10000):
+        library.write("MYARR", df.iloc[:4000])
+    # An uncompressed appended segment, out of order
+    library.append("MYARR", df.iloc[4500:])
+    library.append("MYARR", df.iloc[4000:4500])
+    stored = concat([df.iloc[:4000], df.iloc[4500:], df.iloc[4000:4500]])
+    version = library._versions.find_one({"symbol": "MYARR", "version": 3})
+    ranges = np.frombuffer(decompress(version["segment_ranges"]), dtype=RANGES_DTYPE)
+    assert len(ranges) == version["segment_count"] == 12
+    assert ranges["min"][-1] == df.index[4000] and ranges["max"][-1] == df.index[4499]
+
+    with patch.object(PandasStore, "_do_read", autospec=True, side_effect=PandasStore._do_read) as do_read:
+        read = library.read("MYARR", date_range=DateRange(df.index[4400], df.index[4600])).data
+    assert do_read.call_args_list[0][1]["index_range"] == (4499, 5000)
+    assert_frame_equal(read, stored[(stored.index >= df.index[4400]) & (stored.index <= df.index[4600])])
+    assert_frame_equal(read.sort_index(), df.iloc[4400:4601], check_freq=False)
+
+    with patch.object(PandasStore, "_do_read", autospec=True, side_effect=PandasStore._do_read) as do_read:
+        read = library.read("MYARR", date_range=DateRange(df.index[100], df.index[200])).data
+    assert do_read.call_args_list[0][1]["index_range"] == (416, 417)
+    assert_frame_equal(read, df.iloc[100:201], check_freq=False)
+
+
+def test_daterange_append_to_empty(library):
+    df = DataFrame(
+        index=date_range(dt(2001, 1, 1), freq="H", periods=100, name="date"), data={"f": np.random.randn(100)}
+    )
+    library.write("MYARR", df.iloc[:0])
+    library.append("MYARR", df.iloc[:50])
+    library.append("MYARR", df.iloc[50:])
+    version = library._versions.find_one({"symbol": "MYARR", "version": 3})
+    assert "segment_index" in version and "segment_ranges" in version
+
+    with patch.object(PandasStore, "_do_read", autospec=True, side_effect=PandasStore._do_read) as do_read:
+        read = library.read("MYARR", date_range=DateRange(df.index[60], df.index[70])).data
+    assert do_read.call_args_list[0][1]["index_range"] == (99, 100)
+    assert_frame_equal(read, df.iloc[60:71], check_freq=False)
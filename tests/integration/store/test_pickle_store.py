@@ -121,3 +121,22 @@ def test_write_metadata(library):
     v = library.read("symX")
     assert v.data == blob
     assert v.metadata == {"key2": "value2"}
+
+
+def test_pickle_with_codec(library):
+    blob = {"foo": dt(2015, 1, 1), "object": Argus, "large_thing": np.random.rand(int(2.1 * 1024 * 1024)).tostring()}
+    library._argus_lib.set_compression("lz4hc:9")
+    library.write("BLOB", blob)
+    assert set(s["codec"] for s in library._collection.find({"symbol": "BLOB"})) == {"lz4hc:9"}
+    library._argus_lib.set_compression(None)
+    assert library.read("BLOB").data == blob
+
+
+def test_pickle_with_adaptive_compression(library):
+    blob = {"foo": dt(2015, 1, 1), "object": Argus, "large_thing": np.random.rand(int(2.1 * 1024 * 1024)).tostring()}
+    library._argus_lib.set_compression("auto")
+    library.write("BLOB", blob)
+    info = library.get_info("BLOB")["compression"]
+    assert info["adaptive"] == "auto"
+    assert set(s["codec"] for s in library._collection.find({"symbol": "BLOB"})) == {info["codec"]}
+    assert library.read("BLOB").data == blob
@@ -9,7 +9,7 @@ import pandas as pd
 import pymongo
 import pytest
 import six
-from mock import Mock, patch
+from mock import Mock, patch, sentinel
 from pandas.util.testing import assert_frame_equal, assert_series_equal
 from pymongo.errors import OperationFailure
 from pymongo.server_type import SERVER_TYPE
@@ -20,8 +20,13 @@ from argus._config import FwPointersCfg, FW_POINTERS_REFS_KEY
 from argus._util import mongo_count, get_fwptr_config
 from argus.date import DateRange
 from argus.date._mktz import mktz
-from argus.exceptions import NoDataFoundException, DuplicateSnapshotException, ArgusException
-from argus.store import _version_store_utils, version_store
+from argus.exceptions import (
+    NoDataFoundException,
+    DuplicateSnapshotException,
+    ArgusException,
+    FullReadRequiredException,
+)
+from argus.store import _pruner, _version_store_utils, version_store
 from tests.unit.serialization.serialization_test_data import _mixed_test_data
 from tests.util import assert_frame_equal_
 from ..test_utils import enable_profiling_for_library
@@ -232,6 +237,303 @@ def test_read_metadata_throws_on_deleted_symbol(library, fw_pointers_cfg):
             library.read_metadata(symbol)
 
 
+@pytest.mark.parametrize("fw_pointers_cfg", [FwPointersCfg.DISABLED, FwPointersCfg.HYBRID, FwPointersCfg.ENABLED])
+def test_batch_read(library, fw_pointers_cfg):
+    with FwPointersCtx(fw_pointers_cfg):
+        library.write("ts1", ts1, metadata={"key": "value"})
+        library.write("ts1", ts2)
+        library.write("ts2", ts2)
+        library.write("arr", np.arange(100000, dtype="float64"))
+        library.write("obj", {"a": [1, 2, 3]})
+        library.write("deleted", ts1)
+        library.delete("deleted")
+
+        symbols = ["ts1", "ts2", "arr", "obj", "deleted", "missing"]
+        result = library.batch_read(symbols)
+
+        assert list(result) == symbols
+        for sym in ["ts1", "ts2", "arr", "obj"]:
+            expected = library.read(sym)
+            assert result[sym].version == expected.version
+            assert result[sym].metadata == expected.metadata
+        assert_frame_equal(result["ts1"].data, ts2)
+        assert_frame_equal(result["ts2"].data, ts2)
+        assert np.array_equal(result["arr"].data, np.arange(100000, dtype="float64"))
+        assert result["obj"].data == {"a": [1, 2, 3]}
+        assert isinstance(result["deleted"], NoDataFoundException)
+        assert isinstance(result["missing"], NoDataFoundException)
+
+
+@pytest.mark.parametrize("fw_pointers_cfg", [FwPointersCfg.DISABLED, FwPointersCfg.HYBRID, FwPointersCfg.ENABLED])
+def test_batch_read_as_of(library, fw_pointers_cfg):
+    with FwPointersCtx(fw_pointers_cfg):
+        library.write("ts1", ts1, metadata={"key": "value"})
+        library.write("ts2", ts1)
+        library.snapshot("snap")
+        library.write("ts1", ts2)
+        library.write("ts2", ts2)
+
+        for as_of in [1, "snap", dt.now() + dtd(seconds=10)]:
+            expected = ts1 if as_of in (1, "snap") else ts2
+            result = library.batch_read(["ts1", "ts2"], as_of=as_of)
+            assert_frame_equal(result["ts1"].data, expected)
+            assert_frame_equal(result["ts2"].data, expected)
+        assert result["ts1"].version == 2
+        assert isinstance(library.batch_read(["ts1"], as_of="no_such_snap")["ts1"], NoDataFoundException)
+
+
+def test_batch_read_date_range_and_columns(library):
+    df = pd.DataFrame(
+        {"a": np.arange(1000.0), "b": np.arange(1000)}, index=pd.date_range("2020-01-01", periods=1000, freq="H")
+    )
+    library.write("df1", df)
+    library.write("df2", df * 2)
+    date_range = DateRange(dt(2020, 1, 10), dt(2020, 1, 20))
+
+    result = library.batch_read(["df1", "df2"], date_range=date_range, columns=["a"])
+
+    for sym in ["df1", "df2"]:
+        assert_frame_equal(result[sym].data, library.read(sym, date_range=date_range, columns=["a"]).data)
+
+
+def test_batch_read_deserializes_each_group_before_fetching_the_next(library):
+    for sym in ["ts1", "ts2", "ts3"]:
+        library.write(sym, ts1)
+    fetched, fetched_before_read = [], {}
+    spec = argus.store._ndarray_store._spec_fw_pointers_aware
+    do_read = argus.store._ndarray_store.NdarrayStore._do_read
+
+    def _spec(symbol, *args, **kwargs):
+        fetched.append(symbol)
+        return spec(symbol, *args, **kwargs)
+
+    def _do_read(self, collection, version, symbol, **kwargs):
+        fetched_before_read.setdefault(symbol, set(fetched))
+        return do_read(self, collection, version, symbol, **kwargs)
+
+    with patch.object(argus.store._ndarray_store, "ARGUS_BATCH_READ_SYMBOLS", 2), patch.object(
+        argus.store._ndarray_store, "_spec_fw_pointers_aware", _spec
+    ), patch.object(argus.store._ndarray_store.NdarrayStore, "_do_read", _do_read):
+        result = library.batch_read(["ts1", "ts2", "ts3"])
+
+    assert fetched_before_read == {"ts1": {"ts1", "ts2"}, "ts2": {"ts1", "ts2"}, "ts3": {"ts1", "ts2", "ts3"}}
+    for sym in ["ts1", "ts2", "ts3"]:
+        assert_frame_equal(result[sym].data, ts1)
+
+
+def test_batch_read_collects_segment_errors(library):
+    library.write("ts1", ts1)
+    library.write("ts2", ts2)
+    with patch.object(
+        version_store.VersionStore, "_do_read_retry", side_effect=OperationFailure("still failing")
+    ), patch.object(
+        argus.store._ndarray_store.NdarrayStore, "_do_read", side_effect=OperationFailure("failed")
+    ):
+        result = library.batch_read(["ts1", "ts2"])
+    assert isinstance(result["ts1"], OperationFailure)
+    assert isinstance(result["ts2"], OperationFailure)
+    assert_frame_equal(library.batch_read(["ts1", "ts2"])["ts2"].data, ts2)
+
+
+@pytest.mark.parametrize("fw_pointers_cfg", [FwPointersCfg.DISABLED, FwPointersCfg.HYBRID, FwPointersCfg.ENABLED])
+def test_batch_write(library, fw_pointers_cfg):
+    with FwPointersCtx(fw_pointers_cfg):
+        library.write("ts1", ts1)
+        items = {"ts1": ts2, "ts2": ts1, "arr": np.arange(100000, dtype="float64"), "obj": {"a": [1, 2, 3]}}
+
+        result = library.batch_write(items, metadata={"ts2": {"key": "value"}})
+
+        assert list(result) == list(items)
+        assert [result[sym].version for sym in items] == [2, 1, 1, 1]
+        assert_frame_equal(library.read("ts1").data, ts2)
+        assert_frame_equal(library.read("ts1", as_of=1).data, ts1)
+        assert_frame_equal(library.read("ts2").data, ts1)
+        assert library.read("ts2").metadata == {"key": "value"}
+        assert np.array_equal(library.read("arr").data, items["arr"])
+        assert library.read("obj").data == {"a": [1, 2, 3]}
+        assert library._fsck(dry_run=True) is None
+
+
+@pytest.mark.parametrize("fw_pointers_cfg", [FwPointersCfg.DISABLED, FwPointersCfg.HYBRID, FwPointersCfg.ENABLED])
+def test_batch_append(library, fw_pointers_cfg):
+    with FwPointersCtx(fw_pointers_cfg):
+        library.write("ts1", ts1, metadata={"key": "value"})
+        library.write("ts2", ts1)
+        library.write("arr", np.arange(10, dtype="float64"))
+        append = read_str_as_pandas(
+            """  times | near
+                         2012-11-09 17:06:11.040 |  3.0"""
+        )
+
+        result = library.batch_append(
+            {"ts1": append, "ts2": append[:0], "arr": np.arange(10, 20, dtype="float64"), "new": ts2}
+        )
+
+        assert [result[sym].version for sym in ["ts1", "ts2", "arr", "new"]] == [2, 1, 2, 1]
+        assert_frame_equal(library.read("ts1").data, ts1_append)
+        assert library.read("ts1").metadata == {"key": "value"}
+        assert_frame_equal(library.read("ts2").data, ts1)
+        assert np.array_equal(library.read("arr").data, np.arange(20, dtype="float64"))
+        assert_frame_equal(library.read("new").data, ts2)
+        assert isinstance(library.batch_append({"missing": ts1}, upsert=False)["missing"], NoDataFoundException)
+
+
+def test_batch_append_passes_kwargs_to_upserts(library):
+    with patch.object(version_store.VersionStore, "batch_write", return_value={"new": sentinel.written}) as batch_write:
+        result = library.batch_append({"new": ts2}, keep_mins=10)
+    assert result == {"new": sentinel.written}
+    batch_write.assert_called_once_with({"new": ts2}, metadata={}, prune_previous_version=True, keep_mins=10)
+
+
+def test_batch_write_prunes_previous_versions(library):
+    now = dt.utcnow().replace(tzinfo=mktz("UTC"))
+    for x in range(3):
+        for i, sym in enumerate(["ts1", "ts2", "ts3"]):
+            with patch("bson.ObjectId", return_value=bson.ObjectId.from_datetime(now - dtd(minutes=130 - x, seconds=i))):
+                library.write(sym, ts1, prune_previous_version=False)
+
+    library.write("ts3", ts2)
+    library.batch_write({"ts1": ts2, "ts2": ts2})
+
+    for sym in ["ts1", "ts2"]:
+        assert [v["version"] for v in library.list_versions(sym)] == [
+            v["version"] for v in library.list_versions("ts3")
+        ]
+    assert library._fsck(dry_run=True) is None
+
+
+def _write_old_versions(library, symbols, count=3):
+    now = dt.utcnow().replace(tzinfo=mktz("UTC"))
+    for x in range(count):
+        for i, sym in enumerate(symbols):
+            with patch("bson.ObjectId", return_value=bson.ObjectId.from_datetime(now - dtd(minutes=130 - x, seconds=i))):
+                library.write(sym, ts1, prune_previous_version=False)
+
+
+@pytest.mark.parametrize("keep_mins", [120, 0])
+def test_async_prune(library, keep_mins):
+    _write_old_versions(library, ["ts1", "ts2", "ts3", "ts4"])
+    prunable_versions_spec = version_store._prunable_versions_spec
+    with patch.object(
+        version_store, "_prunable_versions_spec", lambda symbol, _: prunable_versions_spec(symbol, keep_mins)
+    ):
+        library.write("ts4", ts2)
+
+        _pruner.set_async_prune(True)
+        try:
+            library.write("ts1", ts2)
+            library.append("ts2", ts2)
+            library.batch_write({"ts3": ts2})
+            assert _pruner.get_pruner().flush(60)
+        finally:
+            _pruner.set_async_prune(False)
+
+    for sym in ["ts1", "ts2", "ts3"]:
+        assert [v["version"] for v in library.list_versions(sym)] == [
+            v["version"] for v in library.list_versions("ts4")
+        ]
+    assert len(library.list_versions("ts4")) == 2
+    assert_frame_equal(library.read("ts1").data, ts2)
+    assert library._fsck(dry_run=True) is None
+
+
+def test_prune_all(library):
+    symbols = ["ts1", "ts2", "ts3", "ts4", "ts5"]
+    _write_old_versions(library, symbols)
+    library.snapshot("snap")
+    library.write("ts1", ts2, prune_previous_version=False)
+
+    with patch.object(version_store, "ARGUS_PRUNE_BATCH_SYMBOLS", 2):
+        library.prune_all(keep_mins=120, workers=2)
+
+    assert [v["version"] for v in library.list_versions("ts1")] == [4, 3, 2]
+    for sym in symbols[1:]:
+        assert [v["version"] for v in library.list_versions(sym)] == [3, 2]
+    library.delete_snapshot("snap")
+
+    library.prune_all(keep_mins=120, symbols=["ts1", "ts2"])
+    assert [v["version"] for v in library.list_versions("ts1")] == [4, 3]
+    assert_frame_equal(library.read("ts1").data, ts2)
+    assert library._fsck(dry_run=True) is None
+
+
+def test_batch_write_collects_errors(library):
+    library.write("ts1", ts1)
+    real_write = PandasDataFrameStore.write
+
+    def _write(self, argus_lib, version, symbol, item, previous_version, **kwargs):
+        if symbol == "bad":
+            raise ValueError("can't write")
+        return real_write(self, argus_lib, version, symbol, item, previous_version, **kwargs)
+
+    with patch.object(PandasDataFrameStore, "write", _write):
+        result = library.batch_write({"ts1": ts2, "bad": ts2, "ts2": ts2})
+
+    assert isinstance(result["bad"], ValueError)
+    assert result["ts1"].version == 2
+    assert_frame_equal(library.read("ts2").data, ts2)
+    assert not library.has_symbol("bad")
+
+
+def test_batch_write_doesnt_insert_versions_with_missing_segments(library):
+    library.write("ts1", ts1)
+    real_check = argus.store._ndarray_store._check_written_batch
+
+    def _check_written_batch(checks):
+        failed = real_check(checks)
+        failed["ts1"] = OperationFailure("Failed to write all the chunks")
+        return failed
+
+    with patch("argus.store._ndarray_store._check_written_batch", _check_written_batch), patch.object(
+        version_store.VersionStore, "write", side_effect=OperationFailure("retry failed too")
+    ):
+        result = library.batch_write({"ts1": ts2, "ts2": ts2})
+
+    assert isinstance(result["ts1"], OperationFailure)
+    assert library.read("ts1").version == 1
+    assert_frame_equal(library.read("ts2").data, ts2)
+
+
+def _version_finds(library):
+    collection = type(library._versions)
+    return patch.object(collection, "find_one", autospec=True, side_effect=collection.find_one)
+
+
+def test_read_uses_version_cache(library):
+    library.write(symbol, ts1)
+    library._version_cache = _version_store_utils.VersionCache(10, 60)
+    library.read(symbol)
+
+    with _version_finds(library) as find_one:
+        assert_frame_equal(library.read(symbol).data, ts1)
+        assert library.read_metadata(symbol).version == 1
+    assert not [c for c in find_one.call_args_list if c[0][0].name == library._versions.name]
+
+    # Local writes invalidate the cache
+    library.write(symbol, ts2)
+    assert_frame_equal(library.read(symbol).data, ts2)
+    assert_frame_equal(library.read(symbol, as_of=1).data, ts1)
+    library.delete(symbol)
+    with pytest.raises(NoDataFoundException):
+        library.read(symbol)
+
+
+def test_version_cache_checks_stale_versions(library):
+    library.write(symbol, ts1)
+    library._version_cache = _version_store_utils.VersionCache(10, 0)
+    library.read(symbol)
+
+    # Checked with a covered query
+    with _version_finds(library) as find_one:
+        assert_frame_equal(library.read(symbol).data, ts1)
+    finds = [c for c in find_one.call_args_list if c[0][0].name == library._versions.name]
+    assert [c[1].get("projection") for c in finds] == [{"version": 1, "_id": 0}]
+
+    # Written by someone else
+    version_store.VersionStore(library._argus_lib).write(symbol, ts2)
+    assert_frame_equal(library.read(symbol).data, ts2)
+
+
 @pytest.mark.parametrize("fw_pointers_cfg", [FwPointersCfg.DISABLED, FwPointersCfg.HYBRID, FwPointersCfg.ENABLED])
 def test_store_item_and_update(library, fw_pointers_cfg):
     with FwPointersCtx(fw_pointers_cfg):
@@ -343,6 +645,57 @@ def test_append(library, fw_pointers_cfg):
         assert len(library.read(symbol).data) == len(ts1) + len(ts1_append)
 
 
+@pytest.mark.parametrize("fw_pointers_cfg", [FwPointersCfg.DISABLED, FwPointersCfg.HYBRID, FwPointersCfg.ENABLED])
+def test_read_from_version(library, fw_pointers_cfg):
+    with FwPointersCtx(fw_pointers_cfg):
+        library.write(symbol, ts1[:2])
+        first = library.append(symbol, ts1[2:3])
+        library.append(symbol, ts1[3:])
+        library.write_metadata(symbol, {"key": "value"})
+
+        assert_frame_equal(library.read(symbol, from_version=1).data, ts1[2:])
+        assert_frame_equal(library.read(symbol, from_version=first).data, ts1[3:])
+        assert_frame_equal(library.read(symbol, as_of=3, from_version=2).data, ts1[3:])
+        assert len(library.read(symbol, from_version=4).data) == 0
+
+        arr = np.arange(1000, dtype="float64")
+        library.write("arr", arr[:700])
+        library.append("arr", arr[700:])
+        assert np.array_equal(library.read("arr", from_version=1).data, arr[700:])
+
+
+def test_read_from_version_with_date_range_and_iterator(library):
+    df = pd.DataFrame({"a": np.arange(1000.0)}, index=pd.date_range("2020-01-01", periods=1000, freq="H"))
+    library.write(symbol, df[:500])
+    library.append(symbol, df[500:])
+    df = library.read(symbol).data
+    date_range = DateRange(df.index[400], df.index[599])
+
+    assert_frame_equal(library.read(symbol, from_version=1, date_range=date_range).data, df[500:600])
+    assert len(library.read(symbol, from_version=2, date_range=date_range).data) == 0
+    assert_frame_equal(pd.concat(library.iterator(symbol, from_version=1, rows_per_batch=100)), df[500:])
+    assert_frame_equal(
+        pd.concat(library.iterator(symbol, from_version=library.read(symbol, as_of=1), date_range=date_range)),
+        df[500:600],
+    )
+
+
+@pytest.mark.parametrize("fw_pointers_cfg", [FwPointersCfg.DISABLED, FwPointersCfg.HYBRID, FwPointersCfg.ENABLED])
+def test_read_from_version_needs_full_read(library, fw_pointers_cfg):
+    with FwPointersCtx(fw_pointers_cfg):
+        library.write(symbol, ts1)
+        library.write(symbol, ts2, prune_previous_version=False)
+        with pytest.raises(FullReadRequiredException):
+            library.read(symbol, from_version=1)
+        with pytest.raises(FullReadRequiredException):
+            library.read(symbol, from_version=10)
+
+        library.write("obj", {"a": 1})
+        library.write("obj", {"a": 2}, prune_previous_version=False)
+        with pytest.raises(FullReadRequiredException):
+            library.read("obj", from_version=1)
+
+
 @pytest.mark.parametrize("fw_pointers_cfg", [FwPointersCfg.DISABLED, FwPointersCfg.HYBRID, FwPointersCfg.ENABLED])
 def test_append_should_overwrite_after_delete(library, fw_pointers_cfg):
     with FwPointersCtx(fw_pointers_cfg):
@@ -1163,6 +1516,64 @@ def test_list_symbols_delete_write(library, fw_pointers_cfg):
         assert library.list_symbols() == [symbol]
 
 
+def test_iterator_reads_pickled_data_in_one_batch(library):
+    library.write("pickled", {"foo": "bar"})
+    assert list(library.iterator("pickled", rows_per_batch=1)) == [{"foo": "bar"}]
+    with pytest.raises(NoDataFoundException):
+        library.iterator("missing")
+
+
+def test_symbols_collection_tracks_writes_and_deletes(library):
+    library.write("asdf", {"foo": "bar"})
+    library.write("furble", {"foo": "bar"})
+    library.snapshot("s1")
+    library.write("furble", {"foo": "baz"})
+    library.delete("furble")
+    library.batch_write({"qwer": {"foo": "bar"}, "zxcv": {"foo": "bar"}})
+    library.delete("zxcv")
+
+    assert sorted((x["symbol"], x["version"], x["deleted"]) for x in library._symbols.find()) == [
+        ("asdf", 1, False),
+        ("furble", 3, True),
+        ("qwer", 1, False),
+    ]
+    assert library.list_symbols() == ["asdf", "qwer"]
+    assert library.list_symbols(regex="^[aq]s") == ["asdf"]
+    assert library.has_symbol("asdf")
+    assert not library.has_symbol("furble")
+    assert library.has_symbol("furble", as_of="s1")
+    assert not library.has_symbol("zxcv")
+    # The same as grouping the versions by symbol
+    library._with_symbols = False
+    assert library.list_symbols() == ["asdf", "qwer"]
+
+
+def test_list_symbols_without_symbols_collection(library):
+    library.write("asdf", {"foo": "bar"})
+    library.write("furble", {"foo": "bar"})
+    library.snapshot("s1")
+    library.delete("furble")
+    # A library created before the symbols collection
+    library._symbols.drop()
+    library._argus_lib.set_library_metadata("SYMBOLS_COLLECTION", None)
+    library._with_symbols = None
+    library._symbols.insert_one({"symbol": "stale", "version": 1, "deleted": False})
+
+    with patch.object(type(library._symbols), "find", autospec=True, side_effect=type(library._symbols).find) as find:
+        assert library.list_symbols() == ["asdf"]
+        assert library.has_symbol("asdf")
+        assert not library.has_symbol("furble")
+    assert not [c for c in find.call_args_list if c[0][0].name == "symbols"]
+
+    library._backfill_symbols()
+    assert library._argus_lib.get_library_metadata("SYMBOLS_COLLECTION") is True
+    assert sorted((x["symbol"], x["version"], x["deleted"]) for x in library._symbols.find()) == [
+        ("asdf", 1, False),
+        ("furble", 2, True),
+    ]
+    assert library.list_symbols() == ["asdf"]
+
+
 @pytest.mark.parametrize("fw_pointers_cfg", [FwPointersCfg.DISABLED, FwPointersCfg.HYBRID, FwPointersCfg.ENABLED])
 def test_date_range_large(library, fw_pointers_cfg):
     with FwPointersCtx(fw_pointers_cfg):
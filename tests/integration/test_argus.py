@@ -150,6 +150,23 @@ def test_indexes(argus):
             "v": index_version,
         },
     }
+    symbols = c.argus.library.symbols.index_information()
+    assert symbols == {
+        "_id_": {"key": [("_id", 1)], "ns": "argus.library.symbols", "v": index_version},
+        "symbol_1": {
+            "background": True,
+            "key": [("symbol", 1)],
+            "ns": "argus.library.symbols",
+            "unique": True,
+            "v": index_version,
+        },
+        "symbols_idx": {
+            "background": True,
+            "key": [("deleted", 1), ("symbol", 1)],
+            "ns": "argus.library.symbols",
+            "v": index_version,
+        },
+    }
 
 
 def test_delete_library(argus, library, library_name):
@@ -361,3 +378,15 @@ def test_disable_cache_by_settings(argus):
             argus.list_libraries()
             uncached_list_libraries_e.assert_not_called()
             cached_list_libraries_e.assert_called()
+
+
+def test_compression(library):
+    assert library._argus_lib.get_compression() is None
+    library._argus_lib.set_compression("lz4hc:9+shuffle")
+    assert library._argus_lib.get_compression() == "lz4hc:9+shuffle"
+    assert library._argus_lib.get_library_metadata("COMPRESSION") == "lz4hc:9+shuffle"
+    with pytest.raises(ValueError):
+        library._argus_lib.set_library_metadata("COMPRESSION", "brotli")
+    assert library._argus_lib.get_compression() == "lz4hc:9+shuffle"
+    library._argus_lib.set_compression(None)
+    assert library._argus_lib.get_compression() is None
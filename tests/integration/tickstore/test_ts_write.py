@@ -89,3 +89,14 @@ def test_millisecond_roundtrip(tickstore_lib):
     reread = tickstore_lib.read("blah", data_range)
 
     assert reread.index[0].to_pydatetime() == test_time
+
+
+def test_ts_write_with_codec(tickstore_lib):
+    tickstore_lib._argus_lib.set_compression("lz4hc:9+shuffle")
+    tickstore_lib.write("SYM", DUMMY_DATA)
+    assert tickstore_lib._collection.find_one()["cd"] == "lz4hc:9+shuffle"
+    data = tickstore_lib.read("SYM", columns=None)
+    tickstore_lib.write("SYM2", data)
+    tickstore_lib._argus_lib.set_compression(None)
+    assert_frame_equal_(tickstore_lib.read("SYM2", columns=None), data, check_names=False)
+    assert data.c[-1] == 10.0
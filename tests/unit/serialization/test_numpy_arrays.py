@@ -106,3 +106,32 @@ def test_dataframe_writable_after_objify():
     df["one"] = 7
 
     assert np.all(df["one"].values == np.array([7, 7, 7]))
+
+
+def test_objify_many():
+    f = FrameConverter()
+    dfs = [
+        pd.DataFrame(data={"one": ["a", np.NaN], "two": [1.5, 2.5], "three": [1, 2]}),
+        pd.DataFrame(data={"one": ["longer"], "two": [np.NaN], "three": [3]}),
+        pd.DataFrame(data={"one": ["b", "c"], "two": [4.5, 5.5], "three": [4, 5]}),
+    ]
+    docs = [f.docify(dfs[0]), f.docify(dfs[1], "zstd:3+shuffle"), f.docify(dfs[2])]
+    expected = pd.concat(dfs, ignore_index=True)
+
+    assert_frame_equal(f.objify_many(docs), expected)
+    assert_frame_equal(f.objify_many(docs, columns=["three", "one"]), expected[["three", "one"]])
+
+
+def test_objify_many_columns_dont_line_up():
+    f = FrameConverter()
+    docs = [f.docify(pd.DataFrame(data={"one": [1, 2]})), f.docify(pd.DataFrame(data={"one": [1.5]}))]
+    assert f.objify_many(docs) is None
+    docs[1] = f.docify(pd.DataFrame(data={"one": [3], "two": [4]}))
+    assert f.objify_many(docs) is None
+    assert_frame_equal(f.objify_many(docs, columns=["one"]), pd.DataFrame(data={"one": [1, 2, 3]}))
+
+    n = FrametoArraySerializer()
+    assert_frame_equal(
+        n.deserialize([n.serialize(pd.DataFrame(data={"one": [1, 2]})), n.serialize(pd.DataFrame(data={"two": [3]}))]),
+        pd.DataFrame(data={"one": [1, 2, np.NaN], "two": [np.NaN, np.NaN, 3]}),
+    )
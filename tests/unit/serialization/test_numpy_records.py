@@ -150,3 +150,48 @@ def test_can_convert_to_records_mixed_object_column_string_nan(fast_serializable
         # Do not serialize and force-stringify np.NaN among strings, rather pickle
         df = pd.DataFrame({"a": ["abc", np.NaN, "def"], "b": [1.2, 8.0, np.NaN]})
         assert not serializer.can_convert_to_records_without_objects(df, "my_symbol")
+
+
+@pytest.mark.parametrize(
+    "df",
+    [
+        pd.DataFrame({"a": [1.0, 2.0, 3.0], "b": [4.0, 5.0, 6.0]}, index=pd.date_range("2020", periods=3, name="dt")),
+        pd.DataFrame({"a": [1, 2, 3], "b": [4.0, 5.0, 6.0]}, index=pd.date_range("2020", periods=3, name="dt")),
+    ],
+)
+def test_deserialize_dataframe_shares_memory_with_records(df):
+    serializer = anr.DataFrameSerializer()
+    recarr, _ = serializer.serialize(df)
+    result = serializer.deserialize(recarr)
+    pd.testing.assert_frame_equal(result, df, check_freq=False)
+    assert np.shares_memory(result["a"].values, recarr)
+    assert np.shares_memory(result.index.values, recarr)
+
+
+def test_deserialize_dataframe_copies_readonly_records():
+    df = pd.DataFrame({"a": [1.0, 2.0, 3.0]}, index=pd.date_range("2020", periods=3, name="dt"))
+    serializer = anr.DataFrameSerializer()
+    recarr, _ = serializer.serialize(df)
+    recarr.flags.writeable = False
+    result = serializer.deserialize(recarr)
+    pd.testing.assert_frame_equal(result, df, check_freq=False)
+    assert not np.shares_memory(result["a"].values, recarr)
+    assert not np.shares_memory(result.index.values, recarr)
+    result.iloc[0, 0] = 10.0
+
+
+def test_deserialize_dataframe_columns():
+    df = pd.DataFrame({"a": [1, 2, 3], "b": [4.0, 5.0, 6.0], "c": [7, 8, 9]}, index=pd.Index([0, 1, 2], name="ix"))
+    serializer = anr.DataFrameSerializer()
+    recarr, _ = serializer.serialize(df)
+    pd.testing.assert_frame_equal(serializer.deserialize(recarr, columns=["c", "a"]), df[["c", "a"]])
+    pd.testing.assert_frame_equal(serializer.deserialize(recarr[:0], columns=["b"]), df[["b"]][:0])
+
+
+@pytest.mark.parametrize("columns", [["a", "z"], ["a", "a"]])
+def test_deserialize_dataframe_bad_columns(columns):
+    df = pd.DataFrame({"a": [1, 2, 3]}, index=pd.Index([0, 1, 2], name="ix"))
+    serializer = anr.DataFrameSerializer()
+    recarr, _ = serializer.serialize(df)
+    with pytest.raises(anr.ArgusException):
+        serializer.deserialize(recarr, columns=columns)
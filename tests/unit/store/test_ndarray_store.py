@@ -1,7 +1,10 @@
+import hashlib
+
 import numpy as np
 import pytest
-from mock import create_autospec, sentinel, call
+from mock import create_autospec, sentinel, call, patch
 from pymongo.collection import Collection
+from pymongo.errors import BulkWriteError
 from pymongo.results import UpdateResult
 from pytest import raises
 
@@ -190,3 +193,60 @@ def test_concat_and_rewrite_checks_fewer_updated():
         NdarrayStore._concat_and_rewrite(self, collection, version, symbol, item, previous_version)
         assert collection.find.call_args_list[1] == call(expected_verify_find_spec)
     assert str(e.value) == "Symbol: sentinel.symbol:sentinel.version update_many updated 1 segments instead of 2"
+
+
+def test_write_segment_worker_reads_shared_memory():
+    from multiprocessing import shared_memory
+
+    from argus.store._ndarray_store import _write_segment_worker
+    from argus.store._version_store_utils import checksum
+
+    item = np.zeros(1000, dtype=[("a", "i8"), ("b", "f8")])
+    item["a"] = np.arange(1000)
+    item["b"] = np.random.randn(1000)
+    store = NdarrayStore()
+    shm = shared_memory.SharedMemory(create=True, size=item.nbytes)
+    try:
+        shared = np.ndarray(item.shape, dtype=item.dtype, buffer=shm.buf)
+        shared[...] = item
+        del shared
+        result = _write_segment_worker(store, shm.name, item.dtype, item.shape, "sym", None, (100, 200, 199))
+    finally:
+        shm.close()
+        shm.unlink()
+    expected = store._compress_segments([item[100:200]])[0]
+    expected["segment"] = 199
+    doc, leaf = result
+    assert doc.pop("sha") == checksum("sym", expected)
+    assert doc == expected
+    assert leaf == hashlib.sha1(item[100:200].tobytes()).digest()
+
+
+@pytest.mark.parametrize("in_flight", [0, 2])
+def test_segment_writer_batches_by_size(in_flight):
+    from argus.store._ndarray_store import _SegmentWriter
+
+    collection = create_autospec(Collection)
+    with patch("argus.store._ndarray_store.ARGUS_WRITE_BATCH_SIZE", 100), patch(
+        "argus.store._ndarray_store.ARGUS_WRITE_IN_FLIGHT", in_flight
+    ):
+        writer = _SegmentWriter(collection)
+        for i in range(5):
+            writer.add(sentinel.update, 40)
+        writer.add(sentinel.no_data)
+        writer.flush()
+    assert collection.bulk_write.call_args_list == [
+        call([sentinel.update] * 3, ordered=False),
+        call([sentinel.update] * 2 + [sentinel.no_data], ordered=False),
+    ]
+
+
+def test_segment_writer_raises_bulk_write_errors():
+    from argus.store._ndarray_store import _SegmentWriter
+
+    collection = create_autospec(Collection)
+    collection.bulk_write.side_effect = BulkWriteError({})
+    writer = _SegmentWriter(collection)
+    writer.add(sentinel.update)
+    with pytest.raises(BulkWriteError):
+        writer.flush()
@@ -5,6 +5,7 @@ from mock import Mock, sentinel, patch
 from pytest import raises
 
 # Do not remove PandasStore
+from argus.date import DateRange
 from argus.store._pandas_ndarray_store import PandasDataFrameStore, PandasStore
 from tests.util import read_str_as_pandas
 
@@ -30,3 +31,48 @@ def test_read_multi_index_with_no_ts_info():
         ),
     )
     assert store.SERIALIZER._index_from_records(record).equals(df.index)
+
+
+def test_incremental_serializer_only_for_large_frames():
+    df = pd.DataFrame({"s": ["a", "bbb"] * 5000, "x": np.arange(10000)})
+    assert PandasDataFrameStore()._incremental_serializer(df) == (None, None)
+    with patch("argus.store._pandas_ndarray_store.ARGUS_STREAMING_WRITE_MIN_SIZE", df.memory_usage().sum()):
+        serializer, dtype = PandasDataFrameStore()._incremental_serializer(df)
+    records, md = PandasDataFrameStore.SERIALIZER.serialize(df)
+    # The serialized dtype of the object column keeps the metadata needed to read it back
+    assert dtype == md
+    assert dtype.metadata == md.metadata
+    assert np.all(np.concatenate([chunk for chunk, _, _, _ in serializer.generator()]) == records)
+
+
+def test_daterange_sorted_and_unsorted():
+    dts = pd.date_range("2001-01-01", periods=10, freq="D").values
+    records = np.core.records.fromarrays([dts, np.arange(10)], names=["index", "x"])
+    date_range = DateRange("2001-01-03", "2001-01-05")
+    assert list(PandasStore()._daterange(records, date_range)["x"]) == [2, 3, 4]
+    assert list(PandasStore()._daterange(records, DateRange(end="2001-01-02"))["x"]) == [0, 1]
+
+    shuffled = records[[5, 2, 9, 0, 4, 3]]
+    assert list(PandasStore()._daterange(shuffled, date_range)["x"]) == [2, 4, 3]
+    assert list(PandasStore()._daterange(shuffled, DateRange("2001-01-06"))["x"]) == [5, 9]
+
+
+def test_index_range_from_segment_ranges():
+    store = PandasStore()
+    dts = pd.date_range("2001-01-01", periods=9, freq="D").values
+    # The last segment isn't sorted
+    segments = [dts[[0, 1, 2]], dts[[3, 4, 5]], dts[[6, 8, 7]]]
+    bounds = [store._date_bounds(np.core.records.fromarrays([s], names=["index"])) for s in segments]
+    ranges = store._segment_ranges(bounds, None, start=0, new_segments=[2, 5, 8])
+    version = {"segment_ranges": ranges, "segment_count": 3, "up_to": 9}
+
+    assert store._index_range(version, "sym", date_range=DateRange("2001-01-02", "2001-01-02")) == (2, 3)
+    assert store._index_range(version, "sym", date_range=DateRange("2001-01-05", "2001-01-06")) == (5, 6)
+    assert store._index_range(version, "sym", date_range=DateRange("2001-01-05", "2001-01-08")) == (5, 9)
+    assert store._index_range(version, "sym", date_range=DateRange("2001-01-09")) == (8, 9)
+    assert store._index_range(version, "sym", date_range=DateRange("2002-01-01")) == (-1, -1)
+    # Ranges which don't cover all the segments aren't used
+    assert store._index_range(dict(version, segment_count=4), "sym", date_range=DateRange("2002-01-01")) == (
+        None,
+        None,
+    )
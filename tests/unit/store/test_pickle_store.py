@@ -26,6 +26,7 @@ def test_write():
 
 def test_write_object():
     argus_lib = Mock()
+    argus_lib.get_compression.return_value = None
     self = create_autospec(PickleStore)
     version = {"_id": ObjectId()}
     PickleStore.write(self, argus_lib, version, "sentinel.symbol", sentinel.item, sentinel.previous_version)
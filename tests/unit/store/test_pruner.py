@@ -0,0 +1,93 @@
+import threading
+
+from mock import Mock, call
+
+from argus.store._pruner import BackgroundPruner
+
+
+def _version_store(name="lib"):
+    vs = Mock()
+    vs._argus_lib.argus.mongo_host = "host"
+    vs._argus_lib.get_name.return_value = name
+    return vs
+
+
+def _version(symbol, version):
+    return {"_id": f"{symbol}{version}", "symbol": symbol, "version": version}
+
+
+def test_pruner_coalesces_and_batches_symbols():
+    vs = _version_store()
+    started, release = threading.Event(), threading.Event()
+
+    def _prune(symbols, keep_mins, new_versions):
+        started.set()
+        release.wait(10)
+
+    vs._prune_previous_versions_batch.side_effect = _prune
+    pruner = BackgroundPruner(batch_size=2)
+    pruner.submit(vs, "a", 120, _version("a", 2))
+    assert started.wait(10)
+    # Queued while "a" is being pruned
+    for symbol, version in [("b", 2), ("c", 3), ("b", 4), ("d", 2), ("c", 2)]:
+        pruner.submit(vs, symbol, 120, _version(symbol, version))
+    pruner.submit(vs, "d", 10, _version("d", 3))
+    release.set()
+    assert pruner.flush(10)
+
+    assert vs._prune_previous_versions_batch.call_args_list == [
+        call(["a"], keep_mins=120, new_versions={"a": _version("a", 2)}),
+        call(["b", "c"], keep_mins=120, new_versions={"b": _version("b", 4), "c": _version("c", 3)}),
+        call(["d"], keep_mins=10, new_versions={"d": _version("d", 3)}),
+    ]
+
+
+def test_pruner_keeps_going_after_errors():
+    vs, other = _version_store(), _version_store("other")
+    vs._prune_previous_versions_batch.side_effect = ValueError("failed")
+    pruner = BackgroundPruner()
+    pruner.submit(vs, "a", 120, _version("a", 2))
+    pruner.submit(other, "a", 120, _version("a", 2))
+    assert pruner.flush(10)
+    assert other._prune_previous_versions_batch.call_args_list == [
+        call(["a"], keep_mins=120, new_versions={"a": _version("a", 2)})
+    ]
+
+
+def test_pruner_leaves_symbols_being_written():
+    vs = _version_store()
+    pruner = BackgroundPruner()
+    with pruner.writing(vs, ["a"]):
+        pruner.submit(vs, "a", 120, _version("a", 2))
+        pruner.submit(vs, "b", 120, _version("b", 2))
+        assert not pruner.flush(0.5)
+        assert vs._prune_previous_versions_batch.call_args_list == [
+            call(["b"], keep_mins=120, new_versions={"b": _version("b", 2)})
+        ]
+    assert pruner.flush(10)
+    assert vs._prune_previous_versions_batch.call_args_list[1:] == [
+        call(["a"], keep_mins=120, new_versions={"a": _version("a", 2)})
+    ]
+
+
+def test_writes_wait_for_prunes_in_progress():
+    vs = _version_store()
+    started, release = threading.Event(), threading.Event()
+    vs._prune_previous_versions_batch.side_effect = lambda *args, **kwargs: started.set() or release.wait(10)
+    pruner = BackgroundPruner()
+    pruner.submit(vs, "a", 120, _version("a", 2))
+    assert started.wait(10)
+
+    written = threading.Event()
+
+    def _write():
+        with pruner.writing(vs, ["a"]):
+            written.set()
+
+    writer = threading.Thread(target=_write)
+    writer.start()
+    assert not written.wait(0.5)
+    release.set()
+    assert written.wait(10)
+    writer.join()
+    assert pruner.flush(10)
@@ -0,0 +1,49 @@
+import os
+
+from bson import Binary
+
+from argus.store import _segment_cache
+from argus.store._segment_cache import SegmentCache
+
+
+def _sha(i):
+    return Binary(bytes([i]) * 20)
+
+
+def test_put_get(tmpdir):
+    cache = SegmentCache(str(tmpdir), 1024 ** 2)
+    cache.put(_sha(1), {"data": Binary(b"abc"), "compressed": True, "segment": 9, "symbol": "sym", "parent": []})
+    doc = cache.get(_sha(1))
+    assert bytes(doc["data"]) == b"abc"
+    assert doc == {"data": doc["data"], "compressed": True, "segment": 9, "sha": _sha(1)}
+    assert cache.get(_sha(2)) is None
+
+
+def test_get_ignores_corrupt_files(tmpdir):
+    cache = SegmentCache(str(tmpdir), 1024 ** 2)
+    cache.put(_sha(1), {"data": Binary(b"abcdef"), "compressed": False, "segment": 1})
+    path = cache._path(_sha(1))
+    with open(path, "r+b") as f:
+        f.truncate(os.path.getsize(path) - 1)
+    assert cache.get(_sha(1)) is None
+
+
+def test_evicts_least_recently_used(tmpdir):
+    cache = SegmentCache(str(tmpdir), 4000)
+    for i in range(3):
+        cache.put(_sha(i), {"data": Binary(b"x" * 1000), "compressed": False, "segment": i})
+        os.utime(cache._path(_sha(i)), (i, i))
+    cache.get(_sha(0))
+    cache.put(_sha(3), {"data": Binary(b"x" * 1000), "compressed": False, "segment": 3})
+    assert cache.get(_sha(1)) is None
+    assert [cache.get(_sha(i)) is not None for i in (0, 2, 3)] == [True, True, True]
+
+
+def test_set_segment_cache(tmpdir):
+    try:
+        _segment_cache.set_segment_cache(str(tmpdir), 100)
+        assert _segment_cache.get_segment_cache().max_size == 100
+        _segment_cache.set_segment_cache(None)
+        assert _segment_cache.get_segment_cache() is None
+    finally:
+        _segment_cache.set_segment_cache(_segment_cache.ARGUS_SEGMENT_CACHE_DIR)
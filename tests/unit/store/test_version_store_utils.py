@@ -2,9 +2,9 @@ import binascii
 
 import numpy as np
 import pytest
-from mock import sentinel
+from mock import sentinel, patch
 
-from argus.store._version_store_utils import _split_arrs, checksum, version_base_or_id
+from argus.store._version_store_utils import _split_arrs, checksum, version_base_or_id, VersionCache
 
 
 def test_split_arrs_empty():
@@ -40,3 +40,58 @@ def test_version_base_or_id():
         version_base_or_id({"_id": sentinel._id, "base_version_id": sentinel.base_version_id})
         == sentinel.base_version_id
     )
+
+
+def test_version_cache_lru():
+    cache = VersionCache(2, 60)
+    cache.put(("a", None), {"version": 1})
+    cache.put(("b", None), {"version": 1})
+    assert cache.get(("a", None)) == ({"version": 1}, True)
+    cache.put(("c", 3), {"version": 3})
+    assert len(cache) == 2
+    assert cache.get(("b", None)) is None
+    assert cache.get(("a", None)) is not None
+    assert cache.get(("c", 3)) is not None
+
+
+def test_version_cache_hands_out_copies():
+    cache = VersionCache(2, 60)
+    cache.put(("a", None), {"version": 1, "metadata": {"key": "value"}})
+    version, _ = cache.get(("a", None))
+    version.pop("metadata")
+    assert cache.get(("a", None))[0] == {"version": 1, "metadata": {"key": "value"}}
+    cache.get(("a", None))[0]["metadata"]["key"] = "changed"
+    assert cache.get(("a", None))[0] == {"version": 1, "metadata": {"key": "value"}}
+
+
+def test_version_cache_shares_segment_fields():
+    cache = VersionCache(2, 60)
+    shas = [b"sha1", b"sha2"]
+    cache.put(("a", None), {"version": 1, "segment_index": b"index", "shas": shas})
+    version, _ = cache.get(("a", None))
+    assert version["shas"] is shas
+    assert version is not cache.get(("a", None))[0]
+
+
+def test_version_cache_ttl():
+    cache = VersionCache(2, 10)
+    with patch("argus.store._version_store_utils.time.monotonic", return_value=100):
+        cache.put(("a", None), {"version": 1})
+    with patch("argus.store._version_store_utils.time.monotonic", return_value=111):
+        assert cache.get(("a", None)) == ({"version": 1}, False)
+        cache.touch(("a", None))
+    with patch("argus.store._version_store_utils.time.monotonic", return_value=115):
+        assert cache.get(("a", None)) == ({"version": 1}, True)
+
+
+def test_version_cache_invalidate():
+    cache = VersionCache(10, 60)
+    cache.put(("a", None), {"version": 2})
+    cache.put(("a", 1), {"version": 1})
+    cache.put(("b", None), {"version": 1})
+    cache.invalidate("a")
+    assert cache.get(("a", None)) is None
+    assert cache.get(("a", 1)) is None
+    assert cache.get(("b", None)) is not None
+    cache.invalidate()
+    assert len(cache) == 0
@@ -1,6 +1,26 @@
+import threading
+from multiprocessing.pool import ThreadPool
+
+import numpy as np
+import pytest
 from mock import patch, Mock
 
-from argus._compression import compress, compress_array, decompress, decompress_array, enable_parallel_lz4
+from argus import _compression
+from argus._compression import (
+    _CODECS,
+    check_codec,
+    compress,
+    compress_array,
+    decompress,
+    decompress_array,
+    decompress_into,
+    enable_parallel_lz4,
+    register_codec,
+    select_codec,
+    array_samples,
+    read_ahead,
+    zstandard,
+)
 
 
 def test_compress():
@@ -33,6 +53,13 @@ def test_compress_array_LZ4_sequential():
         assert len(cfn.call_args_list) == 49
 
 
+def test_compress_array_typesizes_without_codec_uses_LZ4HC():
+    cfn = Mock()
+    with patch("argus._compression.lz4_compressHC", cfn):
+        compress_array([b"foo", b"bar"], withHC=True, typesize=[8, 4])
+        assert sorted(args for args, _ in cfn.call_args_list) == [(b"bar",), (b"foo",)]
+
+
 def test_decompress():
     assert decompress(compress(b"foo")) == b"foo"
 
@@ -64,3 +91,207 @@ def test_enable_parallel_lz4():
 
 def test_compress_empty_string():
     assert decompress(compress(b"")) == b""
+
+
+def _chunks(parts, out):
+    offset = 0
+    for i, part in enumerate(parts):
+        compressed = i % 2 == 0
+        yield out[offset: offset + len(part)], compress(part) if compressed else part, compressed, None
+        offset += len(part)
+
+
+@pytest.mark.parametrize("parallel", [True, False])
+def test_decompress_into(parallel):
+    parts = [f"foo{i}".encode("ascii") * 7 for i in range(200)]
+    out = np.empty(sum(len(p) for p in parts), dtype=np.uint8)
+    with patch("argus._compression.ENABLE_PARALLEL", parallel):
+        assert decompress_into(_chunks(parts, out), n_chunks=len(parts)) == len(parts)
+    assert out.tobytes() == b"".join(parts)
+
+
+def test_decompress_into_strided_destination():
+    out = np.zeros(4, dtype=[("a", "i8"), ("b", "f8")])
+    column = np.arange(4, dtype="f8")
+    decompress_into([(out["b"], compress(column.tobytes()), True, None)])
+    assert (out["b"] == column).all()
+    assert (out["a"] == 0).all()
+
+
+def test_decompress_into_size_mismatch():
+    out = np.empty(10, dtype=np.uint8)
+    with pytest.raises(ValueError):
+        decompress_into([(out, compress(b"foo"), True, None)])
+
+
+CODECS = ["lz4", "lz4hc", "lz4hc:12", "lz4+shuffle"] + (["zstd", "zstd:19", "zstd:9+shuffle"] if zstandard else [])
+
+
+@pytest.mark.parametrize("codec", CODECS)
+@pytest.mark.parametrize("typesize", [1, 8, 29])
+def test_codec_roundtrip(codec, typesize):
+    data = np.arange(1001, dtype="f8").tobytes() + b"tail"
+    assert decompress(compress(data, codec, typesize), codec, typesize) == data
+    assert decompress_array(compress_array([data, data[:10]], codec=codec, typesize=typesize), codec, typesize) == [
+        data,
+        data[:10],
+    ]
+
+
+def test_codec_lz4_matches_default():
+    assert compress(b"foobar" * 10, "lz4") == compress(b"foobar" * 10)
+    assert decompress(compress(b"foobar" * 10), "lz4") == b"foobar" * 10
+
+
+def test_shuffle_improves_ratio_on_numeric_data():
+    data = np.arange(100000, dtype="i8").tobytes()
+    assert len(compress(data, "lz4+shuffle", 8)) < len(compress(data, "lz4"))
+
+
+@pytest.mark.parametrize("codec", ["brotli", "lz4:x", "lz4+bitshuffle", None, 3])
+def test_check_codec_invalid(codec):
+    with pytest.raises(ValueError):
+        check_codec(codec)
+
+
+def test_register_codec():
+    register_codec("reverse", lambda data, level: data[::-1], lambda data: data[::-1])
+    try:
+        assert check_codec("reverse:1") == "reverse:1"
+        assert compress(b"abc", "reverse") == b"cba"
+        assert decompress(b"cba", "reverse") == b"abc"
+    finally:
+        _CODECS.pop("reverse")
+
+
+def test_decompress_into_codec():
+    out = np.empty(3, dtype=[("a", "i8"), ("b", "f8")])
+    records = np.array([(1, 2.0), (3, 4.0), (5, 6.0)], dtype=out.dtype)
+    decompress_into([(out, compress(records.tobytes(), "lz4hc+shuffle", 16), True, "lz4hc+shuffle")])
+    assert (out == records).all()
+
+
+def _fake_measure(results):
+    return lambda codec, samples: results[codec]
+
+
+@pytest.mark.parametrize(
+    "codec, expected",
+    [
+        ("auto", "lz4hc:9"),  # best ratio at >= 500 MB/s
+        ("auto:0", "lz4hc:9+shuffle"),  # best ratio
+        ("auto:5000", "lz4"),  # nothing is fast enough: the fastest
+    ],
+)
+def test_select_codec(codec, expected):
+    measured = {"lz4": (500, 2000.0), "lz4hc:9": (300, 600.0), "lz4hc:9+shuffle": (200, 50.0)}
+    with patch("argus._compression._adaptive_candidates", return_value=list(measured)), patch(
+        "argus._compression._measure", side_effect=_fake_measure(measured)
+    ):
+        chosen, stats = select_codec(codec, [(b"x" * 1000, 1)])
+    assert chosen == expected
+    assert stats["codec"] == expected
+    assert stats["adaptive"] == codec
+    assert stats["ratio"] == round(1000 / measured[expected][0], 3)
+
+
+def test_select_codec_not_adaptive():
+    samples = Mock()
+    assert select_codec("zstd:3", samples) == ("zstd:3", None)
+    assert select_codec(None, samples) == (None, None)
+    samples.assert_not_called()
+
+
+def test_select_codec_empty_sample():
+    assert select_codec("auto", []) == (None, None)
+
+
+def test_select_codec_caches_by_key():
+    samples = Mock(return_value=array_samples([np.arange(1000)]))
+    first = select_codec("auto", samples, key=("lib", "sym", "test_select_codec_caches_by_key"))
+    second = select_codec("auto", samples, key=("lib", "sym", "test_select_codec_caches_by_key"))
+    assert first == second
+    assert first[0] is not None
+    assert samples.call_count == 1
+
+
+def test_select_codec_roundtrip():
+    data = np.arange(100000, dtype="i8")
+    chosen, stats = select_codec("auto:0", array_samples([data]))
+    assert decompress(compress(data.tobytes(), chosen, 8), chosen, 8) == data.tobytes()
+    assert stats["ratio"] > 1
+
+
+def test_array_samples():
+    records = np.zeros(10 ** 6, dtype=[("a", "i8"), ("b", "f4")])
+    samples = array_samples([records["a"], records["b"], np.array(["x"], dtype=object)])
+    assert [typesize for _, typesize in samples] == [8, 4]
+    assert len(samples[0][0]) // 8 == len(samples[1][0]) // 4 <= 1024 ** 2 // 12
+
+
+@pytest.mark.parametrize("codec", ["auto", "auto:250", "auto:0.5"])
+def test_check_codec_adaptive(codec):
+    assert check_codec(codec) == codec
+
+
+def test_check_codec_adaptive_invalid():
+    with pytest.raises(ValueError):
+        check_codec("auto:fast")
+
+
+def test_parallel_thresholds_are_numbers():
+    from argus._config import LZ4_WORKERS, LZ4_N_PARALLEL, LZ4_MINSZ_PARALLEL
+
+    assert all(isinstance(x, int) for x in (LZ4_WORKERS, LZ4_N_PARALLEL, LZ4_MINSZ_PARALLEL))
+
+
+def test_set_compression_backend():
+    pool_size = _compression.ARGUS_COMPRESSION_PROCESSES
+    try:
+        _compression.set_compression_backend("process", 2)
+        assert _compression.COMPRESSION_BACKEND == "process"
+        assert _compression.ARGUS_COMPRESSION_PROCESSES == 2
+    finally:
+        _compression.set_compression_backend("thread", pool_size)
+    assert _compression.COMPRESSION_BACKEND == "thread"
+
+
+@pytest.mark.parametrize("backend, pool_size", [("fork", None), ("process", 0)])
+def test_set_compression_backend_invalid(backend, pool_size):
+    with pytest.raises(ValueError):
+        _compression.set_compression_backend(backend, pool_size)
+
+
+def test_parallel_map_compresses_in_the_worker():
+    data = [np.arange(100000).tobytes()] * 8
+    with patch("argus._compression.ENABLE_PARALLEL", True):
+        # compress_array would wait for the pool the jobs are running on
+        results = _compression.parallel_map(lambda s: compress_array([s] * 8, withHC=True), data)
+    assert [decompress_array(r) for r in results] == [[s] * 8 for s in data]
+
+
+def test_read_ahead_skips_the_items_left_behind():
+    started, release = threading.Event(), threading.Event()
+    called = []
+
+    def _read(item):
+        called.append(item)
+        if item:
+            started.set()
+            release.wait(10)
+        return item
+
+    pool = ThreadPool(1)
+    results = read_ahead(_read, iter(range(10)), 2, pool)
+    assert next(results) == 0
+    # 1 is being read, 2 is waiting for the pool's thread
+    assert started.wait(10)
+    results.close()
+    release.set()
+    pool.close()
+    pool.join()
+    assert called == [0, 1]
+
+
+def test_read_ahead_without_depth():
+    assert list(read_ahead(lambda x: x * 2, iter(range(3)), 0, None)) == [0, 2, 4]
@@ -26,6 +26,7 @@ from argus.tickstore.tickstore import (
     DATA,
     INDEX,
     IMAGE_TIME,
+    CODEC,
 )
 
 
@@ -220,3 +221,17 @@ def test__read_preference__default_true():
 def test__read_preference__default_false():
     self = create_autospec(TickStore, _allow_secondary=False)
     assert TickStore._read_preference(self, None) == ReadPreference.PRIMARY
+
+
+def test_tickstore_to_bucket_with_codec():
+    symbol = "SYM"
+    data = [
+        {"A": 120, "D": 1.0, "index": 1185076787070},
+        {"A": 122, "B": 2.0, "C": "x", "index": 1185076787076},
+    ]
+    bucket, _ = TickStore._to_bucket(data, symbol, None, "lz4hc:9+shuffle")
+    assert bucket[CODEC] == "lz4hc:9+shuffle"
+    rtn = TickStore.__new__(TickStore)._read_bucket(bucket, {"A", "B", "C", "D"}, {}, False, False, None)
+    assert list(rtn[INDEX]) == [1185076787070, 1185076787076]
+    assert list(rtn["A"]) == [120, 122]
+    assert list(rtn["C"][1:]) == ["x"]